@@ -17,10 +17,12 @@ class UsersTable extends Component {
     componentDidMount(){
         this.getUsers()
     }
-    getUsers() {
+    // /users is keyset paginated, follow next_cursor until every page is in
+    getUsers(cursor = null, users = []) {
         const options = {
             url: `${process.env.REACT_APP_SERVER_SERVICE_URL}/users`,
             method: 'get',
+            params: cursor ? { limit: 100, cursor } : { limit: 100 }, // 100 is the server's PAGINATION_MAX
             headers: {
                 'Content-Type': 'application/json',
                 Authorization: `Bearer ${window.localStorage.token}`
@@ -28,8 +30,12 @@ class UsersTable extends Component {
         }
         return axios(options)
         .then((res) => {
+            const all = users.concat(res.data.data.users);
+            if (res.data.data.next_cursor) {
+                return this.getUsers(res.data.data.next_cursor, all);
+            }
             this.setState({
-                users: res.data.data.users
+                users: all
             })
         })
         .catch((err) => { console.log(err); });
@@ -0,0 +1,82 @@
+# benchmarks/bench_auth.py
+"""
+Token check cost: the old per request HTTP call to the server service versus
+local verification. A stand-in server answers /auth/status and /users/active.
+
+Run from services/questions with APP_SETTINGS set:
+    python -m benchmarks.bench_auth
+"""
+
+
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+import requests
+
+from project import create_app, user_status
+from project.api.utils import verify_token
+
+REQUESTS = 1000
+KEY = 'benchmark-key'
+
+
+class StandInServer(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/users/active':
+            data = {'status': 'success', 'data': {'ranges': [[1, 1], [4, 10]], 'last_id': 10}}
+        else:
+            data = {'status': 'success', 'data': {'id': 1, 'active': True}}
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def remote_check(url, token):
+    """What ensure_authenticated used to do on every request."""
+    response = requests.get(url, headers={'Authorization': 'Bearer {0}'.format(token)})
+    data = json.loads(response.text)
+    return response.status_code == 200 and data['data']['active']
+
+
+def timed(fn):
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        assert fn()
+    elapsed = time.perf_counter() - start
+    return elapsed / REQUESTS * 1e6
+
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server_url = 'http://127.0.0.1:{0}'.format(server.server_port)
+
+    token = jwt.encode({
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1),
+        'iat': datetime.datetime.utcnow(),
+        'sub': 1,
+    }, KEY, algorithm='HS256').decode()
+
+    app = create_app()
+    app.config['JWT_SECRET_KEYS'] = [KEY]
+    user_status.url = server_url + '/users/active'
+    user_status.refresh()
+
+    with app.app_context():
+        remote = timed(lambda: remote_check(server_url + '/auth/status', token))
+        local = timed(lambda: verify_token(token))
+    print('remote /auth/status  {0:8.1f} us/request'.format(remote))
+    print('local verify_token   {0:8.1f} us/request'.format(local))
+    server.shutdown()
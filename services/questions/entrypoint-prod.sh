@@ -0,0 +1,12 @@
+#!/bin/sh
+
+echo "Waiting for postgres..."
+
+while ! nc -z questions-db 5432; do
+  sleep 0.1
+done
+
+echo "PostgreSQL started"
+
+# gunicorn reads WEB_CONCURRENCY for the worker count
+gunicorn -b 0.0.0.0:5000 --threads ${GUNICORN_THREADS:-1} wsgi:app
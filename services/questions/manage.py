@@ -4,24 +4,26 @@
 import sys
 import unittest
 
-import coverage
 from flask.cli import FlaskGroup
 
 from project import create_app, db
 from project.api.models import Question
 
 
-COV = coverage.coverage(
-    branch=True,
-    include='project/*',
-    omit=[
-        'project/tests/*',
-        'project/config.py',
-    ]
-)
-COV.start()
+# only trace coverage for the cov command, gunicorn serves wsgi.py instead
+COV = None
+if sys.argv[1:2] == ['cov']:
+    import coverage
+    COV = coverage.coverage(
+        branch=True,
+        include='project/*',
+        omit=[
+            'project/tests/*',
+            'project/config.py',
+        ]
+    )
+    COV.start()
 
-app = create_app()
 cli = FlaskGroup(create_app=create_app)
 
 
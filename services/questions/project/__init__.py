@@ -5,15 +5,16 @@ import os
 
 from flask import Flask
 from flask_cors import CORS
-from flask_debugtoolbar import DebugToolbarExtension
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
+from project.api.user_status import UserStatusCache
+
 # instantiate the extensions
 db = SQLAlchemy()
 migrate = Migrate()
-toolbar = DebugToolbarExtension()
 cors = CORS()
+user_status = UserStatusCache()
 
 
 def create_app(script_info=None):
@@ -26,10 +27,14 @@ def create_app(script_info=None):
     app.config.from_object(app_settings)
 
     # set up extensions
-    toolbar.init_app(app)
+    if app.config.get('DEBUG_TB_ENABLED'):
+        # only load the toolbar when enabled, production workers never import it
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
     cors.init_app(app)
     db.init_app(app)
     migrate.init_app(app)
+    user_status.init_app(app)
 
     # register blueprints
     from project.api.base import base_blueprint
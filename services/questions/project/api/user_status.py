@@ -0,0 +1,105 @@
+# project/api/user_status.py
+
+
+import bisect
+import threading
+import time
+
+import requests
+
+
+class UserStatusCache:
+    """
+    Ids of the users whose tokens are still good, polled from the server service
+    in a background thread so token checks never wait on the network.
+
+    The server answers with runs of active ids and the last id it has handed
+    out, so deactivated and deleted users both fall outside the runs. Ids above
+    that last id belong to users created since the poll and are let through.
+
+    A snapshot is only trusted for USER_STATUS_MAX_STALE_SECONDS after the last
+    successful poll, or after startup. Past that every token is checked with
+    the server's /login/me again, and rejected if the server can't answer.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.last_id = None  # nothing polled yet, every id is let through
+        self.refreshed_at = None
+        self.url = None
+        self.status_url = None
+        self.interval = 30
+        self.max_stale = 120
+        self.started_at = None
+        self._session = requests.Session()  # keep-alive between polls
+        self._thread = None
+
+    def init_app(self, app):
+        server_url = app.config.get('SERVER_SERVICE_URL')
+        self.interval = app.config.get('USER_STATUS_REFRESH_SECONDS', self.interval)
+        self.max_stale = app.config.get('USER_STATUS_MAX_STALE_SECONDS', self.max_stale)
+        self._session.headers['Authorization'] = 'Bearer {0}'.format(app.config.get('SERVICE_TOKEN'))
+        if not server_url or app.config['TESTING']:
+            return
+        self.url = '{0}/users/active'.format(server_url)
+        self.status_url = '{0}/login/me'.format(server_url)
+        self.started_at = time.time()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+
+    def set_ranges(self, ranges, last_id):
+        """Swap in a new snapshot of [first, last] active id runs, sorted by first."""
+        starts = [first for first, _ in ranges]
+        ends = [last for _, last in ranges]
+        self.starts, self.ends, self.last_id = starts, ends, last_id
+
+    def is_revoked(self, user_id):
+        starts, ends, last_id = self.starts, self.ends, self.last_id
+        if last_id is None or user_id > last_id:
+            return False
+        i = bisect.bisect_right(starts, user_id) - 1
+        return i < 0 or user_id > ends[i]
+
+    def is_stale(self):
+        """Whether polling has failed for longer than the snapshot may be trusted."""
+        if self.url is None:
+            return False  # not polling, nothing to go stale
+        since = self.refreshed_at or self.started_at
+        return time.time() - since > self.max_stale
+
+    def check_remote(self, token):
+        """The server's /login/me answer for token, False unless it is an active user."""
+        try:
+            response = self._session.get(
+                self.status_url,
+                headers={'Authorization': 'Bearer {0}'.format(token)},
+                timeout=self.interval
+            )
+            data = response.json()
+            if response.status_code == 200 and \
+               data['status'] == 'success' and \
+               data['data']['active']:
+                return data
+        except (requests.RequestException, ValueError, KeyError, TypeError):
+            pass
+        return False
+
+    def refresh(self):
+        """Swap in the latest active ids, keep the old ones if the server is unreachable."""
+        try:
+            response = self._session.get(self.url, timeout=self.interval)
+            data = response.json()
+            if response.status_code == 200 and data['status'] == 'success':
+                self.set_ranges(data['data']['ranges'], data['data']['last_id'])
+                self.refreshed_at = time.time()
+                return True
+        except (requests.RequestException, ValueError, KeyError):
+            pass
+        return False
+
+    def _poll(self):
+        while True:
+            self.refresh()
+            time.sleep(self.interval)
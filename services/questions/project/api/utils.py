@@ -1,12 +1,13 @@
 # project/api/utils.py
 
 
-import json
 from functools import wraps
 
-import requests
+import jwt
 from flask import request, jsonify, current_app
 
+from project import user_status
+
 
 def authenticate(f):
     @wraps(f)
@@ -55,14 +56,32 @@ def authenticate_restful(f):
 def ensure_authenticated(token):
     if current_app.config['TESTING']:
         return True
-    url = '{0}/auth/status'.format(current_app.config['SERVER_SERVICE_URL'])
-    bearer = 'Bearer {0}'.format(token)
-    headers = {'Authorization': bearer}
-    response = requests.get(url, headers=headers)
-    data = json.loads(response.text)
-    if response.status_code == 200 and \
-       data['status'] == 'success' and \
-       data['data']['active']:
-        return data
-    else:
-        return False
+    return verify_token(token)
+
+
+def verify_token(token):
+    """Verify a server issued JWT locally instead of calling the server service.
+
+    Every key in JWT_SECRET_KEYS is accepted so the signing key can be rotated
+    without downtime. While the polled user status is stale the server decides.
+    """
+    for key in current_app.config['JWT_SECRET_KEYS']:
+        try:
+            payload = jwt.decode(token, key, algorithms=['HS256'])
+        except jwt.InvalidSignatureError:
+            continue
+        except jwt.InvalidTokenError:
+            return False
+        sub = payload.get('sub')
+        if sub is None:
+            return False
+        if user_status.is_stale():
+            # polling has been failing, the snapshot may miss revocations
+            return user_status.check_remote(token)
+        if user_status.is_revoked(sub):
+            return False
+        return {
+            'status': 'success',
+            'data': {'id': sub, 'active': True}
+        }
+    return False
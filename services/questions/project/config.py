@@ -11,6 +11,16 @@ class BaseConfig:
     DEBUG_TB_ENABLED = False
     DEBUG_TB_INTERCEPT_REDIRECTS = False
     SECRET_KEY = os.environ.get('SECRET_KEY')
+    # tokens are verified locally, list the old key here while rotating
+    JWT_SECRET_KEYS = [
+        key for key in os.environ.get('JWT_SECRET_KEYS', '').split(',') if key
+    ] or [SECRET_KEY]
+    SERVER_SERVICE_URL = os.environ.get('SERVER_SERVICE_URL')
+    # shared with the server service, sent when polling /users/active
+    SERVICE_TOKEN = os.environ.get('SERVICE_TOKEN')
+    USER_STATUS_REFRESH_SECONDS = 30
+    # without a successful poll for this long tokens are checked with the server again
+    USER_STATUS_MAX_STALE_SECONDS = 120
 
 
 class DevelopmentConfig(BaseConfig):
@@ -0,0 +1,112 @@
+# project/tests/test_utils.py
+
+
+import datetime
+import time
+import unittest
+from unittest import mock
+
+import jwt
+import requests
+from flask import current_app
+from flask_testing import TestCase
+
+from project import create_app, user_status
+from project.api.utils import verify_token
+
+app = create_app()
+
+
+def make_token(key, sub=1, seconds=60):
+    payload = {
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=seconds),
+        'iat': datetime.datetime.utcnow(),
+        'sub': sub,
+    }
+    return jwt.encode(payload, key, algorithm='HS256').decode()
+
+
+class TestVerifyToken(TestCase):
+    def create_app(self):
+        app.config.from_object('project.config.TestingConfig')
+        app.config['JWT_SECRET_KEYS'] = ['current', 'previous']
+        return app
+
+    def tearDown(self):
+        user_status.set_ranges([], None)
+        user_status.url = user_status.status_url = user_status.refreshed_at = None
+
+    def test_valid_token(self):
+        """Ensure a token signed with the shared key is accepted locally."""
+        data = verify_token(make_token('current', sub=7))
+        self.assertEqual(data['data']['id'], 7)
+        self.assertTrue(data['data']['active'])
+
+    def test_rotated_key(self):
+        """Ensure tokens signed with the previous key still verify."""
+        self.assertTrue(verify_token(make_token('previous')))
+
+    def test_unknown_key(self):
+        self.assertFalse(verify_token(make_token('unknown')))
+
+    def test_expired_token(self):
+        self.assertFalse(verify_token(make_token('current', seconds=-1)))
+
+    def test_garbage_token(self):
+        self.assertFalse(verify_token('test'))
+
+    def test_revoked_user(self):
+        """Ensure users outside the polled active runs are rejected."""
+        user_status.set_ranges([[1, 6], [8, 8], [10, 12]], 14)
+        for sub in (7, 9, 13, 14):  # deactivated or deleted
+            self.assertFalse(verify_token(make_token('current', sub=sub)), sub)
+        for sub in (1, 6, 8, 11, 15):  # active, or created since the poll
+            self.assertTrue(verify_token(make_token('current', sub=sub)), sub)
+
+    def test_nothing_polled_yet(self):
+        """Ensure tokens are not rejected before the first poll."""
+        self.assertTrue(verify_token(make_token('current', sub=7)))
+
+    def stale(self):
+        user_status.url = 'http://server/users/active'
+        user_status.status_url = 'http://server/login/me'
+        user_status.set_ranges([[1, 12]], 14)
+        user_status.refreshed_at = time.time() - user_status.max_stale - 1
+
+    def test_stale_status_asks_the_server(self):
+        """Ensure a snapshot older than the max staleness isn't trusted."""
+        self.stale()
+        token = make_token('current', sub=7)
+        answer = {'status': 'success', 'data': {'id': 7, 'active': False}}
+        response = mock.Mock(status_code=200, json=mock.Mock(return_value=answer))
+        with mock.patch.object(user_status._session, 'get', return_value=response) as get:
+            self.assertFalse(verify_token(token))
+            answer['data']['active'] = True
+            self.assertEqual(verify_token(token), answer)
+        get.assert_called_with(
+            'http://server/login/me',
+            headers={'Authorization': 'Bearer ' + token},
+            timeout=user_status.interval
+        )
+
+    def test_stale_status_and_server_down(self):
+        """Ensure tokens are rejected when the server can't be asked."""
+        self.stale()
+        error = requests.ConnectionError()
+        with mock.patch.object(user_status._session, 'get', side_effect=error):
+            self.assertFalse(verify_token(make_token('current', sub=7)))
+
+    def test_fresh_status_stays_local(self):
+        self.stale()
+        user_status.refreshed_at = time.time()
+        with mock.patch.object(user_status._session, 'get') as get:
+            self.assertTrue(verify_token(make_token('current', sub=7)))
+        get.assert_not_called()
+
+    def test_no_polling_while_testing(self):
+        self.assertTrue(current_app.config['TESTING'])
+        self.assertIsNone(user_status.url)
+
+
+if __name__ == '__main__':
+    unittest.main()
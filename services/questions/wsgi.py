@@ -0,0 +1,7 @@
+# wsgi.py
+
+
+from project import create_app
+
+# production entry point, never imports coverage, the cli or the debug toolbar
+app = create_app()
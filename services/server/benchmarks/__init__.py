@@ -0,0 +1 @@
+# services/server/benchmarks/__init__.py
@@ -0,0 +1,57 @@
+# services/server/benchmarks/bench_bulk.py
+"""
+Load questions one POST /questions per row against one streamed POST /questions/bulk.
+Writes to the configured database, point DATABASE_URL at a scratch database.
+
+Run from services/server with APP_SETTINGS, SECRET_KEY and DATABASE_URL set:
+    python -m benchmarks.bench_bulk
+"""
+import json
+import time
+
+from project import create_app, db
+from project.api.models import User
+
+SINGLE_ROWS = 1000
+BULK_ROWS = 50000
+
+
+def question(i):
+    return {'body': f'benchmark question {i}', 'test_code': 'assert True', 'test_solution': 'pass', 'difficulty': 'Easy'}
+
+
+def admin_token():
+    user = User.query.filter_by(email='bench@bulk.io').first()
+    if not user:
+        user = User('bench_bulk', 'bench@bulk.io', 'benchpass', admin=True)
+        db.session.add(user)
+        db.session.commit()
+    return user.encode_jwt(user.id).decode()
+
+
+def ndjson_body(rows):
+    return ''.join(json.dumps(question(i)) + '\n' for i in range(rows)).encode()
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        headers = {'Authorization': f'Bearer {admin_token()}'}
+    client = app.test_client()
+
+    start = time.perf_counter()
+    for i in range(SINGLE_ROWS):
+        client.post('/questions', data=json.dumps(question(i)), content_type='application/json', headers=headers)
+    single = SINGLE_ROWS / (time.perf_counter() - start)
+    print(f'POST /questions      {single:10.0f} rows/s')
+
+    start = time.perf_counter()
+    response = client.post(
+        '/questions/bulk',
+        data=ndjson_body(BULK_ROWS),
+        content_type='application/x-ndjson',
+        headers=headers
+    )
+    elapsed = time.perf_counter() - start
+    report = json.loads(response.data.decode())['data']
+    print(f'POST /questions/bulk {BULK_ROWS / elapsed:10.0f} rows/s  (server reported {report["rows_per_second"]}, {report["inserted"]} inserted)')
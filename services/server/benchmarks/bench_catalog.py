@@ -0,0 +1,71 @@
+# services/server/benchmarks/bench_catalog.py
+"""
+Per request cost of the question list and count paths answered by postgres against the same
+requests answered from the in memory question catalog, random picks with the row read from
+postgres against the catalog's held text, plus what the catalog itself costs:
+the full load, its column memory and an incremental refresh after a batch of edits.
+
+Run from services/server with APP_SETTINGS, SECRET_KEY and DATABASE_URL set, against a migrated
+database that already holds questions (see manage.py add_test_data):
+    python -m benchmarks.bench_catalog
+"""
+import time
+
+from sqlalchemy import text
+
+from project import create_app, db, question_catalog
+from project.api.questions import question_page, question_filters, catalog_page, pick_question
+
+ROUNDS = 200
+EDITS = 100
+
+
+def measure(app, url, fn):
+    """ microseconds per call of fn inside a request for url """
+    with app.test_request_context(url):
+        fn() # warm up, the catalog holds the text from here on
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            fn()
+        elapsed = time.perf_counter() - start
+    return elapsed / ROUNDS * 1e6
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        question_catalog.refresh()
+        stats = question_catalog.stats()
+        print(f'full load        {time.perf_counter() - start:8.2f} s  {stats["size"]} questions, '
+              f'{stats["column_bytes"] / 2**20:.1f} MiB columns, {stats["index_bytes"] / 2**20:.1f} MiB id indexes, '
+              f'{stats["authors"]} authors')
+        author_id = db.session.execute(text('SELECT author_id FROM questions ORDER BY id LIMIT 1')).scalar()
+
+        urls = [
+            '/questions?fields=id,author_id,difficulty&limit=100',
+            '/questions?difficulty=Hard&limit=20&count=true',
+            f'/questions?author_id={author_id}&fields=id,preview&count=true',
+        ]
+        for url in urls:
+            app.config['QUESTION_CATALOG'] = False
+            postgres = measure(app, url, lambda: question_page(question_filters(), 'num_question'))
+            app.config['QUESTION_CATALOG'] = True
+            catalog = measure(app, url, lambda: catalog_page('num_question'))
+            print(f'{url:60} postgres {postgres:9.1f} us  catalog {catalog:7.1f} us')
+        for difficulty in (None, 'Hard'):
+            app.config['QUESTION_CATALOG'] = False
+            row_read = measure(app, '/questions/random', lambda: pick_question(difficulty, author_id, None))
+            app.config['QUESTION_CATALOG'] = True
+            catalog = measure(app, '/questions/random', lambda: pick_question(difficulty, author_id, None))
+            print(f'{"random " + str(difficulty):60} row read {row_read:9.1f} us  catalog {catalog:7.1f} us')
+
+        ids = [row[0] for row in db.session.execute(text('SELECT id FROM questions ORDER BY random() LIMIT :n'), {'n': EDITS})]
+        db.session.execute(text('UPDATE questions SET difficulty = difficulty WHERE id = ANY(:ids)'), {'ids': ids})
+        db.session.commit()
+        question_catalog.interval = 0
+        start = time.perf_counter()
+        question_catalog.refresh()
+        print(f'refresh after {EDITS} edits {(time.perf_counter() - start) * 1000:8.1f} ms, '
+              f'{question_catalog.stats()["full_loads"]} full load')
+        db.session.remove()
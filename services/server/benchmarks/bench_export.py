@@ -0,0 +1,54 @@
+# services/server/benchmarks/bench_export.py
+"""
+Peak python memory of dumping every question with Question.query.all() against
+streaming GET /export/questions.
+
+Run from services/server with APP_SETTINGS, SECRET_KEY and DATABASE_URL set, against
+a database that already holds questions (see manage.py):
+    python -m benchmarks.bench_export
+"""
+import json
+import time
+import tracemalloc
+
+from project import create_app, db
+from project.api.models import User, Question
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        admin = User.query.filter_by(admin=True).first()
+        if not admin:
+            raise SystemExit('needs an admin user in the database')
+        token = admin.encode_jwt(admin.id).decode()
+        count = Question.query.count()
+
+        def load_all():
+            return len(json.dumps([question.to_json() for question in Question.query.all()]))
+        elapsed, peak, size = measure(load_all)
+        db.session.remove()
+        print(f'query.all()        {count} rows {elapsed:6.2f} s  peak {peak / 1e6:7.1f} MB  body {size / 1e6:.1f} MB')
+
+    client = app.test_client()
+    def stream():
+        response = client.get(
+            '/export/questions',
+            headers={'Authorization': f'Bearer {token}', 'Accept-Encoding': 'gzip'},
+            buffered=False
+        )
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return size
+    elapsed, peak, size = measure(stream)
+    print(f'/export/questions  {count} rows {elapsed:6.2f} s  peak {peak / 1e6:7.1f} MB  body {size / 1e6:.1f} MB gzip')
@@ -0,0 +1,42 @@
+# services/server/benchmarks/bench_fragments.py
+"""
+Per request cost of a question list page whose rows are selected and encoded every time against
+the same page pasted together from question_json_cache, for a few page sizes and ?fields=.
+
+Run from services/server with APP_SETTINGS, SECRET_KEY and DATABASE_URL set, against a migrated
+database that already holds questions (see manage.py add_test_data):
+    python -m benchmarks.bench_fragments
+"""
+import time
+
+from project import create_app, question_json_cache
+from project.api.questions import question_page, question_filters
+from project.api.serializers import fragments_response
+
+ROUNDS = 200
+
+
+def measure(app, url):
+    """ microseconds per list response for url """
+    with app.test_request_context(url):
+        page = lambda: fragments_response(question_page(question_filters(), 'num_question'), 'questions')
+        page() # warm up, fills the cache when it is on
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            page()
+        elapsed = time.perf_counter() - start
+    return elapsed / ROUNDS * 1e6
+
+
+if __name__ == '__main__':
+    app = create_app()
+    max_bytes = question_json_cache.max_bytes
+    with app.app_context():
+        for url in ('/questions?limit=20', '/questions?limit=100', '/questions?limit=100&fields=id,preview'):
+            question_json_cache.max_bytes = 0
+            encoded = measure(app, url)
+            question_json_cache.max_bytes = max_bytes
+            cached = measure(app, url)
+            print(f'{url:45} encoded {encoded:9.1f} us  cached {cached:9.1f} us')
+        stats = question_json_cache.stats()
+        print(f'cache {stats["size"]} fragments, {stats["bytes"] / 2**10:.0f} KiB')
@@ -0,0 +1,58 @@
+# services/server/benchmarks/bench_hashing.py
+"""
+Login/register style bcrypt load with and without the hashing pool.
+THREADS callers each fire REQUESTS hashes back to back, like a gunicorn worker
+with every one of its GUNICORN_THREADS logging someone in.
+
+Run from services/server:
+    python -m benchmarks.bench_hashing
+"""
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from project.api.hashing import HashingPool, HashingPoolFull
+
+ROUNDS = 12
+THREADS = int(os.getenv('GUNICORN_THREADS', 4))
+REQUESTS = 4
+
+
+def run(pool):
+    latencies, rejected = [], []
+    def client():
+        for _ in range(REQUESTS):
+            start = time.perf_counter()
+            try:
+                pool.hash_password('benchmark')
+                latencies.append(time.perf_counter() - start)
+            except HashingPoolFull:
+                rejected.append(time.perf_counter() - start)
+    threads = [threading.Thread(target=client) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    return len(latencies) / elapsed, p99, len(rejected)
+
+
+def make_pool(size, queue_depth):
+    pool = HashingPool()
+    config = {'GUNICORN_THREADS': THREADS, 'BCRYPT_POOL_SIZE': size, 'BCRYPT_POOL_QUEUE': queue_depth, 'BCRYPT_LOG_ROUNDS': ROUNDS}
+    pool.init_app(SimpleNamespace(config=config))
+    return pool
+
+
+if __name__ == '__main__':
+    # the config.py defaults, one thread always left for requests that don't hash
+    size = min(2, THREADS - 1)
+    queue_depth = max(0, THREADS - 1 - size)
+    for name, pool in (('inline', make_pool(0, 0)), (f'pool size={size} queue={queue_depth}', make_pool(size, queue_depth))):
+        throughput, p99, rejected = run(pool)
+        print(f'{name:24} {throughput:6.1f} hashes/sec   p99 {p99 * 1000:7.1f} ms   503s {rejected}')
+        pool.shutdown()
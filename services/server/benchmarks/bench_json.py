@@ -0,0 +1,50 @@
+# services/server/benchmarks/bench_json.py
+"""
+Encode a 10k question list response with each JSON_BACKEND.
+
+Run from services/server with APP_SETTINGS set:
+    python -m benchmarks.bench_json
+"""
+import random
+import string
+import time
+
+from project import create_app
+from project.api.serializers import output_json
+
+QUESTIONS = 10000
+RUNS = 5
+
+
+def fake_question(i):
+    text = lambda size: ''.join(random.choice(string.ascii_letters + ' ') for _ in range(size))
+    return {
+        'id': i,
+        'author_id': random.randint(1, 1000),
+        'body': text(400),
+        'test_code': text(300),
+        'test_solution': text(50),
+        'difficulty': random.choice(['Easy', 'Moderate', 'Hard'])
+    }
+
+
+def encode_time(app, backend, response):
+    app.config['JSON_BACKEND'] = backend
+    best = float('inf')
+    with app.app_context():
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            body = output_json(response, 200).get_data()
+            best = min(best, time.perf_counter() - start)
+    return best, len(body)
+
+
+if __name__ == '__main__':
+    app = create_app()
+    response = {
+        'status': 'success',
+        'data': {'questions': [fake_question(i) for i in range(QUESTIONS)], 'next_cursor': None}
+    }
+    for backend in ('json', 'orjson'):
+        elapsed, size = encode_time(app, backend, response)
+        print(f'{backend:8} {elapsed * 1000:8.1f} ms   {size / 1e6:.1f} MB')
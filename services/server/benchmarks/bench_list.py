@@ -0,0 +1,56 @@
+# services/server/benchmarks/bench_list.py
+"""
+CPU time and peak python memory per 10k rows of building a list response: hydrating
+Question/User objects and calling to_json() against the Core rows -> dicts path the
+list endpoints use. Both end with the json encoding so the totals are comparable.
+
+Run from services/server with APP_SETTINGS, SECRET_KEY and DATABASE_URL set, against
+a database that already holds at least 10k users and questions (see manage.py):
+    python -m benchmarks.bench_list
+"""
+import time
+import tracemalloc
+
+from project import create_app, db
+from project.api.fields import json_columns
+from project.api.models import User, Question
+from project.api.serializers import dumps
+
+ROWS = 10000
+ROUNDS = 5
+
+
+def measure(fn):
+    """ (cpu seconds, peak bytes) of fn, best of ROUNDS """
+    cpu, peak = [], []
+    for _ in range(ROUNDS):
+        db.session.expunge_all()
+        tracemalloc.start()
+        start = time.process_time()
+        fn()
+        cpu.append(time.process_time() - start)
+        peak.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(cpu), min(peak)
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        for model in (Question, User):
+            table = model.__table__
+
+            def orm():
+                return dumps([row.to_json() for row in model.query.order_by(model.id).limit(ROWS).all()])
+            def core():
+                columns = json_columns(model, None)
+                statement = db.select(columns).order_by(table.c.id).limit(ROWS)
+                names = [column.key for column in columns]
+                return dumps([dict(zip(names, row)) for row in db.session.execute(statement).fetchall()])
+
+            if len(orm()) != len(core()):
+                raise SystemExit(f'{table.name}: the two paths disagree')
+            for name, fn in (('ORM + to_json', orm), ('Core rows', core)):
+                cpu, peak = measure(fn)
+                print(f'{table.name:10} {name:14} {cpu * 1000:8.1f} ms cpu {peak / 2**20:8.1f} MiB peak per {ROWS} rows')
+        db.session.remove()
@@ -0,0 +1,51 @@
+# services/server/benchmarks/bench_lookups.py
+"""
+Cost of the per request user lookup: the ORM query as it was written in the auth
+decorators, the same query baked, and the baked query run as a prepared statement.
+Also times building and compiling the ORM query alone, with no round trip.
+
+Run from services/server with APP_SETTINGS, SECRET_KEY and DATABASE_URL set, against
+a database that already holds users (see manage.py):
+    python -m benchmarks.bench_lookups
+"""
+import time
+
+from project import create_app, db
+from project.api.lookups import user_by_id
+from project.api.models import User
+
+ROUNDS = 5000
+
+
+def measure(fn, ids):
+    start = time.perf_counter()
+    for user_id in ids:
+        fn(user_id)
+        db.session.expunge_all() # a fresh request has an empty identity map
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        ids = [row[0] for row in db.session.query(User.id).order_by(User.id).limit(ROUNDS)]
+        if not ids:
+            raise SystemExit('needs users in the database')
+        ids = (ids * (ROUNDS // len(ids) + 1))[:ROUNDS]
+        dialect = db.engine.dialect
+
+        def compile_orm(user_id):
+            User.query.filter_by(id=user_id).limit(1).statement.compile(dialect=dialect)
+
+        def orm(user_id):
+            return User.query.filter_by(id=user_id).first()
+        def baked(user_id):
+            return user_by_id.query(db.session()).params(id=user_id).one_or_none()
+        def prepared(user_id):
+            return user_by_id.get(id=user_id)
+
+        for name, fn in (('compile ORM query only', compile_orm), ('ORM filter_by().first()', orm),
+                         ('baked', baked), ('baked + prepared', prepared)):
+            measure(fn, ids[:200]) # warm up the pool, bakery and prepared statements
+            print(f'{name:26} {measure(fn, ids):8.1f} us/lookup')
+        db.session.remove()
@@ -0,0 +1,62 @@
+# services/server/benchmarks/bench_wsgi.py
+"""
+Compare the old gunicorn entry point (manage:app, coverage tracing every line)
+with wsgi:app.
+
+Run from services/server with APP_SETTINGS, SECRET_KEY and DATABASE_URL set:
+    python -m benchmarks.bench_wsgi
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+RUNS = 5
+REQUESTS = 2000
+
+# what importing manage.py used to do before the app was created
+OLD_ENTRY = '''
+import coverage
+cov = coverage.coverage(branch=True, include='project/*', omit=['project/tests/*', 'project/config.py'])
+cov.start()
+import flask_debugtoolbar
+from flask.cli import FlaskGroup
+import wsgi
+'''
+
+NEW_ENTRY = 'import wsgi'
+
+
+def startup_time(code):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def requests_per_second(traced):
+    from project import create_app
+    app = create_app()
+    client = app.test_client()
+    cov = None
+    if traced:
+        import coverage
+        cov = coverage.coverage(branch=True, include='project/*')
+        cov.start()
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        client.get('/users/ping')
+    elapsed = time.perf_counter() - start
+    if cov:
+        cov.stop()
+        cov.erase()
+    return REQUESTS / elapsed
+
+
+if __name__ == '__main__':
+    old, new = startup_time(OLD_ENTRY), startup_time(NEW_ENTRY)
+    print(f'startup     manage:app {old * 1000:8.1f} ms   wsgi:app {new * 1000:8.1f} ms')
+    old, new = requests_per_second(True), requests_per_second(False)
+    print(f'req/sec     manage:app {old:8.1f}      wsgi:app {new:8.1f}')
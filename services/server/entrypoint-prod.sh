@@ -8,4 +8,5 @@ done
 
 echo "PostgreSQL started"
 
-gunicorn -b 0.0.0.0:5000 manage:app
\ No newline at end of file
+# gunicorn reads WEB_CONCURRENCY for the worker count, config.py sizes the db pool from the same variables
+gunicorn -b 0.0.0.0:5000 --threads ${GUNICORN_THREADS:-1} wsgi:app
\ No newline at end of file
@@ -1,27 +1,30 @@
 # services/server/manage.py
+import os
 import sys
+import time
 import unittest
-import coverage
-import random
-import string
+import click
+from flask import current_app
 from flask.cli import FlaskGroup
-from project import create_app, db
-from project.api.models import User, Question
+from sqlalchemy import text
+from project import create_app, db, bcrypt, synthetic
+from project.api.models import User
+
+# code coverage is only traced when running the cov command, production
+# workers are served from wsgi.py and never import coverage
+COV = None
+if sys.argv[1:2] == ['cov']:
+    import coverage
+    COV = coverage.coverage(
+        branch=True,
+        include='project/*',
+        omit=[
+            'project/tests/*',
+            'project/config.py'
+        ]
+    )
+    COV.start()
 
-# instantiate code coverage tests
-COV = coverage.coverage(
-    branch=True,
-    include='project/*',
-    omit=[
-        'project/tests/*',
-        'project/config.py'
-    ]
-)
-
-COV.start()
-
-# instantiate app using Application Factory
-app = create_app()
 #Extends normal cli with commands related to Flask
 cli = FlaskGroup(create_app=create_app)
 
@@ -58,58 +61,63 @@ def test():
     sys.exit(result)
 
 @cli.command('add_test_data')
-def add_users():
-    users_num = 100
-    questions_num = 500
-    body_length = 25
-    test_code_length = 25
-    test_solution_length = 20
-    difficulty_levels = ['Easy', 'Moderate', 'Hard']
+@click.option('--users', default=100, show_default=True, help='Users to generate.')
+@click.option('--questions', default=500, show_default=True, help='Questions to generate.')
+@click.option('--seed', default=0, show_default=True, help='Same seed, same data.')
+@click.option('--workers', default=os.cpu_count(), show_default=True, help='Generation processes.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per COPY and commit.')
+@click.option('--zipf', default=1.1, show_default=True, help='Zipf exponent of questions per author.')
+@click.option('--difficulty-mix', default='Easy=5,Moderate=3,Hard=2', show_default=True, help='Relative weights.')
+@click.option('--password', default='password', show_default=True, help='Password of every generated user.')
+def add_test_data(users, questions, seed, workers, batch_size, zipf, difficulty_mix, password):
+    """ Add an admin and synthetic users/questions, millions are fine """
+    try:
+        mix = synthetic.parse_mix(difficulty_mix)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--difficulty-mix')
+    if zipf <= 0:
+        raise click.BadParameter('must be positive', param_hint='--zipf')
 
     """ Add an admin user first """
-    db.session.add(User(username='admin', email='admin@admin.com', password='admin', active=True, admin=True))
-    db.session.commit()
-    
-    users_objects = []
-    addr = '@example.com'
-    for _ in range(0,users_num):
-        username = generate_string()
-        password = generate_string()
-        email = generate_string()
-        email += addr
-        users_objects.append(User(username=username, email=email, password=password))
-
-    db.session.bulk_save_objects(users_objects)
-    db.session.commit()
-
-    questions_objects = []
-    for _ in range(0, questions_num):
-        author_id = generate_id(users_num)
-        body = generate_string(body_length)
-        test_code = generate_string(test_code_length)
-        test_solution = generate_string(test_solution_length)
-        difficulty = random.choice(difficulty_levels)
-        questions_objects.append(
-            Question(
-                author_id=author_id,
-                body=body,
-                test_code=test_code,
-                test_solution=test_solution,
-                difficulty=difficulty
-            )
+    if not User.query.filter_by(email='admin@admin.com').first():
+        db.session.add(User(username='admin', email='admin@admin.com', password='admin', active=True, admin=True))
+        db.session.commit()
+
+    # bcrypt is slow on purpose, every generated user shares one hash
+    password_hash = bcrypt.generate_password_hash(password, current_app.config.get('BCRYPT_LOG_ROUNDS')).decode()
+    started = time.monotonic()
+    def log(table, done, total):
+        elapsed = time.monotonic() - started
+        click.echo(f'{table}: {done}/{total} ({done / elapsed:.0f} rows/s overall)' if elapsed else f'{table}: {done}/{total}')
+
+    connection = db.engine.raw_connection()
+    try:
+        first_id, last_id = synthetic.load(
+            connection, users, questions, password_hash,
+            seed=seed, workers=max(1, workers), batch_size=batch_size, zipf=zipf, mix=mix, log=log
         )
-
-    db.session.bulk_save_objects(questions_objects)
+    finally:
+        connection.close()
+    click.echo(f'Added users {first_id}-{last_id} and {questions if users else 0} questions in {time.monotonic() - started:.1f}s')
+
+
+@cli.command('prune_question_changes')
+@click.option('--keep', default=None, type=int, help='Seconds of changes to keep, defaults to QUESTION_CHANGES_RETENTION.')
+def prune_question_changes(keep):
+    """ Delete question_changes rows the worker catalogs have all replayed, run it daily """
+    config = current_app.config
+    keep = config['QUESTION_CHANGES_RETENTION'] if keep is None else keep
+    # a catalog reloads fully at least every TTL and only replays changes since then
+    if keep <= config['QUESTION_CATALOG_TTL']:
+        raise click.BadParameter('must exceed QUESTION_CATALOG_TTL', param_hint='--keep')
+    deleted = db.session.execute(
+        text('DELETE FROM question_changes WHERE changed_at < now() - make_interval(secs => :keep)'),
+        {'keep': keep}
+    ).rowcount
     db.session.commit()
+    click.echo(f'Deleted {deleted} question changes')
 
 
-
-def generate_string(size=10):
-    return ''.join(random.choice(string.ascii_lowercase) for _ in range(size))
-
-def generate_id(max_id):
-    return random.randint(1,max_id)
-
 #Instantiate the cli
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""user directory: trigram search and partial filter indexes
+
+Revision ID: 2e6a8d5b3f91
+Revises: 9c4f7b1e2a60
+Create Date: 2026-10-18 15:11:52.204719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e6a8d5b3f91'
+down_revision = '9c4f7b1e2a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_username_trgm', 'users', ['username'], postgresql_using='gin',
+            postgresql_ops={'username': 'gin_trgm_ops'}, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_users_email_trgm', 'users', ['email'], postgresql_using='gin',
+            postgresql_ops={'email': 'gin_trgm_ops'}, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_users_inactive_id', 'users', ['id'], postgresql_where=sa.text('NOT active'),
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_users_admin_id', 'users', ['id'], postgresql_where=sa.text('admin'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    op.drop_index('ix_users_admin_id', table_name='users')
+    op.drop_index('ix_users_inactive_id', table_name='users')
+    op.drop_index('ix_users_email_trgm', table_name='users')
+    op.drop_index('ix_users_username_trgm', table_name='users')
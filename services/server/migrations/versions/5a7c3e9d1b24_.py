@@ -0,0 +1,57 @@
+"""question_changes log for the per worker question catalog
+
+Revision ID: 5a7c3e9d1b24
+Revises: 2e6a8d5b3f91
+Create Date: 2026-10-18 16:40:12.873051
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7c3e9d1b24'
+down_revision = '2e6a8d5b3f91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('question_changes',
+    sa.Column('seq', sa.BigInteger(), nullable=False),
+    sa.Column('question_id', sa.Integer(), nullable=True),
+    sa.Column('changed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('seq')
+    )
+    op.execute("""
+    CREATE OR REPLACE FUNCTION log_question_changes() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            INSERT INTO question_changes (question_id) VALUES (NULL);
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO question_changes (question_id) SELECT id FROM old_rows;
+        ELSE
+            INSERT INTO question_changes (question_id) SELECT id FROM new_rows;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """)
+    # named to fire after questions_version, under its row lock
+    for name, transition in (('insert', 'NEW TABLE AS new_rows'), ('update', 'NEW TABLE AS new_rows'),
+                             ('delete', 'OLD TABLE AS old_rows')):
+        op.execute(
+            f'CREATE TRIGGER questions_version_log_{name} AFTER {name.upper()} ON questions REFERENCING {transition} '
+            'FOR EACH STATEMENT EXECUTE PROCEDURE log_question_changes()'
+        )
+    op.execute(
+        'CREATE TRIGGER questions_version_log_truncate AFTER TRUNCATE ON questions '
+        'FOR EACH STATEMENT EXECUTE PROCEDURE log_question_changes()'
+    )
+
+
+def downgrade():
+    for name in ('insert', 'update', 'delete', 'truncate'):
+        op.execute(f'DROP TRIGGER questions_version_log_{name} ON questions')
+    op.execute('DROP FUNCTION log_question_changes()')
+    op.drop_table('question_changes')
@@ -0,0 +1,73 @@
+"""index questions.author_id, smallint difficulty
+
+Revision ID: 7d2e9a4c1f35
+Revises: 4b8f1c2d9e7a
+Create Date: 2026-10-18 12:48:03.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e9a4c1f35'
+down_revision = '4b8f1c2d9e7a'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+# anything that isn't a known name is treated as Moderate
+TO_CODE = """
+    CASE lower(difficulty) WHEN 'easy' THEN 1 WHEN 'hard' THEN 3 ELSE 2 END
+"""
+TO_NAME = """
+    CASE difficulty_name WHEN 1 THEN 'Easy' WHEN 3 THEN 'Hard' ELSE 'Moderate' END
+"""
+
+
+def backfill(statement):
+    """
+    Run statement over consecutive id ranges of BATCH_SIZE, committing every batch so locks
+    stay short. Each range is found through the primary key instead of scanning again past
+    the rows already filled. The highest id is read again at the end, for rows inserted meanwhile
+    """
+    connection = op.get_bind()
+    last = 0
+    with op.get_context().autocommit_block():
+        while True:
+            last_id = connection.execute(sa.text('SELECT coalesce(max(id), 0) FROM questions')).scalar()
+            if last >= last_id:
+                return
+            while last < last_id:
+                connection.execute(sa.text(statement), last=last, batch_size=BATCH_SIZE)
+                last += BATCH_SIZE
+
+
+def upgrade():
+    op.add_column('questions', sa.Column('difficulty_code', sa.SmallInteger(), nullable=True))
+    backfill(f"""
+        UPDATE questions SET difficulty_code = {TO_CODE}
+        WHERE id > :last AND id <= :last + :batch_size AND difficulty_code IS NULL
+    """)
+    op.alter_column('questions', 'difficulty_code', nullable=False)
+    op.drop_column('questions', 'difficulty')
+    op.alter_column('questions', 'difficulty_code', new_column_name='difficulty')
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_questions_author_id_id', 'questions', ['author_id', 'id'], postgresql_concurrently=True)
+        op.create_index('ix_questions_difficulty_id', 'questions', ['difficulty', 'id'], postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_questions_difficulty_id', table_name='questions')
+    op.drop_index('ix_questions_author_id_id', table_name='questions')
+
+    op.alter_column('questions', 'difficulty', new_column_name='difficulty_name')
+    op.add_column('questions', sa.Column('difficulty', sa.String(), nullable=True))
+    backfill(f"""
+        UPDATE questions SET difficulty = {TO_NAME}
+        WHERE id > :last AND id <= :last + :batch_size AND difficulty IS NULL
+    """)
+    op.alter_column('questions', 'difficulty', nullable=False)
+    op.drop_column('questions', 'difficulty_name')
@@ -0,0 +1,49 @@
+"""full text search vector on questions.body
+
+Revision ID: 9c4f7b1e2a60
+Revises: 7d2e9a4c1f35
+Create Date: 2026-10-18 14:02:37.518206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4f7b1e2a60'
+down_revision = '7d2e9a4c1f35'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+
+def upgrade():
+    op.add_column('questions', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    # new and edited rows are kept current by the trigger while the backfill runs
+    op.execute("""
+        CREATE TRIGGER questions_search_vector BEFORE INSERT OR UPDATE OF body ON questions
+        FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.english', body)
+    """)
+
+    connection = op.get_bind()
+    with op.get_context().autocommit_block():
+        # consecutive id ranges through the primary key, rows inserted meanwhile get the trigger
+        statement = sa.text("""
+            UPDATE questions SET search_vector = to_tsvector('pg_catalog.english', body)
+            WHERE id > :last AND id <= :last + :batch_size AND search_vector IS NULL
+        """)
+        last_id = connection.execute(sa.text('SELECT coalesce(max(id), 0) FROM questions')).scalar()
+        for last in range(0, last_id, BATCH_SIZE):
+            connection.execute(statement, last=last, batch_size=BATCH_SIZE)
+        op.create_index(
+            'ix_questions_search_vector', 'questions', ['search_vector'],
+            postgresql_using='gin', postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    op.drop_index('ix_questions_search_vector', table_name='questions')
+    op.execute('DROP TRIGGER questions_search_vector ON questions')
+    op.drop_column('questions', 'search_vector')
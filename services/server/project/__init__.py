@@ -2,17 +2,21 @@
 import os
 from flask import Flask, jsonify
 from flask_restful import Resource, Api
-from flask_sqlalchemy import SQLAlchemy
-from flask_debugtoolbar import DebugToolbarExtension
 from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_bcrypt import Bcrypt
+from project.api.cache import PrincipalCache, FragmentCache
+from project.api.replica import RoutingSQLAlchemy, ReplicaRouter
+from project.api.hashing import HashingPool
+from project.api.catalog import QuestionCatalog
+from project.api.timing import RequestTiming
+from project.api.slow_queries import SlowQueryLog
 
-# instantiate db
-db = SQLAlchemy()
+# instantiate db, pooled per SQLALCHEMY_* settings in config.py
+db = RoutingSQLAlchemy()
 
-#instantiate toolbar
-toolbar = DebugToolbarExtension()
+# instantiate read replica routing, only active with a replica bind
+replica_router = ReplicaRouter()
 
 #instantiate CORS
 cors = CORS()
@@ -23,6 +27,24 @@ migrate = Migrate()
 # instantiate password hashing
 bcrypt = Bcrypt()
 
+# instantiate bcrypt process pool
+hashing_pool = HashingPool()
+
+# instantiate token -> user cache for the auth decorators
+principal_cache = PrincipalCache()
+
+# instantiate encoded question json cache for the list endpoints
+question_json_cache = FragmentCache()
+
+# instantiate per worker in memory question catalog for /questions/random, and the lists with QUESTION_CATALOG
+question_catalog = QuestionCatalog()
+
+# instantiate per request SQL counting and Server-Timing, off unless REQUEST_TIMING
+request_timing = RequestTiming()
+
+# instantiate slow query log, off unless SLOW_QUERY_LOG
+slow_query_log = SlowQueryLog()
+
 # Application Factory -- instantiate app
 def create_app(script_info=None):
     app = Flask(__name__)
@@ -33,14 +55,28 @@ def create_app(script_info=None):
 
     # set up db extension
     db.init_app(app)
-    # set up toolbar extension
-    toolbar.init_app(app)
+    replica_router.init_app(app, db)
+    # set up toolbar extension, imported here so production workers never load it
+    if app.config.get('DEBUG_TOOLBAR'):
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
     # set up CORS extension
     cors.init_app(app)
     # set up flask migrate
     migrate.init_app(app, db)
     # set up pass hashing
     bcrypt.init_app(app)
+    hashing_pool.init_app(app)
+    # set up auth cache
+    principal_cache.init_app(app)
+    # set up question json cache
+    question_json_cache.init_app(app)
+    # set up question catalog
+    question_catalog.init_app(app, db)
+    # set up request timing
+    request_timing.init_app(app)
+    # set up slow query log
+    slow_query_log.init_app(app)
     
     # imported here to avoid circular import
     from project.api.users import users_blueprint
@@ -49,6 +85,10 @@ def create_app(script_info=None):
     app.register_blueprint(login_blueprint)
     from project.api.questions import questions_blueprint
     app.register_blueprint(questions_blueprint)
+    from project.api.export import export_blueprint
+    app.register_blueprint(export_blueprint)
+    from project.api.metrics import metrics_blueprint
+    app.register_blueprint(metrics_blueprint)
 
     '''
     shell context for flask cli used to register the app and db to the shell to work with the application context and db
@@ -0,0 +1,166 @@
+# services/server/project/api/bulk.py
+import csv
+import json
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from project import db
+from project.api.models import Difficulty, normalize_difficulty
+
+COLUMNS = ('body', 'test_code', 'test_solution', 'difficulty')
+FORMATS = ('application/x-ndjson', 'application/jsonl', 'text/csv')
+
+INSERT_QUESTIONS = 'INSERT INTO questions (author_id, body, test_code, test_solution, difficulty) VALUES %s'
+
+DIFFICULTY = Difficulty()
+
+# an NDJSON line can be as long as the upload, let a CSV field be too instead of the 128KiB default
+csv.field_size_limit(sys.maxsize)
+
+
+def ndjson_records(lines):
+    """ (line number, record, error) for every non blank line """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, 'Invalid JSON'
+            continue
+        if not isinstance(record, dict):
+            yield number, None, 'Expected a JSON object'
+            continue
+        yield number, record, None
+
+def decode_lines(lines, invalid):
+    """ Lines as text, a bad byte fails the row it is in instead of the whole upload """
+    for number, line in enumerate(lines, 1):
+        try:
+            yield line.decode('utf-8')
+        except UnicodeDecodeError:
+            invalid.add(number)
+            yield line.decode('utf-8', 'replace')
+
+def csv_rows(reader, invalid):
+    """ (line number, record, error) for the rows of a reader whose header was read """
+    start = reader.line_num + 1
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # the reader can't tell where the broken row ends, so nothing after it is read
+            yield start, None, f'Invalid CSV, stopped reading here: {e}'
+            return
+        # quoted fields may span lines, a row covers start..line_num
+        span = range(start, reader.line_num + 1)
+        start = reader.line_num + 1
+        yield (span[0],) + csv_row(record, span, invalid)
+
+def csv_row(record, span, invalid):
+    """ (record, error) of a parsed row over the line numbers in span """
+    if invalid.intersection(span):
+        invalid.difference_update(span)
+        return None, 'Invalid UTF-8'
+    if None in record:
+        return None, 'Too many fields'
+    return record, None
+
+def csv_records(lines):
+    """
+    (line number, record, error) for every row after the header. The header is read
+    straight away, ValueError if it doesn't name the question columns. A row the csv
+    module can't parse, like a quote left open at the end, is the last one reported
+    """
+    invalid = set()
+    # strict, so a stray or unclosed quote is an error instead of swallowing the rows after it
+    reader = csv.DictReader(decode_lines(lines, invalid), strict=True)
+    try:
+        fieldnames = reader.fieldnames
+    except csv.Error:
+        fieldnames = None
+    if not fieldnames or sorted(fieldnames) != sorted(COLUMNS):
+        raise ValueError('CSV header must be ' + ','.join(COLUMNS))
+    return csv_rows(reader, invalid)
+
+def read_records(stream, mimetype):
+    """ Lazily parsed records of an NDJSON or CSV upload, ValueError for other formats """
+    if mimetype == 'text/csv':
+        return csv_records(stream)
+    if mimetype in FORMATS:
+        return ndjson_records(stream)
+    raise ValueError('Unsupported format')
+
+def question_row(record, author_id):
+    """ Column values for the INSERT, ValueError describing the first problem with record """
+    unknown = set(record) - set(COLUMNS)
+    if unknown:
+        raise ValueError('Unknown fields: ' + ', '.join(sorted(str(key) for key in unknown)))
+    for column in ('body', 'test_code', 'test_solution'):
+        if not isinstance(record.get(column), str) or not record[column]:
+            raise ValueError(f'{column} must be a non-empty string')
+        if '\x00' in record[column]:
+            raise ValueError(f'{column} must not contain NUL characters') # postgres text can't store them
+    difficulty = DIFFICULTY.process_bind_param(normalize_difficulty(record.get('difficulty')), None)
+    return (author_id, record['body'], record['test_code'], record['test_solution'], difficulty)
+
+def insert_batch(rows):
+    """ One multi-row INSERT through psycopg2 execute_values, committed on its own """
+    with db.session.connection().connection.cursor() as cursor:
+        execute_values(cursor, INSERT_QUESTIONS, rows, page_size=len(rows))
+    db.session.commit()
+
+def validated_row(record, author_id):
+    """ (row, None) with the column values of a valid record, (None, message) otherwise """
+    try:
+        return question_row(record, author_id), None
+    except ValueError as e:
+        return None, str(e)
+
+def report_error(report, line, message, max_errors, count=1):
+    report['failed'] += count
+    if len(report['errors']) < max_errors:
+        report['errors'].append({'line': line, 'message': message})
+    else:
+        report['errors_truncated'] = True
+
+def flush_batch(report, batch, lines, max_errors):
+    """ Insert and empty batch, a failed INSERT counts all of its rows as failed """
+    try:
+        insert_batch(batch)
+        report['inserted'] += len(batch)
+    except psycopg2.Error as e:
+        db.session.rollback()
+        report_error(report, lines[0], f'Batch of {len(batch)} rows up to line {lines[-1]} failed: {e}', max_errors, len(batch))
+    del batch[:], lines[:]
+
+def import_questions(records, author_id, batch_size=1000, max_errors=100):
+    """
+    Validate and insert records as they are read, batch_size rows at a time, so memory
+    stays flat however large the upload is. Invalid rows are reported and skipped, the
+    first max_errors reports are kept and the rest only counted
+    """
+    started = time.monotonic()
+    report = {'inserted': 0, 'failed': 0, 'errors': [], 'errors_truncated': False}
+    batch, lines = [], []
+    for line, record, error in records:
+        row, error = validated_row(record, author_id) if error is None else (None, error)
+        if error is not None:
+            report_error(report, line, error, max_errors)
+            continue
+        batch.append(row)
+        lines.append(line)
+        if len(batch) >= batch_size:
+            flush_batch(report, batch, lines, max_errors)
+    if batch:
+        flush_batch(report, batch, lines, max_errors)
+
+    seconds = time.monotonic() - started
+    report['seconds'] = round(seconds, 3)
+    report['rows_per_second'] = round(report['inserted'] / seconds) if seconds else report['inserted']
+    return report
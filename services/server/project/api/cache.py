@@ -0,0 +1,163 @@
+# services/server/project/api/cache.py
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# what the auth decorators need to know about the user behind a token
+Principal = namedtuple('Principal', ['id', 'active', 'admin'])
+
+
+class LRUCache:
+    """ Bounded, thread safe LRU cache where every entry also expires after a ttl """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key] # expired
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False) # evict least recently used
+
+    def discard_if(self, predicate):
+        """ Drop every entry whose value matches predicate """
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class PrincipalCache(LRUCache):
+    """
+    Per process cache of token -> Principal so authenticated requests skip the user lookup.
+    Other workers only see an invalidation once their entry expires, so AUTH_CACHE_TTL
+    is the maximum time a changed user can stay stale.
+    """
+    def __init__(self, maxsize=1024, ttl=0):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('AUTH_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('AUTH_CACHE_TTL', self.ttl)
+
+    def set(self, key, value, ttl=None):
+        super().set(key, value, self.ttl if ttl is None else min(ttl, self.ttl))
+
+    def invalidate_user(self, user_id):
+        self.discard_if(lambda principal: principal.id == int(user_id))
+
+
+class FragmentCache:
+    """
+    Per process LRU of already encoded json fragments, bounded by their total size rather than
+    by count. Keys are (row id, row version, ...) so a row written anywhere is simply looked up
+    under its new version, invalidate() only frees the old entries of a row this worker wrote.
+    max_bytes 0 turns it off.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._keys = {} # row id -> its keys in _entries
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('QUESTION_JSON_CACHE_BYTES', self.max_bytes)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get_many(self, keys):
+        """ The fragment of each key, None for the ones not cached """
+        fragments = []
+        with self._lock:
+            for key in keys:
+                fragment = self._entries.get(key)
+                if fragment is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                fragments.append(fragment)
+        return fragments
+
+    def set(self, key, fragment):
+        if len(fragment) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = fragment
+            self._keys.setdefault(key[0], set()).add(key)
+            self.size += len(fragment)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries))) # least recently used
+                self.evictions += 1
+
+    def _remove(self, key):
+        fragment = self._entries.pop(key, None)
+        if fragment is None:
+            return
+        self.size -= len(fragment)
+        keys = self._keys[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._keys[key[0]]
+
+    def invalidate(self, row_id):
+        """ Drop every cached version of row_id """
+        with self._lock:
+            for key in list(self._keys.get(row_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self.size = self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
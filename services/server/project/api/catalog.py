@@ -0,0 +1,428 @@
+# services/server/project/api/catalog.py
+import random
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from flask import current_app, request
+from sqlalchemy import text
+
+from project.api.replica import READ_METHODS
+
+VERSION_QUERY = text("SELECT version FROM table_versions WHERE name = 'questions'")
+LATEST_QUERY = text('SELECT coalesce(max(seq), 0) FROM question_changes')
+CHANGES_QUERY = text('SELECT seq, question_id FROM question_changes WHERE seq > :seen ORDER BY seq LIMIT :limit')
+ROWS_QUERY = text('SELECT id, author_id, difficulty FROM questions WHERE id > :after ORDER BY id LIMIT :limit')
+CHANGED_ROWS_QUERY = text('SELECT id, author_id, difficulty FROM questions WHERE id = ANY(:ids)')
+TEXT_QUERY = text('SELECT id, body, test_code, test_solution FROM questions WHERE id = ANY(:ids)')
+
+LOAD_BATCH = 50000
+# Question.to_json() without fields, in the same order
+DEFAULT_FIELDS = ('id', 'author_id', 'body', 'test_code', 'test_solution', 'difficulty')
+TEXT_FIELDS = ('body', 'test_code', 'test_solution', 'preview')
+PREVIEW_LENGTH = 100
+EMPTY_IDS = array('i')
+
+
+class QuestionCatalog:
+    """
+    Per worker columnar copy of the questions table for the list, count and random endpoints.
+    id, author_id and the difficulty code sit in parallel arrays ordered by id, 9 bytes a row,
+    and a deleted row keeps difficulty 0 until the next full load. The live ids are kept twice
+    more in sorted arrays, per difficulty and per author and difficulty, so every page, count
+    and random pick is a slice or a binary search rather than a walk over the table. body,
+    test_code and test_solution are only fetched when a response needs them, then appended to
+    one bytearray that the offsets and lengths columns point into, up to
+    QUESTION_CATALOG_TEXT_BYTES.
+
+    Kept current from question_changes, the ids the questions triggers log in write order.
+    When the questions table version moved (checked at most every QUESTION_CATALOG_INTERVAL
+    seconds, and right after this worker wrote) only the ids logged since are read again. A
+    truncate or more than QUESTION_CATALOG_MAX_CHANGES of them reload everything, as does
+    QUESTION_CATALOG_TTL running out; only the first load blocks a request, the later ones run
+    in a background thread and swap the new columns in while the old ones keep serving. The log
+    triggers take their seq under the table_versions row lock, so once a seq is visible every
+    lower one is committed or rolled back, and the highest seq applied is all the state a
+    refresh needs.
+    """
+    def __init__(self, interval=0, ttl=3600, max_changes=50000, text_bytes=64 * 1024 * 1024):
+        self.interval = interval
+        self.ttl = ttl
+        self.max_changes = max_changes
+        self.text_bytes = text_bytes
+        self.full_loads = 0
+        self.updates = 0
+        self.text_resets = 0
+        self._lock = threading.Lock() # the columns
+        self._refresh_lock = threading.Lock()
+        self._reload = None
+        self._generation = 0 # bumped by every full load swapped in
+        self._reset()
+
+    def init_app(self, app, db):
+        self.db = db
+        self.interval = app.config.get('QUESTION_CATALOG_INTERVAL', self.interval)
+        self.ttl = app.config.get('QUESTION_CATALOG_TTL', self.ttl)
+        self.max_changes = app.config.get('QUESTION_CATALOG_MAX_CHANGES', self.max_changes)
+        self.text_bytes = app.config.get('QUESTION_CATALOG_TEXT_BYTES', self.text_bytes)
+        app.extensions['question_catalog'] = self
+        app.after_request(self.after_request)
+
+    @staticmethod
+    def enabled():
+        return current_app.config.get('QUESTION_CATALOG', False)
+
+    def after_request(self, response):
+        # this worker's own writes show up on its next read, without waiting out the interval
+        if request.method not in READ_METHODS:
+            self._dirty = True
+        return response
+
+    def _reset(self):
+        self._dirty = False
+        self._loaded_at = self._checked_at = None
+        self._set_columns(array('i'), array('i'), array('b'), None, 0)
+
+    def _set_columns(self, ids, authors, difficulties, version, seen):
+        """ Swap in freshly loaded columns, with no text held, built before the lock is taken """
+        by_author, by_difficulty = {}, {}
+        for row_id, author_id, code in zip(ids, authors, difficulties):
+            if code:
+                (by_difficulty.get(code) or by_difficulty.setdefault(code, array('i'))).append(row_id)
+                pools = by_author.get(author_id) or by_author.setdefault(author_id, {})
+                (pools.get(code) or pools.setdefault(code, array('i'))).append(row_id)
+        with self._lock:
+            self.version = version
+            self.seen = seen # highest question_changes seq applied
+            self._generation += 1
+            self.ids, self.authors, self.difficulties = ids, authors, difficulties
+            self.offsets = array('q', [-1]) * len(ids)
+            self.lengths = array('i', [0]) * len(ids)
+            self._blob = bytearray()
+            # live ids ascending of each difficulty code, and of each author by difficulty code
+            self._by_difficulty = by_difficulty
+            self._by_author = by_author
+            # rows per difficulty code, 0 counts the deleted ones
+            self._counts = Counter(difficulties)
+
+    def refresh(self):
+        """
+        Brings the snapshot up to date when it is due and returns the questions table version it
+        reflects. Only the first load blocks, otherwise one thread refreshes while the others
+        keep serving the current snapshot
+        """
+        if self.version is not None and not self._dirty and time.monotonic() - self._checked_at < self.interval:
+            return self.version
+        if not self._refresh_lock.acquire(blocking=self.version is None):
+            return self.version
+        try:
+            if self.version is None:
+                self._dirty = False
+                self._load()
+            elif not self._update() or time.monotonic() - self._loaded_at > self.ttl:
+                self._load_in_background()
+            self._checked_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+        return self.version
+
+    def _load(self):
+        session = self.db.session
+        version = session.execute(VERSION_QUERY).scalar()
+        # read before the rows, changes logged meanwhile are applied again on the next refresh
+        seen = session.execute(LATEST_QUERY).scalar()
+        ids, authors, difficulties = array('i'), array('i'), array('b')
+        after = 0
+        while True:
+            rows = session.execute(ROWS_QUERY, {'after': after, 'limit': LOAD_BATCH}).fetchall()
+            for row_id, author_id, difficulty in rows:
+                ids.append(row_id)
+                authors.append(author_id)
+                difficulties.append(difficulty)
+            if len(rows) < LOAD_BATCH:
+                break
+            after = ids[-1]
+        self._set_columns(ids, authors, difficulties, version, seen)
+        self._loaded_at = time.monotonic()
+        self.full_loads += 1
+
+    def _load_in_background(self):
+        if self._reload is not None and self._reload.is_alive():
+            return # its columns come with the version and seen they were read at
+        app = current_app._get_current_object()
+        self._loaded_at = time.monotonic() # due again after ttl, even if this load fails
+        def run():
+            with app.app_context():
+                try:
+                    self._load()
+                finally:
+                    self.db.session.remove()
+        self._reload = threading.Thread(target=run, daemon=True)
+        self._reload.start()
+
+    def wait(self):
+        """ Block until a background load in progress is done """
+        if self._reload is not None:
+            self._reload.join()
+
+    def _update(self):
+        """ Applies the changes logged since seen, False when they call for a full load instead """
+        self._dirty = False
+        session = self.db.session
+        current, seen, generation = self.version, self.seen, self._generation
+        version = session.execute(VERSION_QUERY).scalar()
+        if version <= current:
+            return True # no writes, or read from a replica that is behind this snapshot
+        changes = session.execute(CHANGES_QUERY, {'seen': seen, 'limit': self.max_changes + 1}).fetchall()
+        if len(changes) > self.max_changes or any(question_id is None for _, question_id in changes):
+            return False
+        changed = sorted({question_id for _, question_id in changes})
+        rows = session.execute(CHANGED_ROWS_QUERY, {'ids': changed}).fetchall() if changed else []
+        found = {row_id: (author_id, difficulty) for row_id, author_id, difficulty in rows}
+        with self._lock:
+            if generation != self._generation:
+                return True # a full load was swapped in meanwhile, it has its own seen
+            for row_id in changed:
+                if row_id in found:
+                    self._upsert(row_id, *found[row_id])
+                else:
+                    self._delete(row_id)
+            if changes:
+                self.seen = changes[-1][0]
+            self.version = version
+        self.updates += 1
+        return True
+
+    def _position(self, row_id):
+        position = bisect_left(self.ids, row_id)
+        if position < len(self.ids) and self.ids[position] == row_id:
+            return position
+        return None
+
+    def _move(self, row_id, author_id, old, new_author_id, new):
+        """ Take row_id out of the (author_id, old) sorted id arrays and put it in the (new_author_id, new) ones, 0 for none """
+        if (author_id, old) == (new_author_id, new):
+            return
+        if old:
+            for ids in (self._by_difficulty[old], self._by_author[author_id][old]):
+                del ids[bisect_left(ids, row_id)]
+        if new:
+            pools = self._by_author.get(new_author_id) or self._by_author.setdefault(new_author_id, {})
+            for ids in (self._by_difficulty.setdefault(new, array('i')), pools.setdefault(new, array('i'))):
+                if not ids or ids[-1] < row_id:
+                    ids.append(row_id) # new ids are nearly always the largest
+                else:
+                    ids.insert(bisect_left(ids, row_id), row_id)
+
+    def _upsert(self, row_id, author_id, difficulty):
+        position = self._position(row_id)
+        if position is None:
+            # new ids are nearly always the largest, anything else is a slower transaction's insert
+            position = bisect_left(self.ids, row_id)
+            self.ids.insert(position, row_id)
+            self.authors.insert(position, author_id)
+            self.difficulties.insert(position, 0)
+            self.offsets.insert(position, -1)
+            self.lengths.insert(position, 0)
+            self._counts[0] += 1
+        self._move(row_id, self.authors[position], self.difficulties[position], author_id, difficulty)
+        self._counts[self.difficulties[position]] -= 1
+        self._counts[difficulty] += 1
+        self.authors[position] = author_id
+        self.difficulties[position] = difficulty
+        self.offsets[position] = -1 # the text may have been edited
+
+    def _delete(self, row_id):
+        position = self._position(row_id)
+        if position is None or not self.difficulties[position]:
+            return
+        self._move(row_id, self.authors[position], self.difficulties[position], None, 0)
+        self._counts[self.difficulties[position]] -= 1
+        self._counts[0] += 1
+        self.difficulties[position] = 0
+        self.offsets[position] = -1
+
+    def _pools(self, difficulty=None, author_id=None):
+        """ {code: live ids ascending} matching the filters """
+        pools = self._by_difficulty if author_id is None else self._by_author.get(author_id, {})
+        if difficulty is None:
+            return pools
+        return {difficulty: pools[difficulty]} if difficulty in pools else {}
+
+    def page(self, difficulty=None, author_id=None, after=None, limit=5):
+        """
+        Up to limit (id, author_id, difficulty code) entries with id > after, ordered by id, and
+        the key to continue after when there are more. difficulty is a code, like in postgres
+        """
+        with self._lock:
+            if difficulty is None and author_id is None:
+                # straight down the columns, only the rows deleted since the last load are skipped
+                start = bisect_right(self.ids, after or 0)
+                entries = []
+                for index in range(start, len(self.ids)):
+                    if self.difficulties[index]:
+                        entries.append((self.ids[index], self.authors[index], self.difficulties[index]))
+                        if len(entries) > limit:
+                            break
+                return self._page(entries, limit)
+            # the next limit + 1 ids of each difficulty, merged
+            candidates = []
+            for code, ids in self._pools(difficulty, author_id).items():
+                start = bisect_right(ids, after or 0)
+                candidates += [(row_id, code) for row_id in ids[start:start + limit + 1]]
+            candidates.sort()
+            entries = [
+                (row_id, author_id if author_id is not None else self.authors[self._position(row_id)], code)
+                for row_id, code in candidates[:limit + 1]
+            ]
+        return self._page(entries, limit)
+
+    @staticmethod
+    def _page(entries, limit):
+        if len(entries) > limit:
+            entries = entries[:limit]
+            return entries, entries[-1][0]
+        return entries, None
+
+    def count(self, difficulty=None, author_id=None):
+        with self._lock:
+            return sum(len(ids) for ids in self._pools(difficulty, author_id).values())
+
+    def sample(self, difficulty=None, exclude_author=None, attempts=8):
+        """ Uniformly random (id, author_id, difficulty code) entry matching the filters, or None """
+        with self._lock:
+            pools = self._pools(difficulty)
+            codes = list(pools)
+            for _ in range(attempts):
+                code, index = self._choose(codes, [len(pools[code]) for code in codes])
+                if code is None:
+                    return None
+                row_id = pools[code][index]
+                author_id = self.authors[self._position(row_id)]
+                if author_id != exclude_author:
+                    return row_id, author_id, code
+            # the excluded author wrote most of what matches: draw a rank among everyone else's
+            # ids and find it by binary search, counting the author's own ids with theirs
+            excluded = self._by_author.get(exclude_author, {})
+            code, rank = self._choose(codes, [len(pools[code]) - len(excluded.get(code, ())) for code in codes])
+            if code is None:
+                return None
+            ids, own = pools[code], excluded.get(code, EMPTY_IDS)
+            # smallest index whose ids up to it include rank + 1 not written by the author
+            low, high = rank, len(ids) - 1
+            while low < high:
+                middle = (low + high) // 2
+                if middle + 1 - bisect_right(own, ids[middle]) > rank:
+                    high = middle
+                else:
+                    low = middle + 1
+            return ids[low], self.authors[self._position(ids[low])], code
+
+    @staticmethod
+    def _choose(codes, sizes):
+        """ (code, index below its size) drawn with weights sizes, Nones if all are 0 """
+        total = sum(sizes)
+        if not total:
+            return None, None
+        index = random.randrange(total)
+        for code, size in zip(codes, sizes):
+            if index < size:
+                return code, index
+            index -= size
+
+    def rows(self, entries, fields=None):
+        """
+        Dicts like Question.to_json(fields) for page() or sample() entries. Text the catalog
+        doesn't hold yet is read in one query, an entry deleted meanwhile is left out
+        """
+        # models imports project, which imports this module
+        from project.api.models import DIFFICULTIES
+        names = fields or DEFAULT_FIELDS
+        needs_text = any(name in TEXT_FIELDS for name in names)
+        texts = self._texts([entry[0] for entry in entries]) if needs_text else {}
+        rows = []
+        for row_id, author_id, code in entries:
+            if needs_text and row_id not in texts:
+                continue
+            values = {'id': row_id, 'author_id': author_id, 'difficulty': DIFFICULTIES[code - 1]}
+            if needs_text:
+                values['body'], values['test_code'], values['test_solution'] = texts[row_id]
+                values['preview'] = values['body'][:PREVIEW_LENGTH]
+            rows.append({name: values[name] for name in names})
+        return rows
+
+    def _texts(self, ids):
+        """ (body, test_code, test_solution) by id """
+        held, missing = {}, []
+        with self._lock:
+            for row_id in ids:
+                position = self._position(row_id)
+                if position is not None and self.offsets[position] >= 0:
+                    start = self.offsets[position]
+                    held[row_id] = self._blob[start:start + self.lengths[position]]
+                else:
+                    missing.append(row_id)
+            updates, generation = self.updates, self._generation
+        # postgres text can't contain NUL, so it separates the three columns
+        texts = {row_id: data.decode().split('\0') for row_id, data in held.items()}
+        if missing:
+            rows = self.db.session.execute(TEXT_QUERY, {'ids': missing}).fetchall()
+            with self._lock:
+                for row_id, body, test_code, test_solution in rows:
+                    texts[row_id] = [body, test_code, test_solution]
+                    # text read before a refresh applied a newer edit must not be kept
+                    if (updates, generation) == (self.updates, self._generation):
+                        self._hold(row_id, '\0'.join(texts[row_id]).encode())
+        return texts
+
+    def _hold(self, row_id, data):
+        position = self._position(row_id)
+        if position is None or len(data) > self.text_bytes:
+            return
+        if len(self._blob) + len(data) > self.text_bytes:
+            # full, edits leave garbage behind too: drop every text and load them again as needed
+            self._blob = bytearray()
+            self.offsets = array('q', [-1]) * len(self.ids)
+            self.text_resets += 1
+        self.offsets[position] = len(self._blob)
+        self.lengths[position] = len(data)
+        self._blob += data
+
+    def clear(self):
+        self.wait()
+        with self._refresh_lock:
+            self._reset()
+            self.full_loads = self.updates = self.text_resets = 0
+
+    def _index_bytes(self):
+        """ Memory of the sorted id arrays and the dicts that hold them, walks every author """
+        with self._lock:
+            # the items are copied so the walk below doesn't keep requests waiting
+            by_difficulty, by_author = self._by_difficulty, self._by_author
+            difficulty_ids, author_pools = list(by_difficulty.values()), list(by_author.items())
+        size = sys.getsizeof(by_difficulty) + sys.getsizeof(by_author)
+        size += sum(sys.getsizeof(ids) for ids in difficulty_ids)
+        for author_id, pools in author_pools:
+            size += sys.getsizeof(author_id) + sys.getsizeof(pools) + sum(sys.getsizeof(ids) for ids in list(pools.values()))
+        return size
+
+    def stats(self):
+        columns = (self.ids, self.authors, self.difficulties, self.offsets, self.lengths)
+        return {
+            'size': len(self.ids) - self._counts[0],
+            'deleted': self._counts[0],
+            'version': self.version,
+            'seen': self.seen,
+            'column_bytes': sum(sys.getsizeof(column) for column in columns),
+            # the per difficulty and per author copies of the live ids, with the per author dicts
+            'index_bytes': self._index_bytes(),
+            'text_bytes': len(self._blob),
+            'authors': len(self._by_author),
+            'full_loads': self.full_loads,
+            'updates': self.updates,
+            'text_resets': self.text_resets,
+            'age': None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1)
+        }
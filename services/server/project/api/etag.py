@@ -0,0 +1,35 @@
+# services/server/project/api/etag.py
+import hashlib
+
+from flask import request, Response
+from sqlalchemy import text
+
+from project import db
+
+
+def table_etag(*tables):
+    """
+    ETag for the current url built from the write counters of the tables it reads.
+    Costs one primary key lookup instead of building and hashing the response.
+    """
+    versions = db.session.execute(
+        text('SELECT name, version FROM table_versions WHERE name IN :names ORDER BY name'),
+        {'names': tables}
+    ).fetchall()
+    return versions_etag(versions)
+
+def versions_etag(versions):
+    """ ETag for the current url from (table name, version) pairs ordered by name """
+    key = '{0}|{1}'.format(request.full_path, ','.join(f'{name}={version}' for name, version in versions))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def not_modified(etag):
+    """ Returns a bodyless 304 if the client already holds etag, otherwise None """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def etag_header(etag):
+    return {'ETag': f'"{etag}"'}
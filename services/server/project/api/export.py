@@ -0,0 +1,75 @@
+# services/server/project/api/export.py
+import zlib
+
+from flask import Blueprint, request, current_app, stream_with_context
+
+from project import db
+from project.api.models import User, Question
+from project.api.utils import authenticate, is_admin
+from project.api.serializers import jsonify, dumps
+
+export_blueprint = Blueprint('export', __name__)
+
+# columns in each dump, password hashes never leave the database
+EXPORTS = {
+    'questions': (Question, ('id', 'author_id', 'body', 'test_code', 'test_solution', 'difficulty')),
+    'users': (User, ('id', 'username', 'email', 'active', 'admin', 'created_date')),
+}
+
+
+def ndjson_chunks(query, fields, batch_size):
+    """ NDJSON for query, batch_size rows per chunk, read through a server side cursor """
+    chunk = []
+    for row in query.yield_per(batch_size):
+        chunk.append(dumps(dict(zip(fields, row))))
+        if len(chunk) >= batch_size:
+            yield b'\n'.join(chunk) + b'\n'
+            chunk = []
+    if chunk:
+        yield b'\n'.join(chunk) + b'\n'
+
+def gzip_chunks(chunks):
+    """ One gzip member compressed incrementally as the chunks arrive """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@export_blueprint.route('/export/<name>', methods=['GET'])
+@authenticate
+def export(sub, name):
+    """
+    Full dump of a table as NDJSON ordered by id, gzipped when the client accepts it.
+    An interrupted download resumes with ?after_id=<last id received>
+    """
+    response = {
+        'status': 'fail',
+        'message': 'Forbidden'
+    }
+    if not is_admin(sub):
+        return jsonify(response), 403
+    if name not in EXPORTS:
+        response['message'] = 'Unknown export'
+        return jsonify(response), 404
+    try:
+        after_id = int(request.args.get('after_id', 0))
+    except ValueError:
+        response['message'] = 'Invalid query parameters'
+        return jsonify(response), 400
+    model, fields = EXPORTS[name]
+    query = db.session.query(*[getattr(model, field) for field in fields]) \
+        .filter(model.id > after_id) \
+        .order_by(model.id)
+    chunks = ndjson_chunks(query, fields, current_app.config['EXPORT_BATCH_SIZE'])
+    headers = {'Vary': 'Accept-Encoding'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    # the request context, and with it the session holding the cursor, lives until the last chunk
+    return current_app.response_class(
+        stream_with_context(chunks),
+        mimetype='application/x-ndjson',
+        headers=headers
+    )
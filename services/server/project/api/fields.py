@@ -0,0 +1,44 @@
+# services/server/project/api/fields.py
+from flask import request
+from sqlalchemy.orm import load_only
+
+
+def get_fields(model):
+    """
+    Fields requested with ?fields=id,difficulty. Returns None when the client wants everything,
+    raises ValueError for names that aren't part of model.JSON_FIELDS
+    """
+    value = request.args.get('fields')
+    if not value:
+        return None
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    if not fields or any(field not in model.JSON_FIELDS for field in fields):
+        raise ValueError('Invalid fields')
+    return fields
+
+def only_fields(query, model, fields):
+    """ Defer every column the client didn't ask for so it is never read from postgres """
+    if fields is None:
+        return query
+    return query.options(load_only(*[getattr(model, field) for field in fields]))
+
+def update_values(model, data):
+    """
+    Column values for an UPDATE from a json payload. Only model.EDITABLE_FIELDS may be set,
+    raises ValueError for an empty payload or any other key
+    """
+    if not isinstance(data, dict) or not data:
+        raise ValueError('Empty payload')
+    if any(key not in model.EDITABLE_FIELDS for key in data):
+        raise ValueError('Invalid fields')
+    return dict(data)
+
+def returning_columns(model):
+    """ Table columns of model.to_json(), for UPDATE/DELETE ... RETURNING """
+    return [column for column in model.__table__.c if column.key in model.JSON_FIELDS]
+
+def json_columns(model, fields):
+    """ Column expressions for a Core select of what model.to_json(fields) returns, labelled with the field names """
+    if fields is None:
+        return returning_columns(model)
+    return [getattr(model, field).label(field) for field in fields]
@@ -0,0 +1,93 @@
+# services/server/project/api/hashing.py
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from project.api.timing import timed
+
+
+class HashingPoolFull(Exception):
+    """ Raised when every hashing slot is taken, the caller should answer 503 """
+    pass
+
+
+# run inside the pool processes, must be module level so they can be pickled
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _check_password(pw_hash, password):
+    return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+
+
+class HashingPool:
+    """
+    Bounded process pool for bcrypt so hashing doesn't hold the worker's cpu.
+    At most BCRYPT_POOL_SIZE hashes run at once and BCRYPT_POOL_QUEUE more may wait,
+    anything beyond that raises HashingPoolFull instead of piling up behind bcrypt.
+    A size of 0 hashes inline.
+
+    Every caller blocks one of the worker's GUNICORN_THREADS until its hash is done, so there
+    are never more callers than threads. size + queue_depth has to stay below that or no
+    caller is ever turned away, and every thread of the worker can end up waiting on bcrypt;
+    init_app refuses such a configuration.
+    """
+    def __init__(self):
+        self.size = 0
+        self.queue_depth = 0
+        self.rounds = 12
+        self.retry_after = 1
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.size = app.config.get('BCRYPT_POOL_SIZE', self.size)
+        self.queue_depth = app.config.get('BCRYPT_POOL_QUEUE', self.queue_depth)
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', self.rounds)
+        self.retry_after = app.config.get('BCRYPT_POOL_RETRY_AFTER', self.retry_after)
+        threads = app.config.get('GUNICORN_THREADS', 1)
+        if self.size and self.size + self.queue_depth >= threads:
+            raise ValueError(
+                f'BCRYPT_POOL_SIZE + BCRYPT_POOL_QUEUE ({self.size + self.queue_depth}) must be below '
+                f'GUNICORN_THREADS ({threads}), a worker never has more hashing callers than threads'
+            )
+        self._slots = threading.BoundedSemaphore(self.size + self.queue_depth)
+
+    def _get_executor(self):
+        # created lazily and per pid so gunicorn forks don't share a pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.size)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.size:
+            with timed('bcrypt'):
+                return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolFull()
+        try:
+            with timed('bcrypt'): # includes waiting for a free process
+                return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash_password(self, password):
+        if not password:
+            raise ValueError('Password must be non-empty.')
+        return self._run(_hash_password, password, self.rounds)
+
+    def check_password(self, pw_hash, password):
+        if not password:
+            raise ValueError('Password must be non-empty.')
+        return self._run(_check_password, pw_hash, password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -1,10 +1,13 @@
-from flask import Blueprint, jsonify, request, make_response
+from flask import Blueprint, request, make_response
 from sqlalchemy import exc, or_
 import json
 
 from project.api.models import User
-from project import db, bcrypt
-from project.api.utils import authenticate
+from project import db, principal_cache, hashing_pool
+from project.api.hashing import HashingPoolFull
+from project.api.lookups import user_by_id, user_by_email
+from project.api.utils import authenticate, is_admin
+from project.api.serializers import jsonify
 
 login_blueprint = Blueprint('login', __name__)
 
@@ -38,8 +41,8 @@ def login_user():
 
     try:
         # get user from db
-        user = User.query.filter_by(email=email).first()
-        if user and bcrypt.check_password_hash(user.password, password): # use bcrypt to verify password
+        user = user_by_email.get(email=email)
+        if user and hashing_pool.check_password(user.password, password): # use bcrypt to verify password
             token = user.encode_jwt(user.id)                            # if authorized, create JWT
             if token:                                                   # if valid, return it
                 response['status'] = 'success'
@@ -49,6 +52,9 @@ def login_user():
         else:
             response['message'] = 'Username or password incorrect'
             return jsonify(response), 404
+    except HashingPoolFull:
+        response['message'] = 'Server busy, try again'
+        return jsonify(response), 503, {'Retry-After': str(hashing_pool.retry_after)}
     except Exception:
         response['message'] = 'Something went wrong'
         return jsonify(response), 500
@@ -56,7 +62,7 @@ def login_user():
 @login_blueprint.route('/login/me', methods=['GET'])
 @authenticate
 def current_user(sub):
-    user = User.query.filter_by(id=sub).first()
+    user = user_by_id.get(id=sub)
     response = {
         'status': 'success',
         'message': 'Success',
@@ -75,6 +81,18 @@ def signout_user(sub):
     }
     return jsonify(response), 200
 
+@login_blueprint.route('/login/cache', methods=['GET'])
+@authenticate
+def auth_cache_stats(sub):
+    """ Hit/miss counters of this worker's auth cache, admin only """
+    if not is_admin(sub):
+        return jsonify({'status': 'fail', 'message': 'Forbidden'}), 403
+    response = {
+        'status': 'success',
+        'data': principal_cache.stats()
+    }
+    return jsonify(response), 200
+
 @login_blueprint.route('/login/register', methods=['POST'])
 def register_user():
     response = {
@@ -96,7 +114,8 @@ def register_user():
     try:
         user = User.query.filter(or_(User.username == username, User.email == email)).first() # test if user with that username or email exists already
         if not user:
-            new_user = User(username=username, email=email, password=password) #  add new user
+            password_hash = hashing_pool.hash_password(password)
+            new_user = User(username=username, email=email, password_hash=password_hash) #  add new user
             db.session.add(new_user)
             db.session.commit() # commit to db
             # generate JWT
@@ -108,6 +127,9 @@ def register_user():
         else:
             response['message'] = 'User already exists'
             return jsonify(response), 400
+    except HashingPoolFull:
+        response['message'] = 'Server busy, try again'
+        return jsonify(response), 503, {'Retry-After': str(hashing_pool.retry_after)}
     except (exc.IntegrityError, ValueError):
         db.session.rollback()
         return jsonify(response), 400
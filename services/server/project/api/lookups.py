@@ -0,0 +1,70 @@
+# services/server/project/api/lookups.py
+from flask import current_app
+from sqlalchemy import and_, bindparam, inspect, text
+from sqlalchemy.ext import baked
+
+from project import db
+from project.api.models import User, Question
+
+bakery = baked.bakery()
+
+
+class Lookup:
+    """
+    A single row ORM lookup run on every request. The query is baked, so SQLAlchemy compiles
+    it once per process instead of rebuilding it per call, and unless SQLALCHEMY_PREPARED_STATEMENTS
+    is off or SQLALCHEMY_PGBOUNCER is on (a server connection isn't ours between transactions)
+    it also runs as a server side prepared statement, PREPAREd once per database connection.
+    """
+    def __init__(self, name, model, *columns):
+        self.name = name
+        self.model = model
+        self.params = [column.key for column in columns]
+        # the mapped columns a plain session.query(model) loads, in table order
+        mapper = inspect(model)
+        self.columns = [prop.columns[0] for prop in mapper.column_attrs if not prop.deferred]
+        where = and_(*[column == bindparam(column.key) for column in columns])
+        # name is part of the bakery's cache key, every Lookup shares these lambdas
+        self.query = bakery(lambda session: session.query(model), name) + (lambda query: query.filter(where))
+        execute = text(f'EXECUTE {name}(' + ', '.join(f':{param}' for param in self.params) + ')')
+        self.prepared_query = bakery(
+            lambda session: session.query(model).from_statement(execute.columns(*self.columns)),
+            name,
+            'prepared'
+        )
+        self.prepare_sql = 'PREPARE {0} AS SELECT {1} FROM {2} WHERE {3}'.format(
+            name,
+            ', '.join(column.name for column in self.columns),
+            model.__table__.name,
+            ' AND '.join(f'{column.name} = ${position}' for position, column in enumerate(columns, 1))
+        )
+
+    def use_prepared(self):
+        config = current_app.config
+        return config.get('SQLALCHEMY_PREPARED_STATEMENTS', True) and not config.get('SQLALCHEMY_PGBOUNCER')
+
+    def prepare(self, session):
+        """ PREPARE on the connection the lookup is about to run on, unless that connection already has """
+        connection = session.connection(mapper=inspect(self.model))
+        prepared = connection.connection.info.setdefault('prepared_statements', set())
+        if self.name not in prepared:
+            # straight through the DBAPI cursor, it is connection setup rather than a query of the request
+            cursor = connection.connection.cursor()
+            try:
+                cursor.execute(self.prepare_sql)
+            finally:
+                cursor.close()
+            prepared.add(self.name)
+
+    def get(self, **params):
+        """ The matching row or None """
+        session = db.session()
+        if self.use_prepared():
+            self.prepare(session)
+            return self.prepared_query(session).params(**params).one_or_none()
+        return self.query(session).params(**params).one_or_none()
+
+
+user_by_id = Lookup('user_by_id', User, User.id)
+user_by_email = Lookup('user_by_email', User, User.email)
+question_by_author = Lookup('question_by_author', Question, Question.id, Question.author_id)
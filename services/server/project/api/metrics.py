@@ -0,0 +1,54 @@
+# services/server/project/api/metrics.py
+from flask import Blueprint, current_app
+
+from project import db, principal_cache, question_json_cache, question_catalog, replica_router, slow_query_log
+from project.api.pagination import get_limit
+from project.api.pool import pool_stats
+from project.api.replica import REPLICA_BIND
+from project.api.utils import authenticate, is_admin
+from project.api.serializers import jsonify
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+@authenticate
+def metrics(sub):
+    """ Internal counters of the worker that answers, admins only """
+    if not is_admin(sub):
+        return jsonify({'status': 'fail', 'message': 'Forbidden'}), 403
+    response = {
+        'status': 'success',
+        'data': {
+            'pool': pool_stats(db.engine),
+            'auth_cache': principal_cache.stats(),
+            'question_json_cache': question_json_cache.stats(),
+            'question_catalog': question_catalog.stats()
+        }
+    }
+    if replica_router.configured(current_app):
+        response['data']['replica'] = dict(
+            replica_router.stats(),
+            pool=pool_stats(db.get_engine(current_app, bind=REPLICA_BIND))
+        )
+    return jsonify(response), 200
+
+@metrics_blueprint.route('/metrics/slow-queries', methods=['GET'])
+@authenticate
+def slow_queries(sub):
+    """ Statements over SLOW_QUERY_MS in this worker by total time, with their plans, admins only """
+    if not is_admin(sub):
+        return jsonify({'status': 'fail', 'message': 'Forbidden'}), 403
+    try:
+        limit = get_limit(20)
+    except ValueError:
+        return jsonify({'status': 'fail', 'message': 'Invalid query parameters'}), 400
+    response = {
+        'status': 'success',
+        'data': {
+            'enabled': current_app.config['SLOW_QUERY_LOG'],
+            'threshold_ms': current_app.config['SLOW_QUERY_MS'],
+            'statements': slow_query_log.top(limit)
+        }
+    }
+    return jsonify(response), 200
@@ -1,12 +1,22 @@
-from sqlalchemy.sql import func
+from sqlalchemy import event, DDL
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import validates
+from sqlalchemy.sql import func, literal_column
+from sqlalchemy.types import TypeDecorator
 
 from project import db, bcrypt
+from project.api.timing import timed
 from flask import current_app
 import jwt
 import datetime
 
 class User(db.Model):  
     __tablename__ = 'users'
+    __table_args__ = (
+        # ?active=false and ?admin=true keyset pages, the common rows need no index beyond the pkey
+        db.Index('ix_users_inactive_id', 'id', postgresql_where=db.text('NOT active')),
+        db.Index('ix_users_admin_id', 'id', postgresql_where=db.text('admin')),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username = db.Column(db.String(128), unique=True, nullable=False)
     email = db.Column(db.String(128), unique=True, nullable=False)
@@ -16,15 +26,25 @@ class User(db.Model):
     admin = db.Column(db.Boolean, default=False, nullable=False)
     questions_authored = db.relationship("Question", back_populates="author")
 
-    def __init__(self, username, email, password, active=True, admin=False, questions_authored=[]):
+    # what to_json can return, also the names accepted by ?fields=
+    JSON_FIELDS = ('id', 'username', 'email', 'active', 'admin')
+    # what PUT/PATCH /users/<id> may change, admin only by admins
+    EDITABLE_FIELDS = ('username', 'email', 'active', 'admin')
+
+    def __init__(self, username, email, password=None, active=True, admin=False, questions_authored=[], password_hash=None):
         self.username = username
         self.email = email
-        self.password = bcrypt.generate_password_hash(password, current_app.config.get('BCRYPT_LOG_ROUNDS')).decode(),
+        # callers that hashed off the request path (see api/hashing.py) pass password_hash
+        if password_hash is None:
+            password_hash = bcrypt.generate_password_hash(password, current_app.config.get('BCRYPT_LOG_ROUNDS')).decode()
+        self.password = password_hash
         self.active = active
         self.admin = admin
         self.questions_authored = questions_authored
 
-    def to_json(self):
+    def to_json(self, fields=None):
+        if fields is not None:
+            return {field: getattr(self, field) for field in fields}
         return {
             'id': self.id,
             'username': self.username,
@@ -45,11 +65,12 @@ class User(db.Model):
                 'iat': datetime.datetime.utcnow(),
                 'sub': user_id,
             }
-            return jwt.encode(
-                payload,
-                current_app.config.get('SECRET_KEY'),
-                algorithm='HS256'
-            )
+            with timed('jwt'):
+                return jwt.encode(
+                    payload,
+                    current_app.config.get('SECRET_KEY'),
+                    algorithm='HS256'
+                )
         except Exception as e:
             return e
 
@@ -58,15 +79,48 @@ class User(db.Model):
     def decode_jwt(token):
         """ Decode JWT """
         try:
-            payload = jwt.decode(token, current_app.config.get('SECRET_KEY'))
+            with timed('jwt'):
+                payload = jwt.decode(token, current_app.config.get('SECRET_KEY'))
             return payload['sub']
         except jwt.ExpiredSignatureError:
             return 'Please log in again.'
         except jwt.InvalidTokenError:
             return 'Unauthorized'
 
+# difficulty is stored as a smallint code, ordered so sorting by code sorts by difficulty
+DIFFICULTIES = ('Easy', 'Moderate', 'Hard')
+
+def normalize_difficulty(value):
+    """ Canonical difficulty name for value (case insensitive), ValueError if unknown """
+    for name in DIFFICULTIES:
+        if isinstance(value, str) and value.lower() == name.lower():
+            return name
+    raise ValueError(f'Unknown difficulty {value!r}')
+
+class Difficulty(TypeDecorator):
+    """ 'Easy'/'Moderate'/'Hard' in python, 1/2/3 in postgres """
+    impl = db.SmallInteger
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return DIFFICULTIES.index(normalize_difficulty(value)) + 1
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return DIFFICULTIES[value - 1]
+
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        # author lookups and /questions/user keyset pages
+        db.Index('ix_questions_author_id_id', 'author_id', 'id'),
+        # ?difficulty= filtered keyset pages
+        db.Index('ix_questions_difficulty_id', 'difficulty', 'id'),
+        # /questions/search
+        db.Index('ix_questions_search_vector', 'search_vector', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -74,8 +128,14 @@ class Question(db.Model):
     body = db.Column(db.String, nullable=False)
     test_code = db.Column(db.String, nullable=False)
     test_solution = db.Column(db.String, nullable=False)
-    difficulty = db.Column(db.String, nullable=False)
+    difficulty = db.Column(Difficulty, nullable=False)
+    # first characters of body for list views, only selected when asked for
+    preview = db.column_property(func.substr(body, 1, 100), deferred=True)
+    # full text index of body, kept up to date by the questions_search_vector trigger
+    search_vector = db.deferred(db.Column(TSVECTOR))
 
+    JSON_FIELDS = ('id', 'author_id', 'body', 'test_code', 'test_solution', 'difficulty', 'preview')
+    EDITABLE_FIELDS = ('body', 'test_code', 'test_solution', 'difficulty')
 
     def __init__(self, author_id, body, test_code, test_solution, difficulty):
         self.author_id = author_id
@@ -84,7 +144,13 @@ class Question(db.Model):
         self.test_solution = test_solution
         self.difficulty = difficulty
 
-    def to_json(self):
+    @validates('difficulty')
+    def validate_difficulty(self, key, value):
+        return normalize_difficulty(value)
+
+    def to_json(self, fields=None):
+        if fields is not None:
+            return {field: getattr(self, field) for field in fields}
         return {
             'id': self.id,
             'author_id': self.author_id,
@@ -93,3 +159,107 @@ class Question(db.Model):
             'test_solution': self.test_solution,
             'difficulty': self.difficulty
         }
+
+# id of the transaction that last wrote the row, so it changes with every update. Postgres keeps
+# it in the row header, no column or trigger needed. Keys the cached json of a question
+QUESTION_ROW_VERSION = literal_column('questions.xmin::text').label('version')
+
+
+class TableVersion(db.Model):
+    """ Version counter per table, bumped by a trigger on every write statement. Used for ETags """
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, default=0, nullable=False)
+
+
+class QuestionChange(db.Model):
+    """ Ids of written questions in write order, filled by triggers. The per worker question catalog replays it """
+    __tablename__ = 'question_changes'
+
+    seq = db.Column(db.BigInteger, primary_key=True)
+    question_id = db.Column(db.Integer) # NULL for a TRUNCATE, every question changed
+    changed_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+VERSIONED_TABLES = (User.__table__, Question.__table__)
+
+# statement level, so a bulk insert/COPY bumps the version once instead of once per row
+bump_table_version = DDL("""
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""")
+event.listen(db.metadata, 'before_create', bump_table_version.execute_if(dialect='postgresql'))
+
+for table in VERSIONED_TABLES:
+    event.listen(table, 'after_create', DDL(
+        "CREATE TRIGGER %(table)s_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %(table)s "
+        "FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()"
+    ).execute_if(dialect='postgresql'))
+
+# statement level with transition tables, a bulk insert logs its ids in one INSERT ... SELECT
+log_question_changes = DDL("""
+CREATE OR REPLACE FUNCTION log_question_changes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        INSERT INTO question_changes (question_id) VALUES (NULL);
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO question_changes (question_id) SELECT id FROM old_rows;
+    ELSE
+        INSERT INTO question_changes (question_id) SELECT id FROM new_rows;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""")
+event.listen(db.metadata, 'before_create', log_question_changes.execute_if(dialect='postgresql'))
+
+# a trigger with transition tables can only fire for one event. Triggers fire in name order,
+# so these run after questions_version: the seq is taken while this transaction holds the
+# table_versions row lock, and seqs become visible in the order they were handed out
+QUESTION_CHANGE_TRIGGERS = (
+    "CREATE TRIGGER questions_version_log_insert AFTER INSERT ON questions REFERENCING NEW TABLE AS new_rows "
+    "FOR EACH STATEMENT EXECUTE PROCEDURE log_question_changes()",
+    "CREATE TRIGGER questions_version_log_update AFTER UPDATE ON questions REFERENCING NEW TABLE AS new_rows "
+    "FOR EACH STATEMENT EXECUTE PROCEDURE log_question_changes()",
+    "CREATE TRIGGER questions_version_log_delete AFTER DELETE ON questions REFERENCING OLD TABLE AS old_rows "
+    "FOR EACH STATEMENT EXECUTE PROCEDURE log_question_changes()",
+    "CREATE TRIGGER questions_version_log_truncate AFTER TRUNCATE ON questions "
+    "FOR EACH STATEMENT EXECUTE PROCEDURE log_question_changes()",
+)
+for trigger in QUESTION_CHANGE_TRIGGERS:
+    event.listen(Question.__table__, 'after_create', DDL(trigger).execute_if(dialect='postgresql'))
+
+# postgres 11 has no generated columns, the builtin trigger recomputes the vector
+# for the inserted or updated row only
+SEARCH_CONFIG = 'pg_catalog.english'
+event.listen(Question.__table__, 'after_create', DDL(
+    "CREATE TRIGGER questions_search_vector BEFORE INSERT OR UPDATE OF body ON questions "
+    "FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, '%s', body)" % SEARCH_CONFIG
+).execute_if(dialect='postgresql'))
+
+# ?q= substring search on /users, trigram indexes let ILIKE '%term%' skip the seq scan.
+# pg_trgm ships with postgres contrib, the migration requires it while create_all
+# (tests, local databases) only adds the indexes when the extension is available
+USER_TRIGRAM_INDEXES = DDL("""
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX ix_users_username_trgm ON users USING gin (username gin_trgm_ops);
+        CREATE INDEX ix_users_email_trgm ON users USING gin (email gin_trgm_ops);
+    END IF;
+END
+$$
+""")
+event.listen(User.__table__, 'after_create', USER_TRIGRAM_INDEXES.execute_if(dialect='postgresql'))
+
+event.listen(TableVersion.__table__, 'after_create', DDL(
+    "INSERT INTO table_versions (name, version) VALUES %s" % ', '.join(
+        "('%s', 0)" % table.name for table in VERSIONED_TABLES
+    )
+))
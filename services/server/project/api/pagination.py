@@ -0,0 +1,84 @@
+# services/server/project/api/pagination.py
+import base64
+import json
+
+from flask import current_app, request
+from sqlalchemy import func, select
+
+from project import db
+
+
+def encode_cursor(*values):
+    """ Opaque keyset cursor, clients just hand it back """
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+    """ Returns the keyset values stored in a cursor, ValueError if it was tampered with """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+def get_limit(default=None):
+    """ Page size from ?limit=, defaults to PAGINATION_NUMBER and is capped at PAGINATION_MAX """
+    limit = int(request.args.get('limit', default or current_app.config['PAGINATION_NUMBER']))
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    return min(limit, current_app.config['PAGINATION_MAX'])
+
+def wants_count():
+    return request.args.get('count', '').lower() in ('1', 'true', 'yes')
+
+def bool_arg(name):
+    """ ?name=true/false as a bool, None when the parameter isn't given """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'Invalid {name}')
+
+def cursor_key():
+    """ The key keyset_rows stored in ?cursor=, None on the first page """
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return None
+    values = decode_cursor(cursor)
+    if len(values) != 1 or not isinstance(values[0], int):
+        raise ValueError('Invalid cursor')
+    return values[0]
+
+def keyset_rows(columns, column, limit, conditions=()):
+    """
+    One page of a Core select of columns ordered by the unique column, starting after ?cursor=.
+    Fetches a single extra row to know whether there is a next page. Lists are read only,
+    so rows come back as dicts keyed by column name rather than hydrated ORM objects.
+    Returns (rows, next_cursor)
+    """
+    conditions = list(conditions)
+    after = cursor_key()
+    if after is not None:
+        conditions.append(column > after)
+    names = [selected.key for selected in columns]
+    # the cursor needs the key column even when the client didn't ask for it
+    statement = select(columns if column.key in names else columns + [column])
+    for condition in conditions:
+        statement = statement.where(condition)
+    rows = db.session.execute(statement.order_by(column).limit(limit + 1)).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][column])
+    return [dict(zip(names, row)) for row in rows], next_cursor
+
+def count_rows(table, conditions=()):
+    """ Number of rows of table matching conditions, for ?count=true """
+    statement = select([func.count()]).select_from(table)
+    for condition in conditions:
+        statement = statement.where(condition)
+    return db.session.execute(statement).scalar()
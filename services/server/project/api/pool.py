@@ -0,0 +1,102 @@
+# services/server/project/api/pool.py
+import threading
+import time
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool, NullPool
+
+
+def pool_size_for(workers, threads, max_connections):
+    """
+    (pool_size, max_overflow) of one gunicorn worker. Every thread keeps a pooled connection
+    and all workers together never open more than max_connections
+    """
+    per_worker = max(1, max_connections // max(1, workers))
+    pool_size = max(1, min(threads, per_worker))
+    return pool_size, per_worker - pool_size
+
+
+class PoolStats:
+    """ Checkout counters of a TimedQueuePool """
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def as_dict(self):
+        return {
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'wait_total_ms': round(self.wait_total * 1000, 3),
+            'wait_avg_ms': round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 3)
+        }
+
+
+class TimedQueuePool(QueuePool):
+    """ QueuePool that records how long each checkout waited, including connecting """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.monotonic() - started, timed_out=True)
+            raise
+        self.stats.record(time.monotonic() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool, keep counting where this one left off
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy 2.3 only forwards pool size, overflow, timeout and recycle.
+    This adds pre-ping, the timed pool, and SQLALCHEMY_PGBOUNCER for running behind
+    pgbouncer in transaction mode, where pgbouncer does the pooling
+    """
+    def apply_pool_defaults(self, app, options):
+        super().apply_pool_defaults(app, options)
+        if app.config.get('SQLALCHEMY_PGBOUNCER'):
+            # a server connection only belongs to us for one transaction, don't hold any
+            for option in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle'):
+                options.pop(option, None)
+            options['poolclass'] = NullPool
+            return
+        options['poolclass'] = TimedQueuePool
+        options['pool_pre_ping'] = app.config.get('SQLALCHEMY_POOL_PRE_PING', True)
+
+
+def pool_stats(engine):
+    """ Size and checkout statistics of the engine's pool in this worker """
+    pool = engine.pool
+    stats = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'timeout': pool.timeout(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(0, pool.overflow())
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update(pool.stats.as_dict())
+    return stats
@@ -1,13 +1,175 @@
-from sqlalchemy import exc, func
-from flask import Blueprint, request
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import exc, func, and_, or_, cast, select, Numeric
+from flask import Blueprint, request, current_app
 from flask_restful import Resource, Api
 
-from project import db
-from project.api.models import Question
+from project import db, question_catalog, question_json_cache
+from project.api.models import Question, normalize_difficulty, DIFFICULTIES, QUESTION_ROW_VERSION, SEARCH_CONFIG
 from project.api.utils import authenticate_restful, is_admin, is_same_user
+from project.api.lookups import question_by_author
+from project.api.pagination import get_limit, keyset_rows, count_rows, wants_count, encode_cursor, decode_cursor, cursor_key
+from project.api.bulk import read_records, import_questions, FORMATS as BULK_FORMATS
+from project.api.fields import get_fields, only_fields, update_values, returning_columns, json_columns
+from project.api.serializers import output_json, fragments_response, dumps
+from project.api.etag import table_etag, versions_etag, not_modified, etag_header
 
 questions_blueprint = Blueprint('questions', __name__)
 api = Api(questions_blueprint)
+api.representation('application/json')(output_json)
+
+def question_filter_args():
+    """ (difficulty, author_id) of the ?difficulty= and ?author_id= filters, None for those not given """
+    difficulty = request.args.get('difficulty')
+    author_id = request.args.get('author_id')
+    return normalize_difficulty(difficulty) if difficulty else None, int(author_id) if author_id else None
+
+def question_filters():
+    """ Conditions of the ?difficulty= and ?author_id= filters shared by the list endpoints """
+    conditions = []
+    difficulty, author_id = question_filter_args()
+    if difficulty:
+        conditions.append(Question.difficulty == difficulty)
+    if author_id is not None:
+        conditions.append(Question.author_id == author_id)
+    return conditions
+
+def filter_questions(query):
+    return query.filter(*question_filters())
+
+def question_fragments(keys, fields):
+    """
+    Encoded to_json(fields) of each (id, version) in keys, from question_json_cache. The misses
+    are read in one query and cached under the version that query saw, a question deleted
+    in between is left out
+    """
+    fragments = question_json_cache.get_many([(row_id, version, fields) for row_id, version in keys])
+    missing = [row_id for (row_id, _), fragment in zip(keys, fragments) if fragment is None]
+    if not missing:
+        return fragments
+    questions = Question.__table__
+    columns = json_columns(Question, fields)
+    names = [column.key for column in columns]
+    read = {}
+    rows = db.session.execute(
+        select(columns + [questions.c.id.label('row_id'), QUESTION_ROW_VERSION]).where(questions.c.id.in_(missing))
+    )
+    for row in rows:
+        read[row.row_id] = dumps(dict(zip(names, row)))
+        question_json_cache.set((row.row_id, row.version, fields), read[row.row_id])
+    fragments = [read.get(row_id) if fragment is None else fragment for (row_id, _), fragment in zip(keys, fragments)]
+    return [fragment for fragment in fragments if fragment is not None]
+
+def question_page(conditions, count_key):
+    """
+    Keyset paginated list response with every question as an encoded json fragment, see
+    serializers.fragments_response. Only the (id, version) keys of a page are selected when
+    question_json_cache is on, the columns of questions it doesn't hold are read after.
+    No Question objects are hydrated. The total is only counted when asked for with ?count=true
+    """
+    fields = get_fields(Question)
+    questions = Question.__table__
+    if question_json_cache.enabled:
+        keys, next_cursor = keyset_rows([questions.c.id, QUESTION_ROW_VERSION], questions.c.id, get_limit(), conditions)
+        fragments = question_fragments([(key['id'], key['version']) for key in keys], fields)
+    else:
+        rows, next_cursor = keyset_rows(json_columns(Question, fields), questions.c.id, get_limit(), conditions)
+        fragments = [dumps(row) for row in rows]
+    data = {
+        'questions': fragments,
+        'next_cursor': next_cursor
+    }
+    if wants_count():
+        data[count_key] = count_rows(Question.__table__, conditions)
+    return data
+
+def catalog_page(count_key, author=None):
+    """
+    question_page answered from the worker's question_catalog, refreshed by the caller.
+    author narrows it to one author's questions like /questions/user does. Only text the
+    catalog doesn't hold yet costs a query
+    """
+    fields = get_fields(Question)
+    limit = get_limit()
+    difficulty, author_id = question_filter_args()
+    difficulty = DIFFICULTIES.index(difficulty) + 1 if difficulty else None
+    # ?author_id= of someone else on /questions/user matches nothing
+    conflicting = author is not None and author_id not in (None, author)
+    if author is not None:
+        author_id = author
+    entries, next_key = ([], None) if conflicting else question_catalog.page(difficulty, author_id, cursor_key(), limit)
+    data = {
+        'questions': [dumps(row) for row in question_catalog.rows(entries, fields)],
+        'next_cursor': encode_cursor(next_key) if next_key is not None else None
+    }
+    if wants_count():
+        data[count_key] = 0 if conflicting else question_catalog.count(difficulty, author_id)
+    return data
+
+def search_page(query, terms):
+    """
+    One page of matches ordered by rank then id. The rank is rounded to numeric so the
+    (rank, id) keyset stored in the cursor compares exactly on the next request
+    """
+    fields = get_fields(Question)
+    limit = get_limit()
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, terms)
+    rank = func.round(cast(func.ts_rank(Question.search_vector, tsquery), Numeric), 6).label('rank')
+    query = query.filter(Question.search_vector.op('@@')(tsquery))
+    page = only_fields(query, Question, fields).add_columns(rank)
+    cursor = request.args.get('cursor')
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 2 or not isinstance(values[1], int):
+            raise ValueError('Invalid cursor')
+        last_rank, last_id = values
+        try:
+            last_rank = Decimal(str(last_rank))
+        except InvalidOperation:
+            raise ValueError('Invalid cursor')
+        page = page.filter(or_(rank < last_rank, and_(rank == last_rank, Question.id > last_id)))
+    rows = page.order_by(rank.desc(), Question.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(str(rows[-1].rank), rows[-1].Question.id)
+    questions = []
+    for question, question_rank in rows:
+        question_json = question.to_json(fields)
+        question_json['rank'] = float(question_rank)
+        questions.append(question_json)
+    data = {
+        'questions': questions,
+        'next_cursor': next_cursor
+    }
+    if wants_count():
+        data['num_question'] = query.with_entities(func.count(Question.id)).scalar()
+    return data
+
+def pick_question(difficulty, exclude_author, fields, attempts=3):
+    """
+    Json of a random question drawn from the question catalog's per difficulty id arrays, so the
+    cost doesn't grow with the table. Unless the catalog serves the lists too the row itself is
+    read from the database, which also catches a pick another worker changed a moment ago
+    """
+    code = DIFFICULTIES.index(difficulty) + 1 if difficulty else None
+    question_catalog.refresh()
+    if question_catalog.enabled():
+        entry = question_catalog.sample(code, exclude_author)
+        rows = question_catalog.rows([entry], fields) if entry else []
+        return rows[0] if rows else None
+    for _ in range(attempts):
+        entry = question_catalog.sample(code, exclude_author)
+        if entry is None:
+            return None
+        query = only_fields(Question.query, Question, fields).filter(Question.id == entry[0])
+        if difficulty:
+            query = query.filter(Question.difficulty == difficulty)
+        if exclude_author is not None:
+            query = query.filter(Question.author_id != exclude_author)
+        question = query.first()
+        if question:
+            return question.to_json(fields)
+    return None
 
 class QuestionList(Resource):
     method_decorators = {'post': [authenticate_restful], 'get': [authenticate_restful]}
@@ -15,17 +177,22 @@ class QuestionList(Resource):
 
     def get(self, sub):
         """ Need to be authenticated, but not admin to see all questions """
-        num_questions = db.session.query(func.count(Question.id)).scalar()
-        response = {
-            'status': 'success',
-            'data': {
-                'num_question': num_questions,
-                'questions': [
-                    question.to_json() for question in Question.query.all()
-                ]
-            }
-        }
-        return response, 200
+        catalog = question_catalog.enabled()
+        if catalog:
+            etag = versions_etag([('questions', question_catalog.refresh())])
+        else:
+            etag = table_etag('questions')
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        try:
+            if catalog:
+                data = catalog_page('num_question')
+            else:
+                data = question_page(question_filters(), 'num_question')
+        except ValueError:
+            return {'status': 'fail', 'message': 'Invalid query parameters'}, 400
+        return fragments_response(data, 'questions', etag_header(etag))
 
     def post(self, sub):
         """ Add question """
@@ -62,22 +229,103 @@ class QuestionList(Resource):
             db.session.rollback()
             return response, 400
 
-class AllQuestionsByAuthenticatedUser(Resource):
+class QuestionBulk(Resource):
+    method_decorators = {'post': [authenticate_restful]}
+
+    def post(self, sub):
+        """ Admin only import of a streamed NDJSON or CSV body, one question per line/row """
+        response = {
+            'status': 'fail',
+            'message': 'Forbidden'
+        }
+        if not is_admin(sub):
+            return response, 403
+        if request.mimetype not in BULK_FORMATS:
+            response['message'] = 'Send application/x-ndjson or text/csv'
+            return response, 415
+        try:
+            records = read_records(request.stream, request.mimetype)
+        except ValueError as e:
+            response['message'] = str(e)
+            return response, 400
+        report = import_questions(
+            records,
+            int(sub),
+            batch_size=current_app.config['BULK_IMPORT_BATCH'],
+            max_errors=current_app.config['BULK_IMPORT_MAX_ERRORS']
+        )
+        response = {
+            'status': 'success',
+            'data': report
+        }
+        return response, 200
+
+class QuestionSearch(Resource):
     method_decorators = {'get': [authenticate_restful]}
 
     def get(self, sub):
-        """ Get all questions for logged in user """
-        questions = Question.query.filter_by(author_id=int(sub)).all()
+        """ Full text search over question bodies, best match first """
+        terms = request.args.get('q', '').strip()
+        if not terms:
+            return {'status': 'fail', 'message': 'Missing search terms'}, 400
+        etag = table_etag('questions')
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        try:
+            data = search_page(filter_questions(Question.query), terms)
+        except ValueError:
+            return {'status': 'fail', 'message': 'Invalid query parameters'}, 400
         response = {
             'status': 'success',
-            'data': {
-                'questions': [question.to_json() for question in questions]
-            }
+            'data': data
         }
-        return response, 200
+        return response, 200, etag_header(etag)
+
+class RandomQuestion(Resource):
+    method_decorators = {'get': [authenticate_restful]}
+
+    def get(self, sub):
+        """ Random question for practice mode, filtered by ?difficulty= and ?exclude_author= """
+        response = {
+            'status': 'fail',
+            'message': 'Question does not exist'
+        }
+        try:
+            fields = get_fields(Question)
+            difficulty = request.args.get('difficulty')
+            difficulty = normalize_difficulty(difficulty) if difficulty else None
+            exclude_author = request.args.get('exclude_author')
+            exclude_author = int(exclude_author) if exclude_author else None
+        except ValueError:
+            return {'status': 'fail', 'message': 'Invalid query parameters'}, 400
+        question = pick_question(difficulty, exclude_author, fields)
+        if not question:
+            return response, 404
+        response = {
+            'status': 'success',
+            'data': question
+        }
+        # a new pick on every request, never reuse it
+        return response, 200, {'Cache-Control': 'no-store'}
+
+class AllQuestionsByAuthenticatedUser(Resource):
+    method_decorators = {'get': [authenticate_restful]}
+
+    def get(self, sub):
+        """ Get all questions for logged in user """
+        try:
+            if question_catalog.enabled():
+                question_catalog.refresh()
+                data = catalog_page('num_question', author=int(sub))
+            else:
+                data = question_page(question_filters() + [Question.author_id == int(sub)], 'num_question')
+        except ValueError:
+            return {'status': 'fail', 'message': 'Invalid query parameters'}, 400
+        return fragments_response(data, 'questions')
 
 class QuestionByUser(Resource):
-    method_decorators = {'get': [authenticate_restful], 'put': [authenticate_restful], 'delete': [authenticate_restful]}
+    method_decorators = {'get': [authenticate_restful], 'put': [authenticate_restful], 'patch': [authenticate_restful], 'delete': [authenticate_restful]}
 
     def get(self, sub, user_id, question_id):
         """ Get single question by user id """
@@ -89,24 +337,45 @@ class QuestionByUser(Resource):
             response['message'] = 'You do not have permission to view this question'
             return response, 403
         try:
-            question = Question.query.filter_by(
-                id=int(question_id),
-                author_id=int(user_id)
-            ).first()
+            fields = get_fields(Question)
+        except ValueError:
+            return {'status': 'fail', 'message': 'Invalid query parameters'}, 400
+        etag = table_etag('questions')
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        try:
+            if fields is None:
+                question = question_by_author.get(id=int(question_id), author_id=int(user_id))
+            else:
+                question = only_fields(Question.query, Question, fields).filter_by(
+                    id=int(question_id),
+                    author_id=int(user_id)
+                ).first()
             if not question:
                 return response, 404
             else:
                 response = {
                     'status': 'success',
-                    'data': question.to_json()
+                    'data': question.to_json(fields)
                 }
-                return response, 200
+                return response, 200, etag_header(etag)
         except ValueError:
             return response, 404
 
     def put(self, sub, user_id, question_id):
-        """ Update question_id, must be admin or the correct user """
-        put_data = request.get_json()
+        """
+        Legacy alias of PATCH kept for existing clients: only the fields sent are updated, it is
+        not a full replace. Answers 201 where PATCH answers 200, must be admin or the correct user
+        """
+        return self.update(sub, user_id, question_id, 201)
+
+    def patch(self, sub, user_id, question_id):
+        """ Update only the fields sent for question_id, must be admin or the correct user """
+        return self.update(sub, user_id, question_id, 200)
+
+    def update(self, sub, user_id, question_id, code):
+        """ Whitelisted columns set by a single UPDATE ... RETURNING """
         response = {
             'status': 'fail',
             'message': 'Question does not exist'
@@ -116,27 +385,35 @@ class QuestionByUser(Resource):
             response['message'] = 'You do not have permission to update this question'
             return response, 403
         try:
-            question = Question.query.filter_by(
-                id=int(question_id),
-                author_id=int(user_id)
+            values = update_values(Question, request.get_json())
+            if 'difficulty' in values:
+                values['difficulty'] = normalize_difficulty(values['difficulty'])
+        except ValueError:
+            response['message'] = 'Invalid payload'
+            return response, 400
+        questions = Question.__table__
+        try:
+            question = db.session.execute(
+                questions.update().where(and_(
+                    questions.c.id == int(question_id),
+                    questions.c.author_id == int(user_id)
+                )).values(**values).returning(*returning_columns(Question))
             ).first()
-            if not question:
-                return response, 404
-            else:
-                for key, value in put_data.items():
-                    setattr(question, key, value)
-                db.session.commit()
-                updated_question = Question.query.filter_by(
-                    id=int(question_id),
-                    author_id=int(user_id)
-                ).first()
-                put_response = {
-                    'status': 'success',
-                    'data': updated_question.to_json()
-                }
-                return put_response, 201
+            db.session.commit()
         except ValueError:
             return response, 404
+        except exc.StatementError:
+            db.session.rollback()
+            response['message'] = 'Invalid payload'
+            return response, 400
+        if not question:
+            return response, 404
+        question_json_cache.invalidate(question['id'])
+        put_response = {
+            'status': 'success',
+            'data': dict(question)
+        }
+        return put_response, code
 
     def delete(self, sub, user_id, question_id):
         """ Delete question_id, must be admin or the correct user """
@@ -147,31 +424,29 @@ class QuestionByUser(Resource):
         if not is_admin(sub) and not is_same_user(sub, user_id):
             response['message'] = 'You do not have permission to delete this question'
             return response, 403
+        questions = Question.__table__
         try:
-            question = Question.query.filter_by(
-                id=int(question_id),
-                author_id=int(user_id)
+            deleted = db.session.execute(
+                questions.delete().where(and_(
+                    questions.c.id == int(question_id),
+                    questions.c.author_id == int(user_id)
+                )).returning(questions.c.id)
             ).first()
-            if not question:
-                return response, 404
-            else:
-                db.session.query(Question).filter(Question.id==int(question_id)).delete()
-                db.session.commit()
-                # get updated object
-                deleted_question = Question.query.filter_by(id=int(question_id)).first()
-                if not deleted_question:
-                    delete_response = {
-                        "status": "success",
-                        "message": "Deleted"
-                    }
-                    return delete_response, 204
-                else:
-                    response['message'] = 'Server error'
-                    return response, 500
-
+            db.session.commit()
         except ValueError:
             return response, 404
+        if not deleted:
+            return response, 404
+        question_json_cache.invalidate(deleted[0])
+        delete_response = {
+            "status": "success",
+            "message": "Deleted"
+        }
+        return delete_response, 204
 
 api.add_resource(QuestionList, '/questions')
+api.add_resource(QuestionBulk, '/questions/bulk')
+api.add_resource(QuestionSearch, '/questions/search')
+api.add_resource(RandomQuestion, '/questions/random')
 api.add_resource(AllQuestionsByAuthenticatedUser, '/questions/user')
 api.add_resource(QuestionByUser, '/questions/<question_id>/user/<user_id>')
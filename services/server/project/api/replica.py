@@ -0,0 +1,170 @@
+# services/server/project/api/replica.py
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+import jwt
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import exc, orm, text
+from sqlalchemy.sql.dml import UpdateBase
+
+from project.api.cache import LRUCache
+from project.api.pool import PooledSQLAlchemy
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# 0 on a caught up standby (or a server that isn't one), otherwise seconds since the last replayed commit
+LAG_QUERY = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+
+class ReplicaRouter:
+    """
+    Decides per request whether reads go to the replica bind (SQLALCHEMY_BINDS['replica']).
+    Only read only requests use it, and not when the user wrote within REPLICA_STICKY_SECONDS
+    (tracked per worker by user id and across workers by a cookie) or when the replica is
+    further behind than REPLICA_MAX_LAG. Lag is measured at most every REPLICA_LAG_CHECK seconds.
+    """
+    def __init__(self, sticky_seconds=5, max_lag=5, lag_check=1, maxsize=4096):
+        self.sticky_seconds = sticky_seconds
+        self.max_lag = max_lag
+        self.lag_check = lag_check
+        self.cookie = 'read_primary'
+        self.lag = 0.0
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._sticky = LRUCache(maxsize)
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.db = db
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', self.sticky_seconds)
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', self.max_lag)
+        self.lag_check = app.config.get('REPLICA_LAG_CHECK', self.lag_check)
+        self.cookie = app.config.get('REPLICA_STICKY_COOKIE', self.cookie)
+        app.extensions['replica_router'] = self
+        app.after_request(self.after_request)
+
+    @staticmethod
+    def configured(app):
+        return REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+    def measure_lag(self, engine):
+        """ Seconds the replica is behind, inf if it can't be reached """
+        try:
+            with engine.connect() as connection:
+                return float(connection.execute(LAG_QUERY).scalar())
+        except exc.DBAPIError:
+            logger.exception('Replica lag check failed, reading from the primary')
+            return math.inf
+
+    def current_lag(self, engine):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.lag_check:
+            return self.lag
+        # one thread measures, the others keep using the last value meanwhile
+        if self._lock.acquire(blocking=False):
+            try:
+                self.lag = self.measure_lag(engine)
+                self._checked_at = time.monotonic()
+            finally:
+                self._lock.release()
+        return self.lag
+
+    def request_user(self):
+        """ User id the request claims, a routing hint only so the token isn't verified here """
+        try:
+            token = request.headers['Authorization'].split(' ')[1]
+            return int(jwt.decode(token, verify=False)['sub'])
+        except (KeyError, IndexError, ValueError, jwt.InvalidTokenError):
+            return None
+
+    def is_sticky(self):
+        if request.cookies.get(self.cookie):
+            return True
+        user_id = self.request_user()
+        return user_id is not None and self._sticky.get(user_id) is not None
+
+    def use_replica(self, app):
+        """ Whether the current request reads from the replica, decided once per request """
+        if not has_request_context() or request.method not in READ_METHODS or not self.configured(app):
+            return False
+        decision = request.environ.get('project.read_replica')
+        if decision is None:
+            engine = self.db.get_engine(app, bind=REPLICA_BIND)
+            decision = not self.is_sticky() and self.current_lag(engine) <= self.max_lag
+            request.environ['project.read_replica'] = decision
+            if decision:
+                self.replica_reads += 1
+            else:
+                self.primary_reads += 1
+        return decision
+
+    def after_request(self, response):
+        # the writer reads from the primary until the replica has surely replayed the write
+        if request.method not in READ_METHODS and response.status_code < 400 and self.configured(current_app):
+            user_id = self.request_user()
+            if user_id is not None:
+                self._sticky.set(user_id, True, self.sticky_seconds)
+            response.set_cookie(self.cookie, '1', max_age=self.sticky_seconds, httponly=True)
+        return response
+
+    def clear(self):
+        self._sticky.clear()
+        self.lag = 0.0
+        self._checked_at = None
+        self.replica_reads = 0
+        self.primary_reads = 0
+
+    def stats(self):
+        return {
+            'lag_seconds': self.lag if math.isfinite(self.lag) else None,
+            'max_lag': self.max_lag,
+            'replica_reads': self.replica_reads,
+            'primary_reads': self.primary_reads,
+            'sticky_users': self._sticky.stats()['size']
+        }
+
+
+def read_primary(fn):
+    """ Keep every read of the request on the primary, for answers that must agree with its sequences """
+    @wraps(fn)
+    def decorated(*args, **kwargs):
+        request.environ['project.read_replica'] = False
+        return fn(*args, **kwargs)
+    return decorated
+
+
+class RoutingSession(SignallingSession):
+    """ Sends the reads of read only requests to the replica, flushes and DML always to the primary """
+    def get_bind(self, mapper=None, clause=None):
+        if mapper is not None and mapper.persist_selectable.info.get('bind_key'):
+            return super().get_bind(mapper, clause)
+        if self._flushing or isinstance(clause, UpdateBase):
+            return super().get_bind(mapper, clause)
+        router = self.app.extensions['replica_router']
+        if router.use_replica(self.app):
+            return router.db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(PooledSQLAlchemy):
+    """ PooledSQLAlchemy whose session routes reads through the app's ReplicaRouter """
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def _execute_for_all_tables(self, app, bind, operation, skip_tables=False):
+        # create_all/drop_all must never run the schema's DDL against the read only replica
+        if bind == '__all__':
+            app = self.get_app(app)
+            bind = [None] + [key for key in app.config.get('SQLALCHEMY_BINDS') or () if key != REPLICA_BIND]
+        super()._execute_for_all_tables(app, bind, operation, skip_tables)
@@ -0,0 +1,58 @@
+# services/server/project/api/serializers.py
+import json
+
+from flask import current_app, jsonify as flask_jsonify
+from flask_restful.representations.json import output_json as restful_output_json
+
+from project.api.timing import timed
+
+try:
+    import orjson
+except ImportError: # optional, the stdlib encoder is used without it
+    orjson = None
+
+
+def fast_json_enabled():
+    """ True when JSON_BACKEND asks for orjson and it is installed """
+    return orjson is not None and current_app.config.get('JSON_BACKEND') == 'orjson'
+
+def output_json(data, code, headers=None):
+    """ application/json representation registered on every flask_restful Api """
+    if not fast_json_enabled():
+        with timed('json'):
+            return restful_output_json(data, code, headers)
+    with timed('json'):
+        body = orjson.dumps(data)
+    response = current_app.response_class(body, status=code, mimetype='application/json')
+    response.headers.extend(headers or {})
+    return response
+
+def jsonify(data):
+    """ Drop in for flask.jsonify that encodes with the configured backend """
+    if not fast_json_enabled():
+        with timed('json'):
+            return flask_jsonify(data)
+    with timed('json'):
+        body = orjson.dumps(data)
+    return current_app.response_class(body, mimetype='application/json')
+
+def fragments_response(data, key, headers=None):
+    """
+    200 response of {'status': 'success', 'data': data} where data[key] is a list of json
+    fragments that are already encoded. They are pasted in as they are, never decoded
+    """
+    with timed('json'):
+        body = [b'{"status":"success","data":{', dumps(key), b':[', b','.join(data[key]), b']']
+        for name, value in data.items():
+            if name != key:
+                body += [b',', dumps(name), b':', dumps(value)]
+        body.append(b'}}')
+    response = current_app.response_class(b''.join(body), status=200, mimetype='application/json')
+    response.headers.extend(headers or {})
+    return response
+
+def dumps(data):
+    """ Compact JSON bytes with the configured backend, datetimes as ISO 8601 """
+    if fast_json_enabled():
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=lambda value: value.isoformat()).encode()
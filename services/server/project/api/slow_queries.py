@@ -0,0 +1,222 @@
+# services/server/project/api/slow_queries.py
+import datetime
+import decimal
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# statements EXPLAIN accepts, without ANALYZE none of them is executed
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def redact(value):
+    """ Bind parameters safe to write out: numbers, booleans and dates are kept, text is replaced by its length """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, (str, bytes)):
+        return f'<redacted {len(value)}>'
+    return f'<redacted {type(value).__name__}>'
+
+
+class SlowQueryLog:
+    """
+    Opt in (SLOW_QUERY_LOG) hook recording every statement slower than SLOW_QUERY_MS.
+    Each one is written as a JSON line to this process' rotating SLOW_QUERY_FILE with its redacted
+    parameters, the endpoint that ran it and its plan. Plans come from EXPLAIN run by a
+    background thread on a pooled connection, once per statement, so the request that was
+    already slow doesn't wait for it; when the queue is full the entry goes out without one.
+    Per worker totals are kept for the slowest SLOW_QUERY_TOP statements.
+    """
+    def __init__(self, threshold_ms=200, maxsize=500, queue_size=100):
+        self.threshold = threshold_ms / 1000
+        self.maxsize = maxsize
+        self.explain = True
+        self.queue_size = queue_size
+        self.file_logger = None
+        self.file = None
+        self._file_pid = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def init_app(self, app):
+        if not app.config.get('SLOW_QUERY_LOG'):
+            return
+        self.threshold = app.config.get('SLOW_QUERY_MS', self.threshold * 1000) / 1000
+        self.maxsize = app.config.get('SLOW_QUERY_TOP', self.maxsize)
+        self.explain = app.config.get('SLOW_QUERY_EXPLAIN', self.explain)
+        self.file_logger = logging.getLogger(f'{__name__}.file')
+        self.file_logger.setLevel(logging.INFO)
+        self.file_logger.propagate = False
+        self.file = os.path.abspath(app.config.get('SLOW_QUERY_FILE', 'slow_queries.log'))
+        self.file_bytes = app.config.get('SLOW_QUERY_FILE_BYTES', 10 * 1024 * 1024)
+        self.file_backups = app.config.get('SLOW_QUERY_FILE_BACKUPS', 5)
+        self._file_pid = None # opened on the first write, in the process that writes
+        if not event.contains(Engine, 'before_cursor_execute', self.before_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_execute)
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context.slow_query_started = time.perf_counter()
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'slow_query_started', None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        if seconds >= self.threshold:
+            if executemany and parameters:
+                parameters = parameters[0]
+            self.record(conn.engine, statement, parameters, seconds)
+
+    def record(self, engine, statement, parameters, seconds):
+        entry = {
+            'time': datetime.datetime.utcnow().isoformat(),
+            'ms': round(seconds * 1000, 2),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'path': request.path if has_request_context() else None,
+            'statement': statement,
+            'parameters': redact(parameters),
+            'plan': None
+        }
+        with self._lock:
+            explain = self.explain and self.add(entry) and statement.lstrip().upper().startswith(EXPLAINABLE)
+        if explain:
+            try:
+                self._get_queue().put_nowait((engine, statement, parameters, entry))
+                return
+            except queue.Full:
+                pass
+        self.write(entry)
+
+    def add(self, entry):
+        """ Fold entry into the per statement totals, True the first time the statement is seen """
+        stats = self._entries.get(entry['statement'])
+        if stats is None:
+            if len(self._entries) >= self.maxsize:
+                # keep the statements that cost the most overall
+                del self._entries[min(self._entries, key=lambda statement: self._entries[statement]['total_ms'])]
+            stats = self._entries[entry['statement']] = {
+                'statement': entry['statement'],
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'endpoints': Counter(),
+                'parameters': None,
+                'plan': None
+            }
+        stats['count'] += 1
+        stats['total_ms'] += entry['ms']
+        stats['max_ms'] = max(stats['max_ms'], entry['ms'])
+        stats['endpoints'][entry['endpoint'] or '-'] += 1
+        stats['parameters'] = entry['parameters']
+        return stats['count'] == 1
+
+    @property
+    def path(self):
+        """ This process' file, SLOW_QUERY_FILE with the pid before the extension """
+        root, extension = os.path.splitext(self.file)
+        return f'{root}.{os.getpid()}{extension}'
+
+    def write(self, entry):
+        if self.file_logger is None:
+            return
+        if self._file_pid != os.getpid():
+            self._open_file()
+        self.file_logger.info(json.dumps(entry))
+
+    def _open_file(self):
+        # RotatingFileHandler renames the file under any other process writing to it, so each
+        # gunicorn worker rotates a file of its own
+        with self._lock:
+            if self._file_pid == os.getpid():
+                return
+            for handler in list(self.file_logger.handlers):
+                self.file_logger.removeHandler(handler)
+                handler.close()
+            self.file_logger.addHandler(RotatingFileHandler(
+                self.path,
+                maxBytes=self.file_bytes,
+                backupCount=self.file_backups,
+                delay=True
+            ))
+            self._file_pid = os.getpid()
+
+    def _get_queue(self):
+        # the explain thread is started lazily and per pid, gunicorn forks after create_app
+        with self._lock:
+            if self._queue is None or self._pid != os.getpid():
+                self._queue = queue.Queue(self.queue_size)
+                self._pid = os.getpid()
+                threading.Thread(target=self._explain_worker, args=(self._queue,), daemon=True).start()
+            return self._queue
+
+    def _explain_worker(self, jobs):
+        while True:
+            engine, statement, parameters, entry = jobs.get()
+            try:
+                entry['plan'] = self.explain_plan(engine, statement, parameters)
+                with self._lock:
+                    if statement in self._entries:
+                        self._entries[statement]['plan'] = entry['plan']
+            except Exception:
+                logger.exception('EXPLAIN of a slow query failed')
+            finally:
+                self.write(entry)
+                jobs.task_done()
+
+    def explain_plan(self, engine, statement, parameters):
+        """ EXPLAIN (ANALYZE off) text of statement, run on the engine that ran it """
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('EXPLAIN (ANALYZE off) ' + statement, parameters or None)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.close()
+            return plan
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def flush(self):
+        """ Wait for queued EXPLAINs to be written """
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def top(self, limit=20):
+        """ Statements by total time spent in this worker, slowest first """
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda stats: stats['total_ms'], reverse=True)[:limit]
+            return [
+                dict(
+                    stats,
+                    total_ms=round(stats['total_ms'], 2),
+                    mean_ms=round(stats['total_ms'] / stats['count'], 2),
+                    endpoints=dict(stats['endpoints'].most_common(5))
+                )
+                for stats in entries
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,126 @@
+# services/server/project/api/timing.py
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# set once an app turns REQUEST_TIMING on, until then timed() costs a global lookup
+_enabled = False
+
+
+class Timings:
+    """ What one request spent its time on: named spans plus every SQL statement it ran """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.statements = Counter()
+        self.db_seconds = 0.0
+
+    def add(self, name, seconds):
+        count, total = self.spans.get(name, (0, 0.0))
+        self.spans[name] = (count + 1, total + seconds)
+
+    def add_statement(self, statement, seconds):
+        self.statements[statement] += 1
+        self.db_seconds += seconds
+
+    def repeated(self, threshold):
+        """ (statement, count) run at least threshold times, the usual sign of an N+1 """
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+def timed(name):
+    """ Adds the block's duration to the current request's span name, a no-op unless REQUEST_TIMING is on """
+    if not _enabled:
+        return nullcontext()
+    return _timed(name)
+
+@contextmanager
+def _timed(name):
+    timings = g.get('request_timings') if has_request_context() else None
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context.request_timing_started = time.perf_counter()
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = g.get('request_timings') if has_request_context() else None
+    started = getattr(context, 'request_timing_started', None)
+    if timings is not None and started is not None:
+        timings.add_statement(statement, time.perf_counter() - started)
+
+
+class RequestTiming:
+    """
+    With REQUEST_TIMING on, counts and times the SQL of every request along with the
+    timed() spans (auth, jwt, bcrypt, json), and reports them in a Server-Timing header
+    and one JSON log line per request. Statements repeated REQUEST_TIMING_REPEAT times
+    are logged as a warning. When off no hooks or SQL listeners are installed.
+    """
+    def __init__(self, repeat_threshold=5):
+        self.repeat_threshold = repeat_threshold
+
+    def init_app(self, app):
+        global _enabled
+        self.repeat_threshold = app.config.get('REQUEST_TIMING_REPEAT', self.repeat_threshold)
+        if not app.config.get('REQUEST_TIMING'):
+            return
+        _enabled = True
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.discard)
+        # on the Engine class so the replica bind is counted too
+        if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_execute)
+
+    def start(self):
+        g.request_timings = Timings()
+
+    def discard(self, exception=None):
+        g.pop('request_timings', None)
+
+    def server_timing(self, timings, total):
+        metrics = [f'db;dur={timings.db_seconds * 1000:.2f};desc="{sum(timings.statements.values())} queries"']
+        for name, (count, seconds) in timings.spans.items():
+            metrics.append(f'{name};dur={seconds * 1000:.2f}')
+        metrics.append(f'app;dur={total * 1000:.2f}')
+        return ', '.join(metrics)
+
+    def finish(self, response):
+        timings = g.get('request_timings')
+        if timings is None:
+            return response
+        total = time.perf_counter() - timings.started
+        response.headers['Server-Timing'] = self.server_timing(timings, total)
+        repeated = timings.repeated(self.repeat_threshold)
+        line = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'ms': round(total * 1000, 2),
+            'queries': sum(timings.statements.values()),
+            'db_ms': round(timings.db_seconds * 1000, 2),
+            'spans': {name: {'count': count, 'ms': round(seconds * 1000, 2)} for name, (count, seconds) in timings.spans.items()}
+        }
+        if repeated:
+            line['repeated'] = [{'statement': statement[:200], 'count': count} for statement, count in repeated]
+            logger.warning(json.dumps(line))
+        else:
+            logger.info(json.dumps(line))
+        return response
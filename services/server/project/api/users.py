@@ -1,14 +1,22 @@
 from flask_restful import Resource, Api
-from flask import Blueprint, request, render_template, jsonify, current_app, make_response
-from project import db
+from flask import Blueprint, request, render_template, current_app, make_response
+from project import db, principal_cache, hashing_pool
+from project.api.hashing import HashingPoolFull
+from project.api.lookups import user_by_email
+from project.api.fields import get_fields, only_fields, update_values, returning_columns, json_columns
+from project.api.serializers import output_json
+from project.api.etag import table_etag, not_modified, etag_header
+from project.api.pagination import get_limit, keyset_rows, count_rows, wants_count, bool_arg
 from project.api.models import User
-from project.api.utils import authenticate_restful
+from project.api.utils import authenticate_restful, authenticate_service
+from project.api.replica import read_primary
 from project.api.utils import is_admin, is_same_user
-from sqlalchemy import exc, func
+from sqlalchemy import exc, func, or_, text
 import json
 
 users_blueprint = Blueprint('users', __name__, template_folder='./templates')
 api = Api(users_blueprint)
+api.representation('application/json')(output_json)
 
 @users_blueprint.before_request
 def only_json():
@@ -29,9 +37,29 @@ def index():
         password = request.form['password']
         db.session.add(User(username=username, email=email, password=password))
         db.session.commit()
-    users = User.query.all()
+    users = User.query.order_by(User.id).limit(current_app.config['PAGINATION_MAX']).all()
     return render_template('index.html', users=users)
 
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def user_filters():
+    """ Conditions of the ?q= search and the ?active= / ?admin= filters of the user directory """
+    conditions = []
+    terms = request.args.get('q', '').strip()
+    if terms:
+        # substring match, served by the trigram indexes on username and email
+        pattern = f'%{escape_like(terms)}%'
+        conditions.append(or_(
+            User.username.ilike(pattern, escape='\\'),
+            User.email.ilike(pattern, escape='\\')
+        ))
+    for name in ('active', 'admin'):
+        value = bool_arg(name)
+        if value is not None:
+            conditions.append(getattr(User, name) == value)
+    return conditions
+
 class UsersPing(Resource):
     def get(self):
         response = {
@@ -40,6 +68,32 @@ class UsersPing(Resource):
         }
         return response, 200
 
+class UsersActive(Resource):
+    # the sequence and the rows must come from the same server, a replica replays them apart
+    method_decorators = [read_primary, authenticate_service]
+    def get(self):
+        """
+        Ids of the users whose tokens are still good, polled by other services that verify tokens
+        locally. Active ids come as [first, last] runs, so deactivated and deleted users are both
+        left out. Ids above last_id were created after this answer and are not covered by it
+        """
+        # read before the rows, so every user committed after the runs were read has a higher id.
+        # Only an insert still in flight at this point can be missed, until the next poll
+        last_id = db.session.execute(text(
+            "SELECT coalesce(pg_sequence_last_value(pg_get_serial_sequence('users', 'id')::regclass), 0)"
+        )).scalar()
+        run = (User.id - func.row_number().over(order_by=User.id)).label('run')
+        active = db.session.query(User.id, run).filter(User.active).subquery()
+        ranges = db.session.query(func.min(active.c.id), func.max(active.c.id)).group_by(active.c.run).order_by(func.min(active.c.id))
+        response = {
+            'status': 'success',
+            'data': {
+                'ranges': [[first, last] for first, last in ranges],
+                'last_id': last_id
+            }
+        }
+        return response, 200
+
 class UsersList(Resource):
     # black magic decorator
     method_decorators = {'post' : [authenticate_restful], 'get': [authenticate_restful]}
@@ -64,9 +118,10 @@ class UsersList(Resource):
 
         #  test User constraints
         try:
-            user = User.query.filter_by(email=email).first() # get first record that matches email
+            user = user_by_email.get(email=email) # get the record that matches email
             if not user:
-                db.session.add(User(username=username, email=email, password=password)) #  add new user
+                password_hash = hashing_pool.hash_password(password)
+                db.session.add(User(username=username, email=email, password_hash=password_hash)) #  add new user
                 db.session.commit() # commit to db
                 response['status'] = 'success'
                 response['message'] = f'{email} added.'
@@ -74,25 +129,41 @@ class UsersList(Resource):
             else: 
                 response['message'] = 'Email already exists'
                 return response, 400
+        except HashingPoolFull:
+            response['message'] = 'Server busy, try again'
+            return response, 503, {'Retry-After': str(hashing_pool.retry_after)}
         #  Handle db exception
         except (exc.IntegrityError, ValueError):
             db.session.rollback() #  must rollback any changes
             return response, 400
 
     def get(self, sub):
-        """ Get all users """
-        num_users = db.session.query(func.count(User.id)).scalar()
+        """ One page of users, searched with ?q= and filtered with ?active= and ?admin= """
+        etag = table_etag('users')
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        try:
+            fields = get_fields(User)
+            conditions = user_filters()
+            # straight from Core rows, no User objects are built just to be turned into json
+            users, next_cursor = keyset_rows(json_columns(User, fields), User.__table__.c.id, get_limit(), conditions)
+        except ValueError:
+            return {'status': 'fail', 'message': 'Invalid query parameters'}, 400
+        data = {
+            'users': users,
+            'next_cursor': next_cursor
+        }
+        if wants_count():
+            data['num_users'] = count_rows(User.__table__, conditions)
         response = {
-            'data': {
-                'num_users': num_users,
-                'users': [user.to_json() for user in User.query.all()]
-            },
+            'data': data,
             'status': 'success',
         }
-        return response, 200
+        return response, 200, etag_header(etag)
 
 class Users(Resource):
-    method_decorators = {'put' : [authenticate_restful], 'delete': [authenticate_restful]}
+    method_decorators = {'put' : [authenticate_restful], 'patch': [authenticate_restful], 'delete': [authenticate_restful]}
 
     def get(self, user_id):
         """ Get user by user_id """
@@ -101,21 +172,39 @@ class Users(Resource):
             'message': 'User does not exist'
         }
         try:
-            user = User.query.filter_by(id=int(user_id)).first()
+            fields = get_fields(User)
+        except ValueError:
+            return {'status': 'fail', 'message': 'Invalid query parameters'}, 400
+        etag = table_etag('users')
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        try:
+            user = only_fields(User.query, User, fields).filter_by(id=int(user_id)).first()
             if not user:
                 return response, 404
             else:
                 response = {
                     "status": "success",
-                    "data": user.to_json()
+                    "data": user.to_json(fields)
                 }
-                return response, 200
+                return response, 200, etag_header(etag)
         except ValueError:
             return response, 404
 
     def put(self, sub, user_id):
-        """ Update user_id, must be admin or the correct user """
-        put_data = request.get_json()
+        """
+        Legacy alias of PATCH kept for existing clients: only the fields sent are updated, it is
+        not a full replace. Answers 201 where PATCH answers 200, must be admin or the correct user
+        """
+        return self.update(sub, user_id, 201)
+
+    def patch(self, sub, user_id):
+        """ Update only the fields sent for user_id, must be admin or the correct user """
+        return self.update(sub, user_id, 200)
+
+    def update(self, sub, user_id, code):
+        """ Whitelisted columns set by a single UPDATE ... RETURNING """
         response = {
             'status': 'fail',
             'message': 'User does not exist'
@@ -125,22 +214,34 @@ class Users(Resource):
                 response['message'] = 'You do not have permission to update this user'
                 return response, 403
         try:
-            user = User.query.filter_by(id=int(user_id)).first()
-            if not user:
-                return response, 404
-            else:
-                for key, value in put_data.items():
-                    setattr(user, key, value)
-                db.session.commit()
-                # get updated object
-                updated_user = User.query.filter_by(id=int(user_id)).first()
-                put_response = {
-                    "status": "success",
-                    "data": updated_user.to_json()
-                }
-                return put_response, 201
+            values = update_values(User, request.get_json())
         except ValueError:
+            response['message'] = 'Invalid payload'
+            return response, 400
+        # users can rename or deactivate themselves, only admins hand out admin
+        if 'admin' in values and not is_admin(sub):
+            response['message'] = 'You do not have permission to update this user'
+            return response, 403
+        users = User.__table__
+        try:
+            user = db.session.execute(
+                users.update().where(users.c.id == int(user_id)).values(**values).returning(*returning_columns(User))
+            ).first()
+            db.session.commit()
+        except ValueError:
+            return response, 404
+        except exc.StatementError:
+            db.session.rollback()
+            response['message'] = 'Invalid payload'
+            return response, 400
+        if not user:
             return response, 404
+        principal_cache.invalidate_user(user_id)
+        put_response = {
+            "status": "success",
+            "data": dict(user)
+        }
+        return put_response, code
 
     def delete(self, sub, user_id):
         """ Delete user_id, must be admin or the correct user """
@@ -152,29 +253,30 @@ class Users(Resource):
         if not is_admin(sub) and not is_same_user(sub, user_id):
                 response['message'] = 'You do not have permission to delete this user'
                 return response, 403
+        users = User.__table__
         try:
-            user = User.query.filter_by(id=int(user_id)).first()
-            if not user:
-                return response, 404
-            else:
-                db.session.query(User).filter(User.id==user_id).delete()
-                db.session.commit()
-                # get updated object
-                deleted_user = User.query.filter_by(id=int(user_id)).first()
-                if not deleted_user:
-                    delete_response = {
-                        "status": "success",
-                        "message": "Deleted"
-                    }
-                    return delete_response, 204
-                else:
-                    response['message'] = 'Server error'
-                    return response, 500
+            deleted = db.session.execute(
+                users.delete().where(users.c.id == int(user_id)).returning(users.c.id)
+            ).first()
+            db.session.commit()
         except ValueError:
             return response, 404
+        except exc.IntegrityError:
+            db.session.rollback()
+            response['message'] = 'User still has questions'
+            return response, 409
+        if not deleted:
+            return response, 404
+        principal_cache.invalidate_user(user_id)
+        delete_response = {
+            "status": "success",
+            "message": "Deleted"
+        }
+        return delete_response, 204
 
 
 #  Add routes to the api
 api.add_resource(UsersPing, '/users/ping')  # Sanity check
+api.add_resource(UsersActive, '/users/active')
 api.add_resource(UsersList, '/users')      
 api.add_resource(Users, '/users/<user_id>') 
\ No newline at end of file
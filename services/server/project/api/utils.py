@@ -1,8 +1,15 @@
+import hmac
+import time
 from functools import wraps
-from flask import request, jsonify
+from flask import request, g
 from project.api.models import User
+from project.api.cache import Principal
+from project.api.lookups import user_by_id
+from project.api.serializers import jsonify
 from flask import current_app
-from project import db
+from project import db, principal_cache
+from project.api.timing import timed
+import jwt
 
 # Abstraction for checking for auth token present and valid and user is active
 def authenticate(f):
@@ -17,15 +24,14 @@ def authenticate(f):
             response['message'] = 'Forbidden'
             return jsonify(response), 403
         token = auth_header.split(" ")[1]
-        sub = User.decode_jwt(token)
-        if isinstance(sub, str):
-            response['message'] = sub
+        principal = load_principal(token)
+        if isinstance(principal, str):
+            response['message'] = principal
             return jsonify(response), 401
-        user = User.query.filter_by(id=sub).first()
-        
-        if not user or not user.active:
+        if not principal or not principal.active:
             return jsonify(response), 401
-        return f(sub, *args, **kwargs)
+        g.principal = principal
+        return f(principal.id, *args, **kwargs)
     return decorated_function
 
 # Note we aren't using the jsonify method on the response
@@ -43,19 +49,54 @@ def authenticate_restful(func):
             response['message'] = 'Forbidden'
             return response, 403
         token = auth_header.split(" ")[1]
-        sub = User.decode_jwt(token)
-        if isinstance(sub, str):
-            response['message'] = sub
+        principal = load_principal(token)
+        if isinstance(principal, str):
+            response['message'] = principal
             return response, 401
-        user = User.query.filter_by(id=sub).first()
-        
-        if not user or not user.active:
+        if not principal or not principal.active:
             return response, 401
-        return func(sub, *args, **kwargs)
+        g.principal = principal
+        return func(principal.id, *args, **kwargs)
     return decorated_function
 
+# restful decorator for endpoints that only other services call, with the shared SERVICE_TOKEN
+def authenticate_service(func):
+    @wraps(func)
+    def decorated_function(*args, **kwargs):
+        token = current_app.config.get('SERVICE_TOKEN')
+        auth_header = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(auth_header.encode(), f'Bearer {token}'.encode()):
+            return {'status': 'fail', 'message': 'Forbidden'}, 403
+        return func(*args, **kwargs)
+    return decorated_function
+
+def load_principal(token):
+    """ Returns the Principal for a token, an error message if the token is invalid or None if the user is gone """
+    with timed('auth'):
+        return _load_principal(token)
+
+def _load_principal(token):
+    principal = principal_cache.get(token)
+    if principal:
+        return principal
+    sub = User.decode_jwt(token)
+    if isinstance(sub, str):
+        return sub
+    user = user_by_id.get(id=sub)
+    if not user:
+        return None
+    principal = Principal(user.id, user.active, user.admin)
+    # never cache a principal past the token's own expiry, signature was verified above
+    exp = jwt.decode(token, verify=False)['exp']
+    principal_cache.set(token, principal, exp - time.time())
+    return principal
+
 def is_admin(user_id):
-    user = User.query.filter_by(id=user_id).first()
+    # the auth decorators already loaded the requesting user, don't select it again
+    principal = g.get('principal')
+    if principal and principal.id == int(user_id):
+        return principal.admin
+    user = user_by_id.get(id=int(user_id))
     return user.admin
 
 def is_same_user(uid_1, uid_2):
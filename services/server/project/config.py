@@ -1,33 +1,86 @@
 # services/project/config.py
 import os
 
+from project.api.pool import pool_size_for
+
 
 class BaseConfig:
     """Base Configuration"""
     TESTING = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # connection pool of each gunicorn worker, sized so all workers together stay within DATABASE_MAX_CONNECTIONS
+    WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1)) # gunicorn workers, gunicorn reads the same variable
+    GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', 1))
+    DATABASE_MAX_CONNECTIONS = int(os.getenv('DATABASE_MAX_CONNECTIONS', 20))
+    SQLALCHEMY_POOL_SIZE, SQLALCHEMY_MAX_OVERFLOW = pool_size_for(WEB_CONCURRENCY, GUNICORN_THREADS, DATABASE_MAX_CONNECTIONS)
+    SQLALCHEMY_POOL_TIMEOUT = int(os.getenv('DATABASE_POOL_TIMEOUT', 10)) # seconds a request waits for a free connection
+    SQLALCHEMY_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', 1800)) # reconnect before server/firewall idle timeouts
+    SQLALCHEMY_POOL_PRE_PING = os.getenv('DATABASE_POOL_PRE_PING', 'true').lower() == 'true'
+    SQLALCHEMY_PGBOUNCER = os.getenv('DATABASE_PGBOUNCER', 'false').lower() == 'true' # transaction mode, no app side pool
+    SQLALCHEMY_PREPARED_STATEMENTS = os.getenv('DATABASE_PREPARED_STATEMENTS', 'true').lower() == 'true' # hot lookups, ignored with pgbouncer
+    # optional streaming replica for the reads of GET requests, see project/api/replica.py
+    SQLALCHEMY_BINDS = {'replica': os.getenv('DATABASE_REPLICA_URL')} if os.getenv('DATABASE_REPLICA_URL') else None
+    REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5)) # a writer reads from the primary this long after writing
+    REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 5)) # seconds behind the primary before reads fall back to it
+    REPLICA_LAG_CHECK = 1 # seconds between replica lag checks per worker
     SECRET_KEY = os.getenv('SECRET_KEY')
+    SERVICE_TOKEN = os.getenv('SERVICE_TOKEN') # shared with the services polling /users/active, unset keeps it closed
     DEBUG_TOOLBAR = False
     DEBUG_TOOLBAR_INTERCEPT = False
     BCRYPT_LOG_ROUNDS = 12
+    # each hash holds one of the worker's threads, so size + queue must stay below GUNICORN_THREADS for a
+    # 503 to ever be sent, the threads left over keep serving other requests. One thread hashes inline
+    BCRYPT_POOL_SIZE = int(os.getenv('BCRYPT_POOL_SIZE', min(2, GUNICORN_THREADS - 1))) # hashing processes per worker, 0 hashes inline
+    BCRYPT_POOL_QUEUE = int(os.getenv('BCRYPT_POOL_QUEUE', max(0, GUNICORN_THREADS - 1 - BCRYPT_POOL_SIZE))) # hashes allowed to wait before answering 503
+    BCRYPT_POOL_RETRY_AFTER = 1
     TOKEN_EXPIRATION_DAYS = 5
     TOKEN_EXPIRATION_SECONDS = 0
-    PAGINATION_NUMBER = 5
+    PAGINATION_NUMBER = 5 # default page size for list endpoints
+    PAGINATION_MAX = 100
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'orjson') # 'orjson' or 'json', falls back to json if orjson is missing
+    AUTH_CACHE_SIZE = 4096
+    AUTH_CACHE_TTL = 30 # max seconds a worker may serve a stale user (active/admin) for a token
+    QUESTION_JSON_CACHE_BYTES = int(os.getenv('QUESTION_JSON_CACHE_BYTES', 32 * 1024 * 1024)) # encoded questions kept per worker, 0 turns it off
+    BULK_IMPORT_BATCH = 1000 # rows per INSERT/commit in /questions/bulk
+    BULK_IMPORT_MAX_ERRORS = 100 # row errors listed in the import report, the rest are only counted
+    EXPORT_BATCH_SIZE = 1000 # rows per server side cursor fetch and per streamed chunk in /export
+    # per worker in memory copy of the questions, see project/api/catalog.py. /questions/random always
+    # draws from its id arrays, the list and count endpoints and the random row itself only with QUESTION_CATALOG
+    QUESTION_CATALOG = os.getenv('QUESTION_CATALOG', 'false').lower() == 'true'
+    QUESTION_CATALOG_INTERVAL = 0 # seconds between checks for other workers' writes, 0 reads the version row on every request
+    QUESTION_CATALOG_TTL = 3600 # seconds between full reloads
+    QUESTION_CATALOG_MAX_CHANGES = 50000 # more pending changes than this reload everything instead
+    QUESTION_CATALOG_TEXT_BYTES = int(os.getenv('QUESTION_CATALOG_TEXT_BYTES', 64 * 1024 * 1024)) # body/test text held per worker
+    QUESTION_CHANGES_RETENTION = 86400 # seconds of question_changes kept by manage.py prune_question_changes
+    REQUEST_TIMING = os.getenv('REQUEST_TIMING', 'false').lower() == 'true' # Server-Timing header and a timing log line per request
+    REQUEST_TIMING_REPEAT = 5 # runs of one statement in a request that get it logged as a likely N+1
+    SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'false').lower() == 'true' # log and EXPLAIN statements slower than SLOW_QUERY_MS
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 200))
+    # JSON lines, one file per process named <file>.<pid>.log, rotated at SLOW_QUERY_FILE_BYTES
+    SLOW_QUERY_FILE = os.getenv('SLOW_QUERY_FILE', 'slow_queries.log')
+    SLOW_QUERY_FILE_BYTES = 10 * 1024 * 1024
+    SLOW_QUERY_FILE_BACKUPS = 5
+    SLOW_QUERY_EXPLAIN = True # capture each slow statement's plan once, from a background thread
+    SLOW_QUERY_TOP = 500 # statements whose totals /metrics/slow-queries keeps per worker
 
 class DevConfig(BaseConfig):
     """Development Configuration"""
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     DEBUG_TOOLBAR = True
     BCRYPT_LOG_ROUNDS = 4
+    BCRYPT_POOL_SIZE = 0
 
 class TestConfig(BaseConfig):
     """Testing Configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_TEST_URL')
+    SQLALCHEMY_BINDS = {'replica': os.getenv('DATABASE_REPLICA_TEST_URL')} if os.getenv('DATABASE_REPLICA_TEST_URL') else None
     PRESERVE_CONTEXT_ON_EXCEPTION = False
     BCRYPT_LOG_ROUNDS = 4
+    BCRYPT_POOL_SIZE = 0
     TOKEN_EXPIRATION_DAYS = 0
     TOKEN_EXPIRATION_SECONDS = 5
+    SERVICE_TOKEN = 'test-service-token'
 
 class ProdConfig(BaseConfig):
     """Production Configuration"""
@@ -0,0 +1,158 @@
+# services/server/project/synthetic.py
+"""
+Synthetic users and questions for load testing, see `manage.py add_test_data`.
+
+Every batch is generated from its own Random seeded with (seed, table, first row), so the
+output for a seed is the same whatever the number of workers. Workers only build COPY
+text, the parent process loads the batches in order on one connection.
+"""
+import io
+import math
+import random
+from datetime import datetime, timedelta
+from functools import partial
+from multiprocessing import Pool
+
+from project.api.models import DIFFICULTIES
+
+WORDS = (
+    'array string list dict set tuple graph tree node edge path cycle sort merge heap stack queue '
+    'binary search linked reverse rotate matrix prime fibonacci factorial palindrome anagram vowel '
+    'integer float sum product average median maximum minimum count unique duplicate window '
+    'substring prefix suffix recursion iterator generator decorator class function closure lambda '
+    'return given write implement find check compute the a an of in for each every from to with'
+).split()
+
+# username prefixes and email domains, repeated so the user directory search has matches
+NAMES = ('alex', 'sam', 'jordan', 'taylor', 'casey', 'riley', 'morgan', 'quinn', 'avery', 'jamie')
+DOMAINS = ('example.com', 'example.org', 'mail.test', 'students.test')
+
+INACTIVE_RATE = 0.02
+CREATED_SPAN_DAYS = 730
+EPOCH = datetime(2019, 1, 1)
+
+
+def batches(total, batch_size):
+    """ (first row, row count) for every batch of a table of total rows """
+    return [(start, min(batch_size, total - start)) for start in range(0, total, batch_size)]
+
+def parse_mix(value):
+    """ 'Easy=5,Moderate=3,Hard=2' -> weights in DIFFICULTIES order, ValueError if malformed """
+    weights = dict.fromkeys(DIFFICULTIES, 0.0)
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip().capitalize()
+        if name not in weights:
+            raise ValueError(f'Unknown difficulty {name!r}')
+        weights[name] = float(weight)
+    if sum(weights.values()) <= 0 or min(weights.values()) < 0:
+        raise ValueError('Difficulty weights must be positive')
+    return [weights[name] for name in DIFFICULTIES]
+
+def zipf_rank(rng, n, s):
+    """
+    Rank in 1..n drawn from a (continuous approximation of a) Zipf law with exponent s,
+    O(1) per draw so millions of authors don't need a cdf table
+    """
+    u = rng.random()
+    if abs(s - 1.0) < 1e-9:
+        rank = n ** u
+    else:
+        rank = ((n ** (1 - s) - 1) * u + 1) ** (1 / (1 - s))
+    return min(n, max(1, int(rank)))
+
+def author_permutation(seed, n):
+    """ Multiplier coprime to n, so the most prolific authors are spread over the id range """
+    rng = random.Random(f'{seed}-authors')
+    while True:
+        multiplier = rng.randrange(1, max(2, n))
+        if math.gcd(multiplier, n) == 1:
+            return multiplier
+
+def sentence(rng, mean_words):
+    count = max(3, int(rng.lognormvariate(math.log(mean_words), 0.5)))
+    return ' '.join(rng.choices(WORDS, k=count))
+
+def user_rows(start, count, seed, first_id, password_hash):
+    """ COPY text for users first_id + start .. + count """
+    rng = random.Random(f'{seed}-users-{start}')
+    out = io.StringIO()
+    for i in range(start, start + count):
+        user_id = first_id + i
+        name = rng.choice(NAMES)
+        active = 'f' if rng.random() < INACTIVE_RATE else 't'
+        created = EPOCH + timedelta(seconds=rng.randrange(CREATED_SPAN_DAYS * 86400))
+        out.write(f'{user_id}\t{name}{user_id}\t{name}.{user_id}@{rng.choice(DOMAINS)}\t'
+                  f'{password_hash}\t{active}\tf\t{created.isoformat()}\n')
+    return out.getvalue()
+
+def question_rows(start, count, seed, first_author, authors, zipf, mix):
+    """ COPY text for count questions, authors drawn from a Zipf law over the generated users """
+    rng = random.Random(f'{seed}-questions-{start}')
+    multiplier = author_permutation(seed, authors)
+    cum_weights = [sum(mix[:i + 1]) for i in range(len(mix))]
+    codes = list(range(1, len(DIFFICULTIES) + 1))
+    out = io.StringIO()
+    for _ in range(count):
+        rank = zipf_rank(rng, authors, zipf)
+        author_id = first_author + (rank * multiplier) % authors
+        difficulty = rng.choices(codes, cum_weights=cum_weights)[0]
+        out.write(f'{author_id}\t{sentence(rng, 25)}\t{sentence(rng, 40)}\t{sentence(rng, 8)}\t{difficulty}\n')
+    return out.getvalue()
+
+def _run(fn, args):
+    return fn(*args)
+
+def generate(pool, fn, tasks, workers):
+    """ fn(*task) for every task in order, at most workers * 2 results held at once """
+    if pool is None:
+        for task in tasks:
+            yield fn(*task)
+        return
+    window = workers * 2
+    for i in range(0, len(tasks), window):
+        for text in pool.imap(partial(_run, fn), tasks[i:i + window]):
+            yield text
+
+def load(connection, users, questions, password_hash, seed=0, workers=1, batch_size=10000, zipf=1.1, mix=(5, 3, 2), log=None):
+    """
+    COPY users then questions into the database behind the DBAPI connection, committing
+    every batch. Returns the id range of the generated users
+    """
+    cursor = connection.cursor()
+    cursor.execute('SELECT coalesce(max(id), 0) + 1 FROM users')
+    first_id = cursor.fetchone()[0]
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        user_tasks = [(start, count, seed, first_id, password_hash) for start, count in batches(users, batch_size)]
+        for done, text in enumerate(generate(pool, user_rows, user_tasks, workers), 1):
+            cursor.copy_expert(
+                'COPY users (id, username, email, password, active, admin, created_date) FROM STDIN',
+                io.StringIO(text)
+            )
+            connection.commit()
+            if log:
+                log('users', min(done * batch_size, users), users)
+        # ids were given explicitly, move the sequence past them
+        cursor.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT max(id) FROM users))")
+        connection.commit()
+
+        if users:
+            question_tasks = [
+                (start, count, seed, first_id, users, zipf, list(mix))
+                for start, count in batches(questions, batch_size)
+            ]
+            for done, text in enumerate(generate(pool, question_rows, question_tasks, workers), 1):
+                cursor.copy_expert(
+                    'COPY questions (author_id, body, test_code, test_solution, difficulty) FROM STDIN',
+                    io.StringIO(text)
+                )
+                connection.commit()
+                if log:
+                    log('questions', min(done * batch_size, questions), questions)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        cursor.close()
+    return first_id, first_id + users - 1
@@ -1,7 +1,9 @@
 # services/server/project/tests/base.py
 
+from contextlib import contextmanager
 from flask_testing import TestCase
-from project import create_app, db
+from sqlalchemy import event
+from project import create_app, db, principal_cache, question_json_cache, question_catalog, replica_router
 
 app = create_app()
 
@@ -13,7 +15,24 @@ class BaseTestCase(TestCase):
     def setUp(self):
         db.create_all()
         db.session.commit()
+        principal_cache.clear()
+        question_json_cache.clear()
+        question_catalog.clear()
+        replica_router.clear()
 
     def tearDown(self):
         db.session.remove()
-        db.drop_all()
\ No newline at end of file
+        db.drop_all()
+
+    @contextmanager
+    def assertNumQueries(self, num):
+        """ Fail if the block does not issue exactly num SQL statements """
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(len(statements), num, '\n'.join(statements))
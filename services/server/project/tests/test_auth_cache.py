@@ -0,0 +1,122 @@
+import json
+import unittest
+
+from project import principal_cache
+from project.api.cache import LRUCache, Principal
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_admin_user
+
+
+class TestAuthCache(BaseTestCase):
+    """ Tests for the per process token -> principal cache """
+    def test_second_request_is_a_hit(self):
+        """ The user lookup only happens on the first request with a token """
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        token = user.encode_jwt(user.id).decode()
+        with self.client:
+            for _ in range(3):
+                response = self.client.get(
+                    '/questions/user',
+                    headers={'Authorization': f'Bearer {token}'}
+                )
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(principal_cache.misses, 1)
+        self.assertEqual(principal_cache.hits, 2)
+
+    def test_put_invalidates_user(self):
+        """ Deactivating a user through PUT /users/<id> is seen on the next request """
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        token = user.encode_jwt(user.id).decode()
+        with self.client:
+            response = self.client.get('/questions/user', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.put(
+                f'/users/{user.id}',
+                data=json.dumps({'active': False}),
+                content_type='application/json',
+                headers={'Authorization': f'Bearer {token}'}
+            )
+            self.assertEqual(response.status_code, 201)
+            response = self.client.get('/questions/user', headers={'Authorization': f'Bearer {token}'})
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 401)
+            self.assertIn('Unauthorized', data['message'])
+
+    def test_delete_invalidates_user(self):
+        """ A deleted user's token stops working immediately """
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        token = user.encode_jwt(user.id).decode()
+        with self.client:
+            response = self.client.get('/questions/user', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.delete(
+                f'/users/{user.id}',
+                headers={'Authorization': f'Bearer {token}'}
+            )
+            self.assertEqual(response.status_code, 204)
+            response = self.client.get('/questions/user', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 401)
+
+    def test_zero_ttl_disables_cache(self):
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        token = user.encode_jwt(user.id).decode()
+        ttl = principal_cache.ttl
+        principal_cache.ttl = 0
+        try:
+            with self.client:
+                for _ in range(2):
+                    self.client.get('/questions/user', headers={'Authorization': f'Bearer {token}'})
+        finally:
+            principal_cache.ttl = ttl
+        self.assertEqual(principal_cache.hits, 0)
+        self.assertEqual(principal_cache.stats()['size'], 0)
+
+    def test_cache_stats_admin(self):
+        """ Admins can read the hit/miss counters """
+        user = add_admin_user('testuser', 'test@testing.io', 'testpass')
+        token = user.encode_jwt(user.id).decode()
+        with self.client:
+            response = self.client.get('/login/cache', headers={'Authorization': f'Bearer {token}'})
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data']['misses'], 1)
+            self.assertIn('hits', data['data'])
+
+    def test_cache_stats_not_admin(self):
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        token = user.encode_jwt(user.id).decode()
+        with self.client:
+            response = self.client.get('/login/cache', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 403)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 60)
+        cache.get('a')
+        cache.set('c', 3, 60)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = LRUCache()
+        cache.set('a', 1, 60)
+        cache._entries['a'] = (1, 0) # expired long ago
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_discard_if(self):
+        cache = LRUCache()
+        cache.set('a', Principal(1, True, False), 60)
+        cache.set('b', Principal(2, True, False), 60)
+        cache.discard_if(lambda principal: principal.id == 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertTrue(cache.get('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
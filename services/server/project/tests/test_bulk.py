@@ -0,0 +1,160 @@
+import json
+import unittest
+
+from project import db
+from project.api.bulk import csv_records
+from project.api.models import Question
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_admin_user
+
+
+def ndjson(*records):
+    return '\n'.join(record if isinstance(record, str) else json.dumps(record) for record in records).encode()
+
+def question(body='body', difficulty='Easy', **extra):
+    return dict(body=body, test_code='code', test_solution='solution', difficulty=difficulty, **extra)
+
+
+class TestBulkImport(BaseTestCase):
+    """ Tests for POST /questions/bulk """
+    def setUp(self):
+        super().setUp()
+        self.admin = add_admin_user('admin', 'admin@testing.io', 'testpass')
+        self.token = self.admin.encode_jwt(self.admin.id).decode()
+
+    def upload(self, data, content_type='application/x-ndjson'):
+        response = self.client.post(
+            '/questions/bulk',
+            data=data,
+            content_type=content_type,
+            headers={'Authorization': f'Bearer {self.token}'}
+        )
+        return response, json.loads(response.data.decode())
+
+    def test_ndjson_reports_bad_rows(self):
+        """ Invalid rows are skipped and reported by line, the rest are inserted """
+        body = ndjson(
+            question('first'),
+            '{not json',
+            '',
+            question('bad', difficulty='Impossible'),
+            question('second', author_id=99),
+            question('third', difficulty='hard'),
+            '[1, 2]',
+            question('nul\x00byte'),
+            question(''),
+            question('fourth')
+        )
+        with self.client:
+            response, data = self.upload(body)
+        self.assertEqual(response.status_code, 200)
+        report = data['data']
+        self.assertEqual(report['inserted'], 3)
+        self.assertEqual(report['failed'], 6)
+        self.assertEqual([error['line'] for error in report['errors']], [2, 4, 5, 7, 8, 9])
+        self.assertIn('Unknown fields: author_id', report['errors'][2]['message'])
+        self.assertFalse(report['errors_truncated'])
+        self.assertIn('rows_per_second', report)
+        questions = Question.query.order_by(Question.id).all()
+        self.assertEqual([q.body for q in questions], ['first', 'third', 'fourth'])
+        self.assertEqual({q.author_id for q in questions}, {self.admin.id})
+        self.assertEqual(questions[1].difficulty, 'Hard')
+
+    def test_batches(self):
+        self.app.config['BULK_IMPORT_BATCH'] = 2
+        try:
+            with self.client:
+                response, data = self.upload(ndjson(*[question(f'q{i}') for i in range(5)]))
+        finally:
+            self.app.config['BULK_IMPORT_BATCH'] = 1000
+        self.assertEqual(data['data']['inserted'], 5)
+        self.assertEqual(Question.query.count(), 5)
+
+    def test_imported_rows_are_searchable(self):
+        with self.client:
+            self.upload(ndjson(question('reverse a linked list')))
+            response = self.client.get('/questions/search?q=linked', headers={'Authorization': f'Bearer {self.token}'})
+            data = json.loads(response.data.decode())
+        self.assertEqual(len(data['data']['questions']), 1)
+
+    def test_csv(self):
+        body = (
+            'difficulty,body,test_code,test_solution\n'
+            'Easy,"multi\nline body",code,solution\n'
+            'Easy,too,many,fields,here\n'
+            'Moderate,plain,code,solution\n'
+        ).encode() + b'Hard,bad \xff byte,code,solution\n'
+        with self.client:
+            response, data = self.upload(body, 'text/csv')
+        report = data['data']
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual(report['errors'], [
+            {'line': 4, 'message': 'Too many fields'},
+            {'line': 6, 'message': 'Invalid UTF-8'}
+        ])
+        self.assertEqual(Question.query.order_by(Question.id).first().body, 'multi\nline body')
+
+    def test_csv_open_quote(self):
+        """ A quote left open at the end is reported after the rows already inserted, not a 500 """
+        body = b'body,test_code,test_solution,difficulty\na,b,c,Easy\n"never closed,b,c,Easy\n'
+        with self.client:
+            response, data = self.upload(body, 'text/csv')
+        self.assertEqual(response.status_code, 200)
+        report = data['data']
+        self.assertEqual((report['inserted'], report['failed']), (1, 1))
+        self.assertEqual(report['errors'][0]['line'], 3)
+
+    def test_csv_header(self):
+        with self.client:
+            response, data = self.upload(b'body,code\nx,y\n', 'text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('CSV header', data['message'])
+
+    def test_error_reports_are_capped(self):
+        self.app.config['BULK_IMPORT_MAX_ERRORS'] = 2
+        try:
+            with self.client:
+                response, data = self.upload(ndjson(*['oops'] * 5))
+        finally:
+            self.app.config['BULK_IMPORT_MAX_ERRORS'] = 100
+        self.assertEqual(data['data']['failed'], 5)
+        self.assertEqual(len(data['data']['errors']), 2)
+        self.assertTrue(data['data']['errors_truncated'])
+
+    def test_unsupported_format(self):
+        with self.client:
+            response, data = self.upload(json.dumps([question()]), 'application/json')
+        self.assertEqual(response.status_code, 415)
+
+    def test_not_admin(self):
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.token = user.encode_jwt(user.id).decode()
+        with self.client:
+            response, data = self.upload(ndjson(question()))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Question.query.count(), 0)
+
+
+class TestCSVRecords(unittest.TestCase):
+    def test_line_numbers(self):
+        lines = [b'body,test_code,test_solution,difficulty\n', b'a,b,c,Easy\n', b'"d\n', b'e",f,g,Hard\n']
+        records = list(csv_records(iter(lines)))
+        self.assertEqual([line for line, _, _ in records], [2, 3])
+        self.assertEqual(records[1][1]['body'], 'd\ne')
+
+    def test_unparseable_row_stops_the_read(self):
+        lines = [b'body,test_code,test_solution,difficulty\n', b'a,b,c,Easy\n', b'"d,e,f,Hard\n', b'g,h,i,Easy\n']
+        records = list(csv_records(iter(lines)))
+        self.assertEqual([(line, error is None) for line, _, error in records], [(2, True), (3, False)])
+        self.assertIn('Invalid CSV', records[1][2])
+
+    def test_long_fields(self):
+        """ Fields past the csv module's default 128KiB limit are read like long NDJSON lines """
+        body = 'x' * 200000
+        lines = [b'body,test_code,test_solution,difficulty\n', f'{body},b,c,Easy\n'.encode()]
+        records = list(csv_records(iter(lines)))
+        self.assertEqual(records[0][1]['body'], body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+import json
+import unittest
+from array import array
+
+from sqlalchemy import exc, text
+
+from project import db, question_catalog
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_question
+
+
+class TestQuestionCatalog(BaseTestCase):
+    """ List, count and random questions answered from the worker's in memory catalog """
+    def setUp(self):
+        super().setUp()
+        self.app.config['QUESTION_CATALOG'] = True
+        self.interval = question_catalog.interval
+        question_catalog.interval = 60 # only this worker's own writes refresh, unless a test says otherwise
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.other = add_user('other', 'other@testing.io', 'testpass')
+        for i in range(7):
+            add_question(self.user.id, f'question {i} ' + 'x' * 120, difficulty=('Easy', 'Moderate', 'Hard')[i % 3])
+        add_question(self.other.id, 'not mine', difficulty='Hard')
+        self.user_id, self.other_id = self.user.id, self.other.id
+        self.token = self.user.encode_jwt(self.user.id).decode()
+
+    def tearDown(self):
+        super().tearDown()
+        self.app.config['QUESTION_CATALOG'] = False
+        question_catalog.interval = self.interval
+
+    def request(self, method, url, **kwargs):
+        response = getattr(self.client, method)(url, headers={'Authorization': f'Bearer {self.token}'}, **kwargs)
+        return response, json.loads(response.data.decode()) if response.data else None
+
+    def get(self, url):
+        return self.request('get', url)
+
+    def test_pages_match_postgres(self):
+        urls = [
+            '/questions?limit=3',
+            '/questions?difficulty=hard&count=true',
+            f'/questions?author_id={self.other_id}&count=true&fields=id,preview',
+            '/questions?fields=difficulty&limit=2',
+            '/questions/user?count=true&limit=50',
+            '/questions/user?difficulty=Easy&count=true&fields=id,body',
+            f'/questions/user?author_id={self.other_id}&count=true',
+        ]
+        with self.client:
+            for url in urls:
+                while url:
+                    self.app.config['QUESTION_CATALOG'] = False
+                    expected = self.get(url)[1]
+                    self.app.config['QUESTION_CATALOG'] = True
+                    response, data = self.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(data, expected, url)
+                    cursor = data['data']['next_cursor']
+                    url = url.split('&cursor=')[0] + f'&cursor={cursor}' if cursor else None
+        self.assertEqual(question_catalog.stats()['full_loads'], 1)
+
+    def test_served_from_memory(self):
+        with self.client:
+            self.get('/questions/user?fields=id') # loads the catalog and warms the auth cache
+            with self.assertNumQueries(0):
+                response, data = self.get('/questions?fields=id,author_id,difficulty&count=true&difficulty=Moderate')
+            self.assertEqual(data['data']['num_question'], 2)
+            self.assertEqual(data['data']['questions'][0]['difficulty'], 'Moderate')
+            # text is read once, then held
+            with self.assertNumQueries(1) as statements:
+                response, data = self.get('/questions?fields=id,preview')
+            self.assertIn('body, test_code, test_solution', statements[0])
+            self.assertEqual(len(data['data']['questions'][0]['preview']), 100)
+            with self.assertNumQueries(0):
+                response, data = self.get('/questions?fields=id,test_code')
+            self.assertEqual(data['data']['questions'][0]['test_code'], 'test')
+
+    def test_own_writes(self):
+        """ Writes through this worker show up on its next read, from the change log rather than a reload """
+        with self.client:
+            self.get('/questions')
+            response, _ = self.request('post', '/questions', content_type='application/json', data=json.dumps({
+                'body': 'new', 'test_code': 'c', 'test_solution': 's', 'difficulty': 'Easy'
+            }))
+            self.assertEqual(response.status_code, 201)
+            response, data = self.get('/questions/user?difficulty=Easy&count=true&limit=50')
+            self.assertEqual(data['data']['num_question'], 4)
+            added = data['data']['questions'][-1]
+            self.assertEqual(added['body'], 'new')
+
+            self.request('patch', f'/questions/{added["id"]}/user/{self.user_id}',
+                         content_type='application/json', data=json.dumps({'difficulty': 'Hard', 'body': 'edited'}))
+            response, data = self.get('/questions?difficulty=Hard&limit=50')
+            self.assertIn({**added, 'difficulty': 'Hard', 'body': 'edited'}, data['data']['questions'])
+
+            self.request('delete', f'/questions/{added["id"]}/user/{self.user_id}')
+            response, data = self.get('/questions?count=true&limit=50')
+            self.assertEqual(data['data']['num_question'], 8)
+            self.assertNotIn(added['id'], [question['id'] for question in data['data']['questions']])
+        stats = question_catalog.stats()
+        self.assertEqual(stats['full_loads'], 1)
+        self.assertEqual(stats['deleted'], 1)
+
+    def test_other_workers_writes(self):
+        """ Writes made elsewhere are picked up once the interval has passed """
+        with self.client:
+            response, data = self.get('/questions?count=true&fields=id,body')
+            first = data['data']['questions'][0]
+            add_question(self.other_id, 'elsewhere')
+            db.session.execute(text("UPDATE questions SET body = 'changed' WHERE id = :id"), {'id': first['id']})
+            db.session.commit()
+            response, data = self.get('/questions?count=true&fields=id,body')
+            self.assertEqual(data['data']['num_question'], 8)
+            question_catalog.interval = 0
+            response, data = self.get('/questions?count=true&fields=id,body')
+            self.assertEqual(data['data']['num_question'], 9)
+            self.assertEqual(data['data']['questions'][0], {'id': first['id'], 'body': 'changed'})
+        self.assertEqual(question_catalog.stats()['full_loads'], 1)
+
+    def test_changes_logged_in_commit_order(self):
+        """ A writer takes its seq only once the one before it committed, so none can be skipped """
+        first, second = db.engine.connect(), db.engine.connect()
+        try:
+            slow = first.begin()
+            first.execute(text("UPDATE questions SET body = 'slow' WHERE author_id = :author"), author=self.other_id)
+            blocked = second.begin()
+            second.execute(text("SET LOCAL lock_timeout = '50ms'"))
+            with self.assertRaises(exc.OperationalError):
+                second.execute(text("DELETE FROM questions WHERE author_id = :author"), author=self.user_id)
+            blocked.rollback()
+            slow.commit()
+        finally:
+            first.close()
+            second.close()
+        add_question(self.other_id, 'after')
+        seqs = [row[0] for row in db.session.execute(text('SELECT seq FROM question_changes ORDER BY seq'))]
+        self.assertEqual(seqs, list(range(1, 11)))
+
+    def test_truncate_reloads(self):
+        """ A truncate is reloaded in the background, the snapshot before it is served meanwhile """
+        with self.client:
+            self.get('/questions')
+            db.session.execute(text('TRUNCATE questions'))
+            db.session.commit()
+            question_catalog.interval = 0
+            response, data = self.get('/questions?count=true')
+            self.assertEqual(response.status_code, 200)
+            question_catalog.wait()
+            response, data = self.get('/questions?count=true')
+            self.assertEqual(data['data'], {'questions': [], 'next_cursor': None, 'num_question': 0})
+        self.assertEqual(question_catalog.stats()['full_loads'], 2)
+
+    def test_ttl_reloads_in_background(self):
+        with self.client:
+            self.get('/questions')
+            ttl, question_catalog.ttl = question_catalog.ttl, 0
+            try:
+                question_catalog.interval = 0
+                add_question(self.other_id, 'during')
+                response, data = self.get('/questions?count=true&fields=id')
+                self.assertEqual(data['data']['num_question'], 9) # applied from the log, the reload isn't awaited
+                question_catalog.wait()
+            finally:
+                question_catalog.ttl = ttl
+            self.assertEqual(question_catalog.stats()['full_loads'], 2)
+            response, data = self.get('/questions?count=true&fields=id')
+            self.assertEqual(data['data']['num_question'], 9)
+
+    def test_difficulty_pages_and_picks(self):
+        """ ?difficulty= pages and picks read the difficulty's own ids, edits move them between difficulties """
+        with self.client:
+            response, data = self.get('/questions?difficulty=Easy&fields=id,difficulty&limit=50')
+            easy = [question['id'] for question in data['data']['questions']]
+            self.assertEqual(len(easy), 3)
+            self.request('patch', f'/questions/{easy[0]}/user/{self.user_id}',
+                         content_type='application/json', data=json.dumps({'difficulty': 'Hard'}))
+            self.request('delete', f'/questions/{easy[1]}/user/{self.user_id}')
+            response, data = self.get('/questions?difficulty=Easy&fields=id&limit=50')
+            self.assertEqual([question['id'] for question in data['data']['questions']], easy[2:])
+            response, data = self.get('/questions?difficulty=Hard&fields=id&limit=2')
+            self.assertEqual(data['data']['questions'][0]['id'], easy[0])
+            picks = {self.get('/questions/random?difficulty=Easy&fields=id')[1]['data']['id'] for _ in range(20)}
+            self.assertEqual(picks, set(easy[2:]))
+
+    def test_sample_when_the_excluded_author_wrote_most(self):
+        with self.client:
+            self.get('/questions')
+        question_catalog._set_columns(
+            array('i', range(1, 1001)), array('i', [1] * 990 + [2] * 10), array('b', [3] * 1000), 1, 0
+        )
+        picks = {question_catalog.sample(3, exclude_author=1)[0] for _ in range(200)}
+        self.assertEqual(picks, set(range(991, 1001)))
+        self.assertIsNone(question_catalog.sample(1))
+        question_catalog._set_columns(array('i', [1, 2]), array('i', [1, 1]), array('b', [3, 3]), 1, 0)
+        self.assertIsNone(question_catalog.sample(3, exclude_author=1))
+
+    def test_memory_stats_count_the_author_indexes(self):
+        question_catalog._set_columns(array('i', range(1, 1001)), array('i', [1] * 1000), array('b', [3] * 1000), 1, 0)
+        one_author = question_catalog.stats()
+        question_catalog._set_columns(array('i', range(1, 1001)), array('i', range(1, 1001)), array('b', [3] * 1000), 1, 0)
+        many_authors = question_catalog.stats()
+        self.assertGreater(one_author['column_bytes'], 1000 * 21) # 21 bytes a row across the five columns
+        # a dict and an array for every author, on top of the same 1000 ids
+        self.assertGreater(many_authors['index_bytes'] - one_author['index_bytes'], 1000 * 64 * 2)
+
+    def test_etag(self):
+        with self.client:
+            response, data = self.get('/questions')
+            etag = response.headers['ETag']
+            self.app.config['QUESTION_CATALOG'] = False
+            self.assertEqual(self.get('/questions')[0].headers['ETag'], etag) # the same version, the same tag
+            self.app.config['QUESTION_CATALOG'] = True
+            response = self.client.get('/questions', headers={
+                'Authorization': f'Bearer {self.token}',
+                'If-None-Match': etag
+            })
+            self.assertEqual(response.status_code, 304)
+            self.request('delete', f'/questions/{data["data"]["questions"][0]["id"]}/user/{self.user_id}')
+            self.assertNotEqual(self.get('/questions')[0].headers['ETag'], etag)
+
+    def test_random(self):
+        with self.client:
+            for _ in range(10):
+                response, data = self.get(f'/questions/random?difficulty=Hard&exclude_author={self.user_id}')
+                self.assertEqual(data['data']['author_id'], self.other_id)
+                self.assertEqual(data['data']['body'], 'not mine')
+            with self.assertNumQueries(0):
+                response, data = self.get('/questions/random?difficulty=Moderate&fields=id,difficulty')
+            self.assertEqual(data['data']['difficulty'], 'Moderate')
+            response, data = self.get(f'/questions/random?difficulty=Moderate&exclude_author={self.user_id}')
+            self.assertEqual(response.status_code, 404)
+
+    def test_text_budget(self):
+        """ Past QUESTION_CATALOG_TEXT_BYTES the held text is dropped and read again as needed """
+        text_bytes = question_catalog.text_bytes
+        question_catalog.text_bytes = 400
+        try:
+            with self.client:
+                response, data = self.get('/questions?limit=50')
+                self.assertEqual(len(data['data']['questions']), 8)
+                self.assertTrue(all(question['body'].startswith(('question', 'not mine')) for question in data['data']['questions']))
+        finally:
+            question_catalog.text_bytes = text_bytes
+        stats = question_catalog.stats()
+        self.assertGreater(stats['text_resets'], 0)
+        self.assertLessEqual(stats['text_bytes'], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
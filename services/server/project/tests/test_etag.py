@@ -0,0 +1,86 @@
+import json
+import unittest
+
+from project import db
+from project.api.models import User, TableVersion
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_question
+
+
+class TestETags(BaseTestCase):
+    """ Conditional GETs with If-None-Match """
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.question = add_question(self.user.id)
+        self.headers = {'Authorization': f'Bearer {self.user.encode_jwt(self.user.id).decode()}'}
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, headers=dict(self.headers, **{'If-None-Match': etag}))
+
+    def test_users_list_not_modified(self):
+        with self.client:
+            response = self.client.get('/users', headers=self.headers)
+            etag = response.headers['ETag']
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(1): # auth is cached, only the version lookup runs
+                response = self.revalidate('/users', etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b'')
+            self.assertEqual(response.headers['ETag'], etag)
+
+    def test_users_list_changes_after_write(self):
+        with self.client:
+            etag = self.client.get('/users?count=true', headers=self.headers).headers['ETag']
+            add_user('another', 'another@testing.io', 'testpass')
+            response = self.revalidate('/users?count=true', etag)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data']['num_users'], 2)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_single_user(self):
+        with self.client:
+            etag = self.client.get(f'/users/{self.user.id}').headers['ETag']
+            self.assertEqual(self.revalidate(f'/users/{self.user.id}', etag).status_code, 304)
+            self.client.put(
+                f'/users/{self.user.id}',
+                data=json.dumps({'username': 'renamed'}),
+                content_type='application/json',
+                headers=self.headers
+            )
+            response = self.revalidate(f'/users/{self.user.id}', etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('renamed', json.loads(response.data.decode())['data']['username'])
+
+    def test_question_list_etag_per_query(self):
+        """ Different pages or filters never share an ETag """
+        with self.client:
+            etag = self.client.get('/questions', headers=self.headers).headers['ETag']
+            self.assertEqual(self.revalidate('/questions', etag).status_code, 304)
+            self.assertEqual(self.revalidate('/questions?difficulty=Hard', etag).status_code, 200)
+            add_question(self.user.id)
+            self.assertEqual(self.revalidate('/questions', etag).status_code, 200)
+
+    def test_question_by_user_checks_permission_first(self):
+        other = add_user('other', 'other@testing.io', 'testpass')
+        url = f'/questions/{self.question.id}/user/{self.user.id}'
+        with self.client:
+            etag = self.client.get(url, headers=self.headers).headers['ETag']
+            self.assertEqual(self.revalidate(url, etag).status_code, 304)
+            response = self.client.get(url, headers={
+                'Authorization': f'Bearer {other.encode_jwt(other.id).decode()}',
+                'If-None-Match': etag
+            })
+            self.assertEqual(response.status_code, 403)
+
+    def test_bulk_delete_bumps_version(self):
+        """ The trigger also sees statements that bypass the ORM unit of work """
+        before = TableVersion.query.get('users').version
+        db.session.query(User).filter(User.id == -1).delete()
+        db.session.commit()
+        self.assertEqual(TableVersion.query.get('users').version, before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import gzip
+import json
+import unittest
+
+from sqlalchemy import event
+
+from project import db
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_admin_user, add_question
+
+
+class TestExport(BaseTestCase):
+    """ Tests for the /export/<table> NDJSON dumps """
+    def setUp(self):
+        super().setUp()
+        self.admin = add_admin_user('admin', 'admin@testing.io', 'testpass')
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.questions = [add_question(self.user.id, f'question {i}', difficulty='Hard').id for i in range(5)]
+        self.token = self.admin.encode_jwt(self.admin.id).decode()
+
+    def export(self, url, gzipped=True):
+        # no `with self.client` here, it would hold on to the request context
+        # that stream_with_context pops once the body is read
+        headers = {'Authorization': f'Bearer {self.token}'}
+        if gzipped:
+            headers['Accept-Encoding'] = 'gzip'
+        return self.client.get(url, headers=headers)
+
+    def lines(self, response):
+        body = response.data
+        if response.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return [json.loads(line) for line in body.decode().splitlines()]
+
+    def test_questions_gzip(self):
+        response = self.export('/export/questions')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        rows = self.lines(response)
+        self.assertEqual([row['id'] for row in rows], self.questions)
+        self.assertEqual(rows[0], {
+            'id': self.questions[0], 'author_id': self.user.id, 'body': 'question 0',
+            'test_code': 'test', 'test_solution': 'test', 'difficulty': 'Hard'
+        })
+
+    def test_users_plain(self):
+        """ Without Accept-Encoding: gzip the dump is sent uncompressed, never with password hashes """
+        response = self.export('/export/users', gzipped=False)
+        self.assertNotIn('Content-Encoding', response.headers)
+        rows = self.lines(response)
+        self.assertEqual([row['username'] for row in rows], ['admin', 'testuser'])
+        self.assertEqual(set(rows[0]), {'id', 'username', 'email', 'active', 'admin', 'created_date'})
+
+    def test_resume_after_id(self):
+        rows = self.lines(self.export(f'/export/questions?after_id={self.questions[2]}'))
+        self.assertEqual([row['id'] for row in rows], self.questions[3:])
+
+    def test_server_side_cursor(self):
+        """ Rows are fetched in EXPORT_BATCH_SIZE batches from a named cursor, not all at once """
+        cursors = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if 'FROM questions' in statement:
+                cursors.append(cursor.name)
+        self.app.config['EXPORT_BATCH_SIZE'] = 2
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            rows = self.lines(self.export('/export/questions'))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+            self.app.config['EXPORT_BATCH_SIZE'] = 1000
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(len(cursors), 1)
+        self.assertIsNotNone(cursors[0])
+
+    def test_invalid_requests(self):
+        with self.client:
+            self.assertEqual(self.export('/export/passwords').status_code, 404)
+            self.assertEqual(self.export('/export/users?after_id=abc').status_code, 400)
+            self.token = self.user.encode_jwt(self.user.id).decode()
+            self.assertEqual(self.export('/export/users').status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import bcrypt
+
+from project import hashing_pool
+from project.api.hashing import HashingPool, HashingPoolFull
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_admin_user
+
+
+class TestHashingPool(unittest.TestCase):
+    """ Tests for the bcrypt process pool on its own """
+    def setUp(self):
+        self.pool = HashingPool()
+        self.pool.size = 1
+        self.pool.rounds = 4
+        self.pool._slots = threading.BoundedSemaphore(1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_hash_and_check(self):
+        pw_hash = self.pool.hash_password('testpass')
+        self.assertTrue(bcrypt.checkpw(b'testpass', pw_hash.encode()))
+        self.assertTrue(self.pool.check_password(pw_hash, 'testpass'))
+        self.assertFalse(self.pool.check_password(pw_hash, 'wrongpass'))
+
+    def test_empty_password(self):
+        with self.assertRaises(ValueError):
+            self.pool.hash_password('')
+
+    def test_full(self):
+        """ No free slot raises instead of queueing """
+        self.pool._slots.acquire()
+        with self.assertRaises(HashingPoolFull):
+            self.pool.hash_password('testpass')
+        self.pool._slots.release()
+        self.assertTrue(self.pool.hash_password('testpass'))
+
+
+class TestHashingPoolThreads(unittest.TestCase):
+    """ The pool sized against the gunicorn threads that call it """
+    def make_pool(self, threads, size, queue):
+        pool = HashingPool()
+        config = {'GUNICORN_THREADS': threads, 'BCRYPT_POOL_SIZE': size, 'BCRYPT_POOL_QUEUE': queue, 'BCRYPT_LOG_ROUNDS': 4}
+        pool.init_app(SimpleNamespace(config=config))
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_slots_must_be_below_the_threads(self):
+        """ With a slot for every thread no caller could ever be turned away """
+        for size, queue in ((2, 0), (1, 1), (2, 8)):
+            with self.assertRaises(ValueError):
+                self.make_pool(2, size, queue)
+        self.make_pool(1, 0, 8) # inline, nothing to bound
+        self.make_pool(2, 1, 0)
+
+    def test_full_with_every_thread_calling(self):
+        """ prod: 2 threads, a pool of 1. While one thread hashes the other gets HashingPoolFull """
+        pool = self.make_pool(2, 1, 0)
+        pool.rounds = 12 # long enough for the second caller to arrive while the first hashes
+        results = []
+        first = threading.Thread(target=lambda: results.append(pool.hash_password('testpass')))
+        first.start()
+        while pool._slots._value:
+            time.sleep(0.001)
+        with self.assertRaises(HashingPoolFull):
+            pool.hash_password('testpass')
+        first.join()
+        self.assertEqual(len(results), 1)
+        self.assertTrue(pool.check_password(results[0], 'testpass')) # the slot is free again
+
+
+class TestHashingPoolFullResponses(BaseTestCase):
+    """ Endpoints that hash answer 503 with Retry-After when the pool is saturated """
+    def setUp(self):
+        super().setUp()
+        self.size, self.slots = hashing_pool.size, hashing_pool._slots
+        hashing_pool.size = 1
+        hashing_pool._slots = threading.BoundedSemaphore(1)
+        hashing_pool._slots.acquire()
+
+    def tearDown(self):
+        hashing_pool.size, hashing_pool._slots = self.size, self.slots
+        super().tearDown()
+
+    def assertBusy(self, response):
+        data = json.loads(response.data.decode())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertIn('fail', data['status'])
+
+    def test_register_busy(self):
+        with self.client:
+            response = self.client.post(
+                '/login/register',
+                data=json.dumps({'username': 'test', 'email': 'test@testing.io', 'password': 'testpass'}),
+                content_type='application/json'
+            )
+            self.assertBusy(response)
+
+    def test_login_busy(self):
+        add_user('test', 'test@testing.io', 'testpass')
+        with self.client:
+            response = self.client.post(
+                '/login/login',
+                data=json.dumps({'email': 'test@testing.io', 'password': 'testpass'}),
+                content_type='application/json'
+            )
+            self.assertBusy(response)
+
+    def test_add_user_busy(self):
+        admin = add_admin_user('admin', 'admin@testing.io', 'testpass')
+        token = admin.encode_jwt(admin.id).decode()
+        with self.client:
+            response = self.client.post(
+                '/users',
+                data=json.dumps({'username': 'test', 'email': 'test@testing.io', 'password': 'testpass'}),
+                content_type='application/json',
+                headers={'Authorization': f'Bearer {token}'}
+            )
+            self.assertBusy(response)
+
+
+if __name__ == '__main__':
+    unittest.main()
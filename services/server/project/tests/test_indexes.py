@@ -0,0 +1,97 @@
+import unittest
+
+from sqlalchemy import event
+
+from project import db
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_question
+
+
+def trigram_available():
+    return bool(db.session.execute(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    ).scalar())
+
+
+class IndexTestCase(BaseTestCase):
+    """ EXPLAIN the SQL the list endpoints really send and check it uses the indexes """
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        for difficulty in ('Easy', 'Moderate', 'Hard'):
+            add_question(self.user.id, difficulty=difficulty)
+        self.headers = {'Authorization': f'Bearer {self.user.encode_jwt(self.user.id).decode()}'}
+
+    def capture_page_query(self, url, table='questions'):
+        """ (statement, parameters) of the last keyset page SELECT on table issued by url """
+        captured = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT') and f'FROM {table}' in statement and 'ORDER BY' in statement:
+                captured.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            with self.client:
+                response = self.client.get(url, headers=self.headers)
+                self.assertEqual(response.status_code, 200)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        return captured[-1]
+
+    def explain(self, statement, parameters, bitmap=False):
+        # a three row table is always cheapest to seq scan, make the planner show its index choice
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            if not bitmap:
+                cursor.execute('SET LOCAL enable_bitmapscan = off')
+            cursor.execute('EXPLAIN ' + statement, parameters)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        finally:
+            connection.close()
+
+
+class TestQuestionIndexes(IndexTestCase):
+    def test_author_page_uses_index(self):
+        plan = self.explain(*self.capture_page_query('/questions/user'))
+        self.assertIn('Index', plan)
+        self.assertIn('ix_questions_author_id_id', plan)
+
+    def test_author_filter_uses_index(self):
+        plan = self.explain(*self.capture_page_query(f'/questions?author_id={self.user.id}'))
+        self.assertIn('ix_questions_author_id_id', plan)
+
+    def test_difficulty_page_uses_index(self):
+        plan = self.explain(*self.capture_page_query('/questions?difficulty=hard'))
+        self.assertIn('ix_questions_difficulty_id', plan)
+        self.assertNotIn('Sort', plan) # (difficulty, id) already returns rows in keyset order
+
+    def test_search_uses_gin_index(self):
+        plan = self.explain(*self.capture_page_query('/questions/search?q=test'), bitmap=True) # gin only does bitmap scans
+        self.assertIn('ix_questions_search_vector', plan)
+
+    def test_difficulty_stored_as_smallint(self):
+        code = db.session.execute('SELECT difficulty FROM questions ORDER BY id').fetchall()
+        self.assertEqual([row[0] for row in code], [1, 2, 3])
+
+
+class TestUserIndexes(IndexTestCase):
+    """ The user directory filters and search """
+    def test_inactive_filter_uses_partial_index(self):
+        plan = self.explain(*self.capture_page_query('/users?active=false', 'users'))
+        self.assertIn('ix_users_inactive_id', plan)
+
+    def test_admin_filter_uses_partial_index(self):
+        plan = self.explain(*self.capture_page_query('/users?admin=true', 'users'))
+        self.assertIn('ix_users_admin_id', plan)
+
+    def test_search_uses_trigram_index(self):
+        if not trigram_available():
+            self.skipTest('pg_trgm is not installed on this server')
+        plan = self.explain(*self.capture_page_query('/users?q=testuser', 'users'), bitmap=True)
+        self.assertIn('ix_users_username_trgm', plan)
+        self.assertIn('ix_users_email_trgm', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
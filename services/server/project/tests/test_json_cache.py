@@ -0,0 +1,114 @@
+import json
+import unittest
+
+from sqlalchemy import text
+
+from project import db, question_json_cache
+from project.api.cache import FragmentCache
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_question
+
+
+class TestQuestionJsonCache(BaseTestCase):
+    """ List pages assembled from each question's cached, already encoded json """
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        for i in range(4):
+            add_question(self.user.id, f'question {i}', difficulty='Hard' if i % 2 else 'Easy')
+        self.user_id = self.user.id
+        self.token = self.user.encode_jwt(self.user.id).decode()
+
+    def request(self, method, url, **kwargs):
+        response = getattr(self.client, method)(url, headers={'Authorization': f'Bearer {self.token}'}, **kwargs)
+        return response, json.loads(response.data.decode()) if response.data else None
+
+    def get(self, url):
+        return self.request('get', url)
+
+    def test_second_page_is_a_hit(self):
+        with self.client:
+            response, first = self.get('/questions?limit=3')
+            with self.assertNumQueries(2) as statements: # etag, page keys
+                response, second = self.get('/questions?limit=3')
+            self.assertEqual(second, first)
+            self.assertNotIn('body', statements[-1])
+        self.assertEqual(question_json_cache.stats()['hits'], 3)
+
+    def test_same_response_as_uncached(self):
+        urls = [
+            '/questions?count=true',
+            '/questions?difficulty=Hard&fields=id,preview',
+            '/questions/user?limit=2&count=true',
+            '/questions?fields=difficulty&limit=1',
+        ]
+        with self.client:
+            for url in urls:
+                self.get(url) # fill
+                response, cached = self.get(url)
+                question_json_cache.max_bytes = 0
+                try:
+                    response, uncached = self.get(url)
+                finally:
+                    question_json_cache.max_bytes = self.app.config['QUESTION_JSON_CACHE_BYTES']
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(cached, uncached, url)
+                self.assertEqual(cached['status'], 'success')
+
+    def test_fields_are_cached_separately(self):
+        with self.client:
+            self.get('/questions?fields=id')
+            response, data = self.get('/questions?fields=id,body')
+            self.assertEqual(set(data['data']['questions'][0]), {'id', 'body'})
+        self.assertEqual(question_json_cache.stats()['size'], 8)
+
+    def test_writes_elsewhere_change_the_version(self):
+        """ A row written by another worker or a script is looked up under its new version """
+        with self.client:
+            response, data = self.get('/questions?fields=id,body')
+            first = data['data']['questions'][0]['id']
+            db.session.execute(text("UPDATE questions SET body = 'changed' WHERE id = :id"), {'id': first})
+            db.session.commit()
+            response, data = self.get('/questions?fields=id,body')
+            self.assertEqual(data['data']['questions'][0], {'id': first, 'body': 'changed'})
+
+    def test_writes_invalidate(self):
+        with self.client:
+            response, data = self.get('/questions')
+            first, second = [question['id'] for question in data['data']['questions'][:2]]
+            self.request('put', f'/questions/{first}/user/{self.user_id}',
+                         content_type='application/json', data=json.dumps({'body': 'edited'}))
+            self.request('delete', f'/questions/{second}/user/{self.user_id}')
+            self.assertEqual(question_json_cache.stats()['size'], 2)
+            response, data = self.get('/questions')
+            self.assertEqual(data['data']['questions'][0]['body'], 'edited')
+            self.assertNotIn(second, [question['id'] for question in data['data']['questions']])
+
+
+class TestFragmentCache(unittest.TestCase):
+    def test_bounded_by_bytes(self):
+        cache = FragmentCache(max_bytes=10)
+        cache.set((1, 'a', None), b'1234')
+        cache.set((2, 'a', None), b'1234')
+        cache.get_many([(1, 'a', None)]) # 1 is now the most recently used
+        cache.set((3, 'a', None), b'1234')
+        self.assertEqual(cache.get_many([(1, 'a', None), (2, 'a', None), (3, 'a', None)]), [b'1234', None, b'1234'])
+        self.assertEqual((cache.size, cache.evictions), (8, 1))
+
+    def test_oversized_fragment_is_not_kept(self):
+        cache = FragmentCache(max_bytes=4)
+        cache.set((1, 'a', None), b'12345')
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_invalidate_drops_every_version(self):
+        cache = FragmentCache()
+        cache.set((1, 'a', None), b'{}')
+        cache.set((1, 'b', ('id',)), b'{}')
+        cache.set((2, 'a', None), b'{}')
+        cache.invalidate(1)
+        self.assertEqual(cache.get_many([(1, 'a', None), (1, 'b', ('id',)), (2, 'a', None)]), [None, None, b'{}'])
+        self.assertEqual(cache.size, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
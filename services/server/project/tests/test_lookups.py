@@ -0,0 +1,69 @@
+import unittest
+
+from sqlalchemy import text
+
+from project import db
+from project.api.lookups import user_by_id, user_by_email, question_by_author
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_question
+
+
+class TestLookups(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.question = add_question(author_id=self.user.id, difficulty='Hard')
+        self.user_id, self.question_id = self.user.id, self.question.id
+        db.session.expunge_all()
+
+    def test_prepared_lookups(self):
+        with self.assertNumQueries(3) as statements:
+            user = user_by_id.get(id=self.user_id)
+            self.assertEqual(user_by_email.get(email='test@testing.io').id, self.user_id)
+            question = question_by_author.get(id=self.question_id, author_id=self.user_id)
+        self.assertTrue(all(statement.startswith('EXECUTE ') for statement in statements))
+        self.assertEqual(user.username, 'testuser')
+        self.assertTrue(user.active)
+        self.assertEqual(question.difficulty, 'Hard') # result types still apply
+        self.assertEqual(question.to_json()['author_id'], self.user_id)
+        prepared = db.session.execute(text('SELECT name FROM pg_prepared_statements')).fetchall()
+        self.assertTrue({'user_by_id', 'user_by_email', 'question_by_author'} <= {row[0] for row in prepared})
+
+    def test_prepared_once_per_connection(self):
+        user_by_id.get(id=self.user_id)
+        connection = db.session.connection()
+        self.assertIn('user_by_id', connection.connection.info['prepared_statements'])
+        user_by_id.get(id=self.user_id) # a second PREPARE of the same name would fail
+
+    def test_missing_row(self):
+        self.assertIsNone(user_by_id.get(id=self.user_id + 1))
+        self.assertIsNone(user_by_email.get(email=None))
+        self.assertIsNone(question_by_author.get(id=self.question_id, author_id=self.user_id + 1))
+
+    def test_identity_map(self):
+        user = user_by_id.get(id=self.user_id)
+        self.assertIs(user_by_email.get(email='test@testing.io'), user)
+
+    def test_pgbouncer_uses_baked_query(self):
+        self.app.config['SQLALCHEMY_PGBOUNCER'] = True
+        try:
+            with self.assertNumQueries(1) as statements:
+                question = question_by_author.get(id=self.question_id, author_id=self.user_id)
+        finally:
+            self.app.config['SQLALCHEMY_PGBOUNCER'] = False
+        self.assertTrue(statements[0].startswith('SELECT questions.id'))
+        self.assertEqual(question.difficulty, 'Hard')
+
+    def test_prepared_statements_off(self):
+        self.app.config['SQLALCHEMY_PREPARED_STATEMENTS'] = False
+        try:
+            with self.assertNumQueries(1) as statements:
+                user = user_by_email.get(email='test@testing.io')
+        finally:
+            self.app.config['SQLALCHEMY_PREPARED_STATEMENTS'] = True
+        self.assertIn('WHERE users.email = ', statements[0])
+        self.assertEqual(user.id, self.user_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
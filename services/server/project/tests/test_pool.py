@@ -0,0 +1,74 @@
+import json
+import unittest
+
+from sqlalchemy import exc
+from sqlalchemy.pool import NullPool
+
+from project import db
+from project.api.pool import pool_size_for, TimedQueuePool, PooledSQLAlchemy
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_admin_user
+
+
+class TestPoolSizing(unittest.TestCase):
+    def test_pool_size_for(self):
+        self.assertEqual(pool_size_for(workers=4, threads=2, max_connections=20), (2, 3))
+        self.assertEqual(pool_size_for(workers=1, threads=1, max_connections=20), (1, 19))
+        self.assertEqual(pool_size_for(workers=8, threads=4, max_connections=16), (2, 0))
+        self.assertEqual(pool_size_for(workers=30, threads=1, max_connections=20), (1, 0))
+
+    def test_timed_pool_counts_waits_and_timeouts(self):
+        pool = TimedQueuePool(lambda: object(), pool_size=1, max_overflow=0, timeout=0.01)
+        held = pool.connect()
+        with self.assertRaises(exc.TimeoutError):
+            pool.connect()
+        held.close()
+        pool.connect().close()
+        stats = pool.stats.as_dict()
+        self.assertEqual(stats['checkouts'], 3)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['wait_max_ms'], 10)
+        self.assertIs(pool.recreate().stats, pool.stats)
+
+
+class TestPoolConfig(BaseTestCase):
+    def test_engine_options(self):
+        pool = db.engine.pool
+        self.assertIsInstance(pool, TimedQueuePool)
+        self.assertTrue(pool._pre_ping)
+        self.assertEqual(pool.size(), self.app.config['SQLALCHEMY_POOL_SIZE'])
+        self.assertEqual(pool._recycle, self.app.config['SQLALCHEMY_POOL_RECYCLE'])
+
+    def test_pgbouncer_uses_null_pool(self):
+        options = {'pool_size': 5, 'max_overflow': 2}
+        self.app.config['SQLALCHEMY_PGBOUNCER'] = True
+        try:
+            PooledSQLAlchemy().apply_pool_defaults(self.app, options)
+        finally:
+            self.app.config['SQLALCHEMY_PGBOUNCER'] = False
+        self.assertEqual(options, {'poolclass': NullPool})
+
+    def test_metrics(self):
+        admin = add_admin_user('admin', 'admin@testing.io', 'testpass')
+        token = admin.encode_jwt(admin.id).decode()
+        with self.client:
+            response = self.client.get('/metrics', headers={'Authorization': f'Bearer {token}'})
+            data = json.loads(response.data.decode())
+        self.assertEqual(response.status_code, 200)
+        pool = data['data']['pool']
+        self.assertEqual(pool['class'], 'TimedQueuePool')
+        for key in ('size', 'checked_out', 'overflow', 'checkouts', 'timeouts', 'wait_avg_ms', 'wait_max_ms'):
+            self.assertIn(key, pool)
+        self.assertGreater(pool['checkouts'], 0)
+        self.assertIn('auth_cache', data['data'])
+
+    def test_metrics_not_admin(self):
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        token = user.encode_jwt(user.id).decode()
+        with self.client:
+            response = self.client.get('/metrics', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
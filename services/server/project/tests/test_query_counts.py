@@ -0,0 +1,166 @@
+import json
+import unittest
+
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_admin_user, add_question
+
+
+class TestQueryCounts(BaseTestCase):
+    """ Number of SQL statements each endpoint issues with a cold auth cache """
+    def setUp(self):
+        super().setUp()
+        self.admin = add_admin_user('admin', 'admin@testing.io', 'testpass')
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.question = add_question(author_id=self.user.id)
+        self.admin_id, self.user_id, self.question_id = self.admin.id, self.user.id, self.question.id
+
+    def headers(self, user):
+        return {'Authorization': f'Bearer {user.encode_jwt(user.id).decode()}'}
+
+    def warm_headers(self, user):
+        """ Headers for user with the token already in the auth cache, so only the handler's SQL is counted """
+        headers = self.headers(user)
+        with self.client:
+            self.client.get('/questions/user?limit=1', headers=headers)
+        return headers
+
+    def test_get_questions(self):
+        headers = self.headers(self.user)
+        with self.client:
+            with self.assertNumQueries(4): # auth, etag, page keys, questions not in the json cache
+                self.client.get('/questions', headers=headers)
+            with self.assertNumQueries(2): # etag, page keys
+                self.client.get('/questions', headers=headers)
+
+    def test_get_questions_with_count(self):
+        headers = self.headers(self.user)
+        with self.client, self.assertNumQueries(5): # auth, etag, page keys, uncached questions, count
+            self.client.get('/questions?count=true', headers=headers)
+
+    def test_random_question(self):
+        headers = self.headers(self.user)
+        with self.client:
+            with self.assertNumQueries(5): # auth, catalog version, latest change, catalog load, question
+                self.client.get('/questions/random', headers=headers)
+            with self.assertNumQueries(2): # catalog version, question
+                response = self.client.get('/questions/random', headers=headers)
+                self.assertEqual(response.status_code, 200)
+
+    def test_post_question(self):
+        headers = self.headers(self.user)
+        with self.client, self.assertNumQueries(2):
+            response = self.client.post(
+                '/questions',
+                data=json.dumps({'body': 'b', 'test_code': 'c', 'test_solution': 's', 'difficulty': 'Easy'}),
+                content_type='application/json',
+                headers=headers
+            )
+            self.assertEqual(response.status_code, 201)
+
+    def test_get_question_by_user(self):
+        headers = self.headers(self.user)
+        with self.client, self.assertNumQueries(3): # auth, etag, question
+            response = self.client.get(f'/questions/{self.question_id}/user/{self.user_id}', headers=headers)
+            self.assertEqual(response.status_code, 200)
+
+    def test_get_question_by_user_admin(self):
+        headers = self.headers(self.admin)
+        with self.client, self.assertNumQueries(3):
+            response = self.client.get(f'/questions/{self.question_id}/user/{self.user_id}', headers=headers)
+            self.assertEqual(response.status_code, 200)
+
+    def test_put_question(self):
+        headers = self.warm_headers(self.user)
+        with self.client, self.assertNumQueries(1) as statements: # UPDATE ... RETURNING
+            response = self.client.put(
+                f'/questions/{self.question_id}/user/{self.user_id}',
+                data=json.dumps({'body': 'updated'}),
+                content_type='application/json',
+                headers=headers
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertIn('RETURNING', statements[0])
+
+    def test_patch_question(self):
+        headers = self.warm_headers(self.admin)
+        with self.client, self.assertNumQueries(1):
+            response = self.client.patch(
+                f'/questions/{self.question_id}/user/{self.user_id}',
+                data=json.dumps({'difficulty': 'hard'}),
+                content_type='application/json',
+                headers=headers
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_delete_question(self):
+        headers = self.warm_headers(self.user)
+        with self.client, self.assertNumQueries(1): # DELETE ... RETURNING
+            response = self.client.delete(f'/questions/{self.question_id}/user/{self.user_id}', headers=headers)
+            self.assertEqual(response.status_code, 204)
+
+    def test_post_user(self):
+        headers = self.headers(self.admin)
+        with self.client, self.assertNumQueries(3): # auth, email check, insert
+            response = self.client.post(
+                '/users',
+                data=json.dumps({'username': 'new', 'email': 'new@testing.io', 'password': 'testpass'}),
+                content_type='application/json',
+                headers=headers
+            )
+            self.assertEqual(response.status_code, 201)
+
+    def test_get_users(self):
+        headers = self.headers(self.user)
+        with self.client, self.assertNumQueries(3): # auth, etag, page
+            self.client.get('/users', headers=headers)
+
+    def test_get_users_with_count(self):
+        headers = self.headers(self.user)
+        with self.client, self.assertNumQueries(4): # auth, etag, page, count
+            self.client.get('/users?count=true', headers=headers)
+
+    def test_put_user(self):
+        headers = self.warm_headers(self.admin)
+        with self.client, self.assertNumQueries(1):
+            response = self.client.put(
+                f'/users/{self.user_id}',
+                data=json.dumps({'username': 'renamed'}),
+                content_type='application/json',
+                headers=headers
+            )
+            self.assertEqual(response.status_code, 201)
+
+    def test_patch_user(self):
+        headers = self.warm_headers(self.user)
+        with self.client, self.assertNumQueries(1):
+            response = self.client.patch(
+                f'/users/{self.user_id}',
+                data=json.dumps({'email': 'renamed@testing.io'}),
+                content_type='application/json',
+                headers=headers
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_delete_user(self):
+        headers = self.warm_headers(self.admin)
+        with self.client, self.assertNumQueries(1):
+            response = self.client.delete(f'/users/{self.admin_id}', headers=headers)
+            self.assertEqual(response.status_code, 204)
+
+    def test_mutation_cold_auth_cache(self):
+        headers = self.headers(self.user)
+        with self.client, self.assertNumQueries(2): # auth, DELETE ... RETURNING
+            self.client.delete(f'/questions/{self.question_id}/user/{self.user_id}', headers=headers)
+
+    def test_warm_auth_cache(self):
+        """ Once a token is cached the auth lookup leaves the request entirely """
+        headers = self.headers(self.user)
+        with self.client:
+            self.client.get('/questions/user', headers=headers)
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/questions/{self.question_id}/user/{self.user_id}', headers=headers)
+                self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
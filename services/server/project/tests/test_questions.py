@@ -1,6 +1,10 @@
 import json
 import unittest
 
+from sqlalchemy import text
+
+from project import db, question_catalog
+from project.api.models import Question
 from project.tests.base import BaseTestCase
 from project.tests.utils import add_question, add_admin_user, add_user
 
@@ -516,5 +520,348 @@ class TestQuestions(BaseTestCase):
             self.assertIn('You do not have permission to delete this question', data['message'])
 
 
+class TestQuestionPagination(BaseTestCase):
+    """ Keyset pagination and filters on the question list endpoints """
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        other = add_user('other', 'other@testing.io', 'testpass')
+        for i in range(7):
+            add_question(self.user.id, f'question {i}', difficulty='Hard' if i % 2 else 'Easy')
+        add_question(other.id, 'not mine', difficulty='Hard')
+        self.token = self.user.encode_jwt(self.user.id).decode()
+
+    def get(self, url):
+        response = self.client.get(url, headers={'Authorization': f'Bearer {self.token}'})
+        return response, json.loads(response.data.decode())
+
+    def test_default_page_size(self):
+        """ Without ?limit= a page holds PAGINATION_NUMBER questions """
+        with self.client:
+            response, data = self.get('/questions')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(data['data']['questions']), 5)
+            self.assertTrue(data['data']['next_cursor'])
+            self.assertNotIn('num_question', data['data'])
+
+    def test_walk_all_pages(self):
+        """ Following next_cursor visits every question once, in id order """
+        with self.client:
+            ids, url = [], '/questions?limit=3'
+            while url:
+                response, data = self.get(url)
+                self.assertEqual(response.status_code, 200)
+                ids += [question['id'] for question in data['data']['questions']]
+                cursor = data['data']['next_cursor']
+                url = f'/questions?limit=3&cursor={cursor}' if cursor else None
+            self.assertEqual(len(ids), 8)
+            self.assertEqual(ids, sorted(ids))
+
+    def test_filters_and_count(self):
+        with self.client:
+            response, data = self.get(f'/questions?difficulty=Hard&author_id={self.user.id}&count=true&limit=50')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data']['num_question'], 3)
+            self.assertEqual(len(data['data']['questions']), 3)
+            self.assertIsNone(data['data']['next_cursor'])
+            for question in data['data']['questions']:
+                self.assertEqual(question['difficulty'], 'Hard')
+                self.assertEqual(question['author_id'], self.user.id)
+
+    def test_user_questions_paginated(self):
+        """ /questions/user only pages through the caller's questions """
+        with self.client:
+            response, data = self.get('/questions/user?limit=4&count=true')
+            self.assertEqual(len(data['data']['questions']), 4)
+            self.assertEqual(data['data']['num_question'], 7)
+            cursor = data['data']['next_cursor']
+            response, data = self.get(f'/questions/user?limit=4&cursor={cursor}')
+            self.assertEqual(len(data['data']['questions']), 3)
+            self.assertIsNone(data['data']['next_cursor'])
+
+    def test_invalid_parameters(self):
+        with self.client:
+            for url in ('/questions?limit=0', '/questions?limit=abc', '/questions?cursor=garbage', '/questions?author_id=x'):
+                response, data = self.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Invalid query parameters', data['message'])
+
+
+class TestQuestionFields(BaseTestCase):
+    """ ?fields= sparse fieldsets on the question endpoints """
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.question = add_question(self.user.id, 'x' * 300)
+        self.token = self.user.encode_jwt(self.user.id).decode()
+
+    def get(self, url):
+        response = self.client.get(url, headers={'Authorization': f'Bearer {self.token}'})
+        return response, json.loads(response.data.decode())
+
+    def test_list_fields_are_not_selected(self):
+        """ Columns the client didn't ask for are neither serialized nor read from postgres """
+        with self.client:
+            self.get('/questions/user') # warm the auth cache
+            with self.assertNumQueries(3) as statements: # etag, page keys, the questions' json
+                response, data = self.get('/questions?fields=id,difficulty,preview')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(data['data']['questions'][0]), {'id', 'difficulty', 'preview'})
+            self.assertEqual(len(data['data']['questions'][0]['preview']), 100)
+            self.assertNotIn('test_code', statements[-1])
+            self.assertNotIn('test_solution', statements[-1])
+
+    def test_list_builds_no_orm_objects(self):
+        """ List pages are serialized straight from rows, nothing enters the identity map """
+        with self.client:
+            db.session.expunge_all()
+            response, data = self.get('/questions')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data']['questions'][0]['difficulty'], 'Easy')
+            self.assertFalse([obj for obj in db.session.identity_map.values() if isinstance(obj, Question)])
+
+    def test_cursor_without_id_field(self):
+        add_question(self.user.id, 'second')
+        with self.client:
+            response, data = self.get('/questions?fields=difficulty&limit=1')
+            self.assertEqual(data['data']['questions'], [{'difficulty': 'Easy'}])
+            response, data = self.get('/questions?fields=difficulty&limit=1&cursor=' + data['data']['next_cursor'])
+            self.assertEqual(data['data'], {'questions': [{'difficulty': 'Easy'}], 'next_cursor': None})
+
+    def test_single_question_fields(self):
+        with self.client:
+            response, data = self.get(f'/questions/{self.question.id}/user/{self.user.id}?fields=id,test_code')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data'], {'id': self.question.id, 'test_code': 'test'})
+
+    def test_default_fields_unchanged(self):
+        with self.client:
+            response, data = self.get('/questions/user')
+            self.assertEqual(
+                set(data['data']['questions'][0]),
+                {'id', 'author_id', 'body', 'test_code', 'test_solution', 'difficulty'}
+            )
+
+    def test_unknown_field(self):
+        with self.client:
+            for url in ('/questions?fields=password', f'/questions/{self.question.id}/user/{self.user.id}?fields=nope'):
+                response, data = self.get(url)
+                self.assertEqual(response.status_code, 400)
+
+
+class TestQuestionSearch(BaseTestCase):
+    """ Full text search over question bodies """
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.best = add_question(self.user.id, 'Python decorators wrap a python function in another python function', difficulty='Hard')
+        self.other = add_question(self.user.id, 'Write a list comprehension in python', difficulty='Easy')
+        add_question(self.user.id, 'Reverse a linked list in java', difficulty='Easy')
+        self.token = self.user.encode_jwt(self.user.id).decode()
+
+    def get(self, url):
+        response = self.client.get(url, headers={'Authorization': f'Bearer {self.token}'})
+        return response, json.loads(response.data.decode())
+
+    def test_ranked_results(self):
+        with self.client:
+            response, data = self.get('/questions/search?q=python&count=true')
+            self.assertEqual(response.status_code, 200)
+            ids = [question['id'] for question in data['data']['questions']]
+            self.assertEqual(ids, [self.best.id, self.other.id])
+            self.assertEqual(data['data']['num_question'], 2)
+            self.assertGreater(data['data']['questions'][0]['rank'], data['data']['questions'][1]['rank'])
+
+    def test_stemming_and_difficulty_filter(self):
+        with self.client:
+            response, data = self.get('/questions/search?q=lists&difficulty=easy')
+            self.assertEqual(len(data['data']['questions']), 2)
+            response, data = self.get('/questions/search?q=function&difficulty=easy')
+            self.assertEqual(data['data']['questions'], [])
+
+    def test_walk_pages(self):
+        """ Equal ranks are broken by id so paging never repeats or skips a match """
+        for _ in range(4):
+            add_question(self.user.id, 'python python python')
+        with self.client:
+            ids, url = [], '/questions/search?q=python&limit=2'
+            while url:
+                response, data = self.get(url)
+                self.assertEqual(response.status_code, 200)
+                ids += [question['id'] for question in data['data']['questions']]
+                cursor = data['data']['next_cursor']
+                url = f'/questions/search?q=python&limit=2&cursor={cursor}' if cursor else None
+            self.assertEqual(len(ids), 6)
+            self.assertEqual(len(set(ids)), 6)
+
+    def test_vector_follows_updates(self):
+        """ The search vector is recomputed when a body changes """
+        self.other.body = 'Write a generator in rust'
+        db.session.commit()
+        with self.client:
+            response, data = self.get('/questions/search?q=rust')
+            self.assertEqual([question['id'] for question in data['data']['questions']], [self.other.id])
+            response, data = self.get('/questions/search?q=comprehension')
+            self.assertEqual(data['data']['questions'], [])
+
+    def test_invalid_search(self):
+        with self.client:
+            for url in ('/questions/search', '/questions/search?q=%20', '/questions/search?q=python&cursor=garbage'):
+                response, data = self.get(url)
+                self.assertEqual(response.status_code, 400)
+
+
+class TestRandomQuestion(BaseTestCase):
+    """ Practice mode picker, GET /questions/random """
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.other = add_user('other', 'other@testing.io', 'testpass')
+        self.hard = [add_question(self.other.id, f'hard {i}', difficulty='Hard').id for i in range(3)]
+        add_question(self.user.id, 'my hard one', difficulty='Hard')
+        add_question(self.other.id, 'easy one', difficulty='Easy')
+        self.token = self.user.encode_jwt(self.user.id).decode()
+
+    def get(self, url):
+        response = self.client.get(url, headers={'Authorization': f'Bearer {self.token}'})
+        return response, json.loads(response.data.decode())
+
+    def test_filters(self):
+        """ Every pick honours ?difficulty= and ?exclude_author= and all matches are reachable """
+        seen = set()
+        with self.client:
+            for _ in range(60):
+                response, data = self.get(f'/questions/random?difficulty=hard&exclude_author={self.user.id}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(data['data']['difficulty'], 'Hard')
+                self.assertEqual(data['data']['author_id'], self.other.id)
+                seen.add(data['data']['id'])
+        self.assertEqual(seen, set(self.hard))
+
+    def test_no_filters(self):
+        with self.client:
+            response, data = self.get('/questions/random?fields=id,body')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(data['data']), {'id', 'body'})
+            self.assertEqual(response.headers['Cache-Control'], 'no-store')
+
+    def test_new_question_is_picked_up(self):
+        with self.client:
+            response, data = self.get('/questions/random?difficulty=moderate')
+            self.assertEqual(response.status_code, 404)
+            question = add_question(self.other.id, 'new', difficulty='Moderate')
+            response, data = self.get('/questions/random?difficulty=moderate')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data']['id'], question.id)
+
+    def test_stale_ids_are_dropped(self):
+        """ A deleted or re-graded question is never returned once the catalog has it """
+        with self.client:
+            response, data = self.get('/questions/random?difficulty=easy')
+            self.assertEqual(response.status_code, 200)
+            Question.query.filter(Question.difficulty == 'Easy').update({'difficulty': 'Hard'}, synchronize_session=False)
+            db.session.commit()
+            response, data = self.get('/questions/random?difficulty=easy')
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(question_catalog.count(1), 0) # moved to the hard ids
+
+    def test_regraded_question_joins_its_new_pool(self):
+        """ Edits made elsewhere move the id on the next pick, without a full reload """
+        with self.client:
+            response, data = self.get('/questions/random?difficulty=moderate')
+            self.assertEqual(response.status_code, 404)
+            db.session.execute(text("UPDATE questions SET difficulty = 2 WHERE id = :id"), {'id': self.hard[0]})
+            db.session.commit()
+            response, data = self.get('/questions/random?difficulty=moderate')
+            self.assertEqual(data['data']['id'], self.hard[0])
+            for _ in range(20):
+                response, data = self.get(f'/questions/random?difficulty=hard&exclude_author={self.user.id}')
+                self.assertIn(data['data']['id'], self.hard[1:])
+        stats = question_catalog.stats()
+        self.assertEqual(stats['full_loads'], 1)
+        self.assertEqual(stats['size'], 5)
+
+    def test_full_reload_in_background(self):
+        """ Past the ttl, or after a truncate, the catalog is rebuilt by a background thread """
+        ttl = question_catalog.ttl
+        try:
+            with self.client:
+                self.get('/questions/random')
+                question_catalog.ttl = 0
+                response, data = self.get('/questions/random')
+                self.assertEqual(response.status_code, 200)
+                question_catalog.wait()
+                self.assertEqual(question_catalog.stats()['full_loads'], 2)
+                question_catalog.ttl = ttl
+                db.session.execute(text('TRUNCATE questions'))
+                db.session.commit()
+                self.get('/questions/random')
+                question_catalog.wait()
+                response, data = self.get('/questions/random')
+                self.assertEqual(response.status_code, 404)
+        finally:
+            question_catalog.ttl = ttl
+            question_catalog.wait()
+        stats = question_catalog.stats()
+        self.assertEqual((stats['full_loads'], stats['size']), (3, 0))
+
+    def test_invalid_parameters(self):
+        with self.client:
+            for url in ('/questions/random?difficulty=impossible', '/questions/random?exclude_author=me'):
+                response, data = self.get(url)
+                self.assertEqual(response.status_code, 400)
+
+
+class TestQuestionMutations(BaseTestCase):
+    """ PUT/PATCH/DELETE /questions/<id>/user/<id> only touch whitelisted columns """
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.question = add_question(self.user.id, difficulty='Easy')
+        self.url = f'/questions/{self.question.id}/user/{self.user.id}'
+        self.token = self.user.encode_jwt(self.user.id).decode()
+
+    def send(self, method, url, payload=None):
+        response = getattr(self.client, method)(
+            url,
+            data=json.dumps(payload),
+            content_type='application/json',
+            headers={'Authorization': f'Bearer {self.token}'}
+        )
+        return response, json.loads(response.data.decode()) if response.data else None
+
+    def test_patch_returns_updated_question(self):
+        with self.client:
+            response, data = self.send('patch', self.url, {'difficulty': 'hard', 'test_code': 'assert True'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data']['difficulty'], 'Hard')
+            self.assertEqual(data['data']['test_code'], 'assert True')
+            self.assertEqual(data['data']['body'], self.question.body)
+
+    def test_rejects_invalid_payload(self):
+        with self.client:
+            for payload in ({'author_id': 2}, {'difficulty': 'impossible'}, {'body': None}, None):
+                response, data = self.send('patch', self.url, payload)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Question.query.get(self.question.id).difficulty, 'Easy')
+
+    def test_wrong_author(self):
+        other = add_user('other', 'other@testing.io', 'testpass')
+        self.token = other.encode_jwt(other.id).decode()
+        with self.client:
+            response, data = self.send('patch', f'/questions/{self.question.id}/user/{other.id}', {'body': 'stolen'})
+            self.assertEqual(response.status_code, 404)
+            response, data = self.send('delete', f'/questions/{self.question.id}/user/{other.id}')
+            self.assertEqual(response.status_code, 404)
+        self.assertIsNotNone(Question.query.get(self.question.id))
+
+    def test_delete(self):
+        with self.client:
+            response, data = self.send('delete', self.url)
+            self.assertEqual(response.status_code, 204)
+            response, data = self.send('delete', self.url)
+            self.assertEqual(response.status_code, 404)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,163 @@
+import json
+import math
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+from sqlalchemy import create_engine, event
+
+from project import db, replica_router
+from project.api.replica import REPLICA_BIND
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_admin_user, add_question
+
+
+class TestReplicaRouting(BaseTestCase):
+    """ The replica bind is a second engine on the test database, told apart by its statements """
+    def setUp(self):
+        super().setUp()
+        self.binds = self.app.config['SQLALCHEMY_BINDS']
+        self.app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: self.app.config['SQLALCHEMY_DATABASE_URI'] + '?application_name=replica'
+        }
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.other = add_admin_user('other', 'other@testing.io', 'testpass')
+        add_question(author_id=self.user.id)
+        self.user_id = self.user.id
+
+    def tearDown(self):
+        super().tearDown()
+        self.app.config['SQLALCHEMY_BINDS'] = self.binds
+
+    def headers(self, user):
+        return {'Authorization': f'Bearer {user.encode_jwt(user.id).decode()}'}
+
+    @contextmanager
+    def statements(self):
+        """ Statements run on (primary, replica) within the block """
+        counted = {db.engine: [], db.get_engine(self.app, bind=REPLICA_BIND): []}
+        def listener(statements):
+            def count(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+            return count
+        listeners = [(engine, listener(statements)) for engine, statements in counted.items()]
+        for engine, count in listeners:
+            event.listen(engine, 'before_cursor_execute', count)
+        try:
+            yield tuple(counted.values())
+        finally:
+            for engine, count in listeners:
+                event.remove(engine, 'before_cursor_execute', count)
+
+    def test_get_reads_from_replica(self):
+        headers = self.headers(self.user)
+        reads = replica_router.replica_reads
+        with self.statements() as (primary, replica):
+            for url in ('/users', '/questions', f'/users/{self.user_id}'):
+                response = self.client.get(url, headers=headers)
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, [])
+        self.assertGreaterEqual(len(replica), 5)
+        self.assertEqual(replica_router.replica_reads - reads, 3)
+
+    def test_active_users_read_from_primary(self):
+        """ GET /users/active pairs the users sequence with the rows, both from the primary """
+        with self.statements() as (primary, replica):
+            response = self.client.get('/users/active', headers={'Authorization': 'Bearer test-service-token'})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, [])
+        self.assertEqual(len(primary), 2)
+        self.assertIn('pg_sequence_last_value', primary[0])
+
+    def test_writes_go_to_primary(self):
+        headers = self.headers(self.user)
+        with self.statements() as (primary, replica):
+            response = self.client.post(
+                '/questions',
+                data=json.dumps({'body': 'b', 'test_code': 'c', 'test_solution': 's', 'difficulty': 'Easy'}),
+                content_type='application/json',
+                headers=headers
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(replica, [])
+        self.assertTrue(any(statement.startswith('INSERT') for statement in primary))
+
+    def test_writer_sticks_to_primary(self):
+        headers = self.headers(self.user)
+        response = self.client.patch(
+            f'/users/{self.user_id}',
+            data=json.dumps({'username': 'renamed'}),
+            content_type='application/json',
+            headers=headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(replica_router.cookie, response.headers['Set-Cookie'])
+
+        client = self.app.test_client() # no cookie, the worker remembers the user
+        with self.statements() as (primary, replica):
+            data = json.loads(client.get(f'/users/{self.user_id}', headers=headers).data.decode())
+        self.assertEqual(data['data']['username'], 'renamed')
+        self.assertEqual(replica, [])
+
+        other = self.headers(self.other)
+        with self.statements() as (primary, replica):
+            self.client.get('/users', headers=other) # other user, same cookie jar
+        self.assertEqual(replica, [])
+
+        with self.statements() as (primary, replica):
+            client.get('/users', headers=other)
+        self.assertEqual(primary, [])
+
+    def test_failed_write_is_not_sticky(self):
+        response = self.client.patch(
+            f'/users/{self.user_id}',
+            data=json.dumps({'nope': 1}),
+            content_type='application/json',
+            headers=self.headers(self.user)
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertEqual(replica_router.stats()['sticky_users'], 0)
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        replica_router.clear() # drop the lag measured during setUp
+        headers = self.headers(self.user)
+        with mock.patch.object(replica_router, 'measure_lag', return_value=replica_router.max_lag + 1):
+            with self.statements() as (primary, replica):
+                self.client.get('/users', headers=headers)
+        self.assertEqual(replica, [])
+        self.assertGreater(len(primary), 0)
+
+    def test_lag_is_cached(self):
+        replica_router.clear()
+        with mock.patch.object(replica_router, 'measure_lag', return_value=0.0) as measure:
+            for _ in range(3):
+                self.client.get('/users', headers=self.headers(self.user))
+        self.assertEqual(measure.call_count, 1)
+
+    def test_measure_lag(self):
+        self.assertEqual(replica_router.measure_lag(db.get_engine(self.app, bind=REPLICA_BIND)), 0.0)
+        unreachable = create_engine('postgresql://postgres@localhost:1/none')
+        with self.assertLogs('project.api.replica', 'ERROR'):
+            self.assertTrue(math.isinf(replica_router.measure_lag(unreachable)))
+
+    def test_metrics(self):
+        with self.client:
+            response = self.client.get('/metrics', headers=self.headers(self.other))
+            data = json.loads(response.data.decode())
+        replica = data['data']['replica']
+        self.assertEqual(replica['lag_seconds'], 0.0)
+        self.assertEqual(replica['pool']['class'], 'TimedQueuePool')
+
+
+class TestWithoutReplica(BaseTestCase):
+    def test_no_routing(self):
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        self.assertFalse(replica_router.configured(self.app))
+        response = self.client.get('/users', headers={'Authorization': f'Bearer {user.encode_jwt(user.id).decode()}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica_router.stats()['replica_reads'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
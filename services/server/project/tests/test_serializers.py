@@ -0,0 +1,43 @@
+import json
+import unittest
+
+from flask import current_app
+
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_question
+
+
+class TestJSONBackend(BaseTestCase):
+    """ Responses are identical JSON whichever encoder is configured """
+    def fetch(self, backend):
+        current_app.config['JSON_BACKEND'] = backend
+        with self.client:
+            restful = self.client.get('/questions/user', headers=self.headers)
+            plain = self.client.get('/login/me', headers=self.headers)
+        return restful, plain
+
+    def setUp(self):
+        super().setUp()
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        add_question(user.id, 'ünïcode "quoted" body')
+        self.headers = {'Authorization': f'Bearer {user.encode_jwt(user.id).decode()}'}
+
+    def test_backends_match(self):
+        fast = self.fetch('orjson')
+        stdlib = self.fetch('json')
+        for fast_response, stdlib_response in zip(fast, stdlib):
+            self.assertEqual(fast_response.status_code, 200)
+            self.assertEqual(fast_response.content_type, 'application/json')
+            self.assertEqual(stdlib_response.content_type, 'application/json')
+            self.assertEqual(json.loads(fast_response.data.decode()), json.loads(stdlib_response.data.decode()))
+
+    def test_headers_kept(self):
+        """ Extra headers returned by a resource survive the fast encoder """
+        current_app.config['JSON_BACKEND'] = 'orjson'
+        with self.client:
+            response = self.client.get('/users', headers=self.headers)
+            self.assertTrue(response.headers.get('ETag'))
+
+
+if __name__ == '__main__':
+    unittest.main()
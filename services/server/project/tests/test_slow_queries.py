@@ -0,0 +1,135 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from project import create_app, db, slow_query_log
+from project.api.slow_queries import redact
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_admin_user
+
+log_dir = tempfile.TemporaryDirectory()
+
+slow_app = create_app()
+slow_app.config.from_object('project.config.TestConfig')
+slow_app.config.update(
+    SLOW_QUERY_LOG=True,
+    SLOW_QUERY_MS=50,
+    SLOW_QUERY_FILE=os.path.join(log_dir.name, 'slow_queries.log')
+)
+
+@slow_app.route('/slow/<float:seconds>')
+def slow(seconds):
+    db.session.execute(text('SELECT pg_sleep(:seconds), :email'), {'seconds': seconds, 'email': 'secret@testing.io'})
+    return 'ok'
+
+def setUpModule():
+    # the hook is global, installed only while this module runs
+    slow_query_log.init_app(slow_app)
+
+def tearDownModule():
+    event.remove(Engine, 'before_cursor_execute', slow_query_log.before_execute)
+    event.remove(Engine, 'after_cursor_execute', slow_query_log.after_execute)
+    for handler in list(slow_query_log.file_logger.handlers):
+        handler.close()
+        slow_query_log.file_logger.removeHandler(handler)
+    slow_query_log.file_logger = None
+    log_dir.cleanup()
+
+
+class TestSlowQueryLog(BaseTestCase):
+    def create_app(self):
+        return slow_app
+
+    def setUp(self):
+        super().setUp()
+        slow_query_log.clear()
+        open(slow_query_log.path, 'w').close()
+
+    def entries(self):
+        slow_query_log.flush()
+        for handler in slow_query_log.file_logger.handlers:
+            handler.flush()
+        with open(slow_query_log.path) as f:
+            return [json.loads(line) for line in f]
+
+    def headers(self, user):
+        return {'Authorization': f'Bearer {user.encode_jwt(user.id).decode()}'}
+
+    def test_slow_statement_logged_with_plan(self):
+        self.client.get('/slow/0.06')
+        self.client.get('/slow/0.001') # under the threshold
+        entries = self.entries()
+        self.assertEqual(len(entries), 1)
+        entry = entries[0]
+        self.assertEqual(entry['endpoint'], 'slow')
+        self.assertEqual(entry['path'], '/slow/0.06')
+        self.assertGreaterEqual(entry['ms'], 50)
+        self.assertIn('pg_sleep', entry['statement'])
+        self.assertIn('Result', entry['plan'])
+        self.assertEqual(entry['parameters'], {'seconds': 0.06, 'email': '<redacted 17>'})
+        self.assertNotIn('secret', json.dumps(entry))
+
+    def test_plan_captured_once(self):
+        for _ in range(3):
+            self.client.get('/slow/0.055')
+        entries = self.entries()
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(sum(entry['plan'] is not None for entry in entries), 1)
+
+    def test_file_per_process(self):
+        """ Each worker writes and rotates its own file, a forked one opens a new file on its first write """
+        self.client.get('/slow/0.055')
+        self.entries()
+        self.assertEqual(os.listdir(log_dir.name), [f'slow_queries.{os.getpid()}.log'])
+        slow_query_log._file_pid = None # what a forked worker sees
+        slow_query_log.write({'statement': 'again'})
+        self.assertEqual(len(slow_query_log.file_logger.handlers), 1)
+        self.assertEqual(self.entries()[-1], {'statement': 'again'})
+
+    def test_top_offenders(self):
+        admin = add_admin_user('admin', 'admin@testing.io', 'testpass')
+        headers = self.headers(admin)
+        self.client.get('/slow/0.06')
+        self.client.get('/slow/0.06')
+        db.session.execute(text('SELECT pg_sleep(0.07)'))
+        self.entries()
+        response = self.client.get('/metrics/slow-queries?limit=5', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode())['data']
+        self.assertTrue(data['enabled'])
+        self.assertEqual(data['threshold_ms'], 50)
+        top = data['statements']
+        self.assertEqual(len(top), 2)
+        self.assertEqual(top[0]['count'], 2)
+        self.assertEqual(top[0]['endpoints'], {'slow': 2})
+        self.assertGreater(top[0]['total_ms'], top[1]['total_ms'])
+        self.assertAlmostEqual(top[0]['mean_ms'], top[0]['total_ms'] / 2, places=1)
+        self.assertIn('Result', top[0]['plan'])
+        self.assertEqual(top[1]['count'], 1)
+
+    def test_top_offenders_not_admin(self):
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        response = self.client.get('/metrics/slow-queries', headers=self.headers(user))
+        self.assertEqual(response.status_code, 403)
+
+    def test_top_offenders_invalid_limit(self):
+        admin = add_admin_user('admin', 'admin@testing.io', 'testpass')
+        for limit in ('-1', '0', 'all'):
+            response = self.client.get(f'/metrics/slow-queries?limit={limit}', headers=self.headers(admin))
+            self.assertEqual(response.status_code, 400, limit)
+
+    def test_redact(self):
+        self.assertEqual(
+            redact({'id': 3, 'active': True, 'rank': Decimal('0.5'), 'names': ('users',), 'at': datetime.date(2020, 1, 2), 'hash': b'xx'}),
+            {'id': 3, 'active': True, 'rank': 0.5, 'names': ['<redacted 5>'], 'at': '2020-01-02', 'hash': '<redacted 2>'}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import random
+import unittest
+from collections import Counter
+from multiprocessing import Pool
+
+from project import db, synthetic
+from project.api.models import User, Question
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user
+
+
+class TestSyntheticData(unittest.TestCase):
+    """ Generators behind manage.py add_test_data """
+    def test_same_seed_same_rows(self):
+        tasks = [(start, count, 7, 1, 50, 1.1, [5, 3, 2]) for start, count in synthetic.batches(30, 10)]
+        inline = list(synthetic.generate(None, synthetic.question_rows, tasks, 1))
+        with Pool(2) as pool:
+            parallel = list(synthetic.generate(pool, synthetic.question_rows, tasks, 2))
+        self.assertEqual(inline, parallel)
+        other_seed = synthetic.question_rows(0, 10, 8, 1, 50, 1.1, [5, 3, 2])
+        self.assertNotEqual(inline[0], other_seed)
+
+    def test_batches(self):
+        self.assertEqual(synthetic.batches(25, 10), [(0, 10), (10, 10), (20, 5)])
+        self.assertEqual(synthetic.batches(0, 10), [])
+
+    def test_parse_mix(self):
+        self.assertEqual(synthetic.parse_mix('hard=1,Easy=3'), [3.0, 0.0, 1.0])
+        for value in ('Impossible=1', 'Easy=0', 'Easy=-1,Hard=2', 'Easy=x'):
+            with self.assertRaises(ValueError):
+                synthetic.parse_mix(value)
+
+    def test_zipf_authorship(self):
+        """ A few authors write most questions, every rank stays in range """
+        rng = random.Random(0)
+        ranks = Counter(synthetic.zipf_rank(rng, 1000, 1.1) for _ in range(20000))
+        self.assertTrue(all(1 <= rank <= 1000 for rank in ranks))
+        self.assertEqual(ranks.most_common(1)[0][0], 1)
+        self.assertGreater(sum(count for rank, count in ranks.items() if rank <= 10), 20000 * 0.3)
+
+
+class TestSyntheticLoad(BaseTestCase):
+    def test_load(self):
+        add_user('existing', 'existing@testing.io', 'testpass')
+        connection = db.engine.raw_connection()
+        try:
+            first_id, last_id = synthetic.load(
+                connection, 30, 200, 'hash', seed=1, batch_size=7, mix=[1, 0, 0]
+            )
+        finally:
+            connection.close()
+        self.assertEqual(last_id - first_id, 29)
+        self.assertEqual(User.query.count(), 31)
+        self.assertEqual(Question.query.count(), 200)
+        authors = {author_id for author_id, in db.session.query(Question.author_id)}
+        self.assertTrue(authors <= set(range(first_id, last_id + 1)))
+        self.assertEqual({q.difficulty for q in Question.query}, {'Easy'})
+        # the id sequence was moved past the copied ids
+        self.assertEqual(add_user('after', 'after@testing.io', 'testpass').id, last_id + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
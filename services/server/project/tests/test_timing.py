@@ -0,0 +1,115 @@
+import json
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from project import create_app, request_timing
+from project.api import timing
+from project.api.models import User
+from project.api.timing import Timings
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user, add_question
+
+timing_app = create_app()
+timing_app.config.from_object('project.config.TestConfig')
+timing_app.config['REQUEST_TIMING'] = True
+
+@timing_app.route('/timing/n-plus-one')
+def n_plus_one():
+    # one lookup per user, the pattern the repeat warning is for
+    for user_id in [user.id for user in User.query.all()]:
+        User.query.filter_by(id=user_id).first()
+    return 'ok'
+
+def setUpModule():
+    # the statement hooks are global, installed only while this module runs
+    request_timing.init_app(timing_app)
+
+def tearDownModule():
+    event.remove(Engine, 'before_cursor_execute', timing._before_execute)
+    event.remove(Engine, 'after_cursor_execute', timing._after_execute)
+    timing._enabled = False
+
+
+class TestRequestTiming(BaseTestCase):
+    def create_app(self):
+        return timing_app
+
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        add_question(author_id=self.user.id)
+        self.headers = {'Authorization': f'Bearer {self.user.encode_jwt(self.user.id).decode()}'}
+
+    def metrics(self, response):
+        """ Server-Timing header as {name: {'dur': ..., 'desc': ...}} """
+        metrics = {}
+        for metric in response.headers['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+
+    def test_server_timing_header(self):
+        response = self.client.get('/users', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        metrics = self.metrics(response)
+        self.assertEqual(metrics['db']['desc'], '"3 queries"') # auth, etag, page
+        for name in ('db', 'auth', 'jwt', 'json', 'app'):
+            self.assertGreaterEqual(float(metrics[name]['dur']), 0)
+        self.assertLessEqual(float(metrics['auth']['dur']), float(metrics['app']['dur']))
+
+    def test_bcrypt_span(self):
+        response = self.client.post(
+            '/login/login',
+            data=json.dumps({'email': 'test@testing.io', 'password': 'testpass'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('bcrypt', self.metrics(response))
+
+    def test_log_line(self):
+        with self.assertLogs('project.api.timing', 'INFO') as logs:
+            self.client.get('/questions', headers=self.headers)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['method'], 'GET')
+        self.assertEqual(line['path'], '/questions')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['queries'], 4) # auth, etag, page keys, uncached questions
+        self.assertEqual(line['spans']['auth']['count'], 1)
+        self.assertNotIn('repeated', line)
+
+    def test_repeated_statement_warning(self):
+        for i in range(request_timing.repeat_threshold):
+            add_user(f'user{i}', f'user{i}@testing.io', 'testpass')
+        with self.assertLogs('project.api.timing', 'WARNING') as logs:
+            self.client.get('/timing/n-plus-one')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['queries'], request_timing.repeat_threshold + 2)
+        self.assertEqual(line['repeated'][0]['count'], request_timing.repeat_threshold + 1)
+        self.assertTrue(line['repeated'][0]['statement'].startswith('SELECT users.id'))
+
+    def test_timings(self):
+        timings = Timings()
+        timings.add('jwt', 0.5)
+        timings.add('jwt', 0.25)
+        for _ in range(3):
+            timings.add_statement('SELECT 1', 0.1)
+        timings.add_statement('SELECT 2', 0.1)
+        self.assertEqual(timings.spans['jwt'], (2, 0.75))
+        self.assertAlmostEqual(timings.db_seconds, 0.4)
+        self.assertEqual(timings.repeated(3), [('SELECT 1', 3)])
+        self.assertEqual(timings.repeated(4), [])
+
+
+class TestTimingDisabled(BaseTestCase):
+    def test_no_header(self):
+        self.assertFalse(self.app.config['REQUEST_TIMING'])
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        response = self.client.get('/users', headers={'Authorization': f'Bearer {user.encode_jwt(user.id).decode()}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
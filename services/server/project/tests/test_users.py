@@ -4,7 +4,7 @@ import unittest
 from project import db
 from project.tests.base import BaseTestCase
 from project.api.models import User
-from project.tests.utils import add_user, add_admin_user
+from project.tests.utils import add_user, add_admin_user, add_question
 
 
 # TODO - Refactor tests to reduce redundancy
@@ -522,7 +522,181 @@ class TestUserService(BaseTestCase):
             response = self.client.put('/users')
             self.assertEqual(response.status_code, 405)
 
+    def test_active_users(self):
+        """ Ensure GET /users/active leaves deactivated and deleted users out of its id runs """
+        users = [add_user(f'user{i}', f'user{i}@testing.io', 'testpass') for i in range(6)]
+        users[2].active = False
+        db.session.delete(users[4])
+        db.session.commit()
+        ids = [user.id for user in users]
+        with self.client:
+            response = self.client.get('/users/active', headers={'Authorization': 'Bearer test-service-token'})
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data']['ranges'], [[ids[0], ids[1]], [ids[3], ids[3]], [ids[5], ids[5]]])
+            self.assertEqual(data['data']['last_id'], ids[5])
+
+    def test_active_users_needs_service_token(self):
+        """ Ensure GET /users/active is only answered with the shared service token """
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        token = user.encode_jwt(user.id).decode()
+        with self.client:
+            for headers in ({}, {'Authorization': f'Bearer {token}'}, {'Authorization': 'Bearer wrong'}):
+                response = self.client.get('/users/active', headers=headers)
+                self.assertEqual(response.status_code, 403)
+            self.app.config['SERVICE_TOKEN'] = None
+            try:
+                response = self.client.get('/users/active', headers={'Authorization': 'Bearer None'})
+                self.assertEqual(response.status_code, 403)
+            finally:
+                self.app.config['SERVICE_TOKEN'] = 'test-service-token'
+
+    def test_user_fields(self):
+        """ Ensure ?fields= limits GET /users/<id> to the requested keys """
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        with self.client:
+            response = self.client.get(f'/users/{user.id}?fields=id,username')
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data'], {'id': user.id, 'username': 'testuser'})
+            response = self.client.get(f'/users/{user.id}?fields=password')
+            self.assertEqual(response.status_code, 400)
+
+    def test_users_list_fields(self):
+        """ Ensure ?fields= on GET /users never selects the other columns """
+        user = add_user('testuser', 'test@testing.io', 'testpass')
+        token = user.encode_jwt(user.id).decode()
+        with self.client:
+            with self.assertNumQueries(3) as statements:
+                response = self.client.get('/users?fields=id,email', headers={'Authorization': f'Bearer {token}'})
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['data']['users'], [{'id': user.id, 'email': 'test@testing.io'}])
+            self.assertNotIn('username', statements[-1])
+
+
+class TestUserDirectory(BaseTestCase):
+    """ ?q= search, ?active= / ?admin= filters and keyset pages on GET /users """
+    def setUp(self):
+        super().setUp()
+        self.admin = add_admin_user('root', 'root@admins.io', 'testpass')
+        self.alice = add_user('alice', 'alice@testing.io', 'testpass')
+        self.bob = add_user('bob_smith', 'bob@example.com', 'testpass')
+        self.carol = add_user('carol', 'carol@example.com', 'testpass')
+        self.carol.active = False
+        db.session.commit()
+        self.token = self.admin.encode_jwt(self.admin.id).decode()
+
+    def get(self, url):
+        response = self.client.get(url, headers={'Authorization': f'Bearer {self.token}'})
+        return response, json.loads(response.data.decode())
+
+    def usernames(self, url):
+        response, data = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [user['username'] for user in data['data']['users']]
+
+    def test_search_username_and_email(self):
+        with self.client:
+            self.assertEqual(self.usernames('/users?q=ALI'), ['alice'])
+            self.assertEqual(self.usernames('/users?q=example.com'), ['bob_smith', 'carol'])
+            self.assertEqual(self.usernames('/users?q=nobody'), [])
+
+    def test_search_wildcards_are_literal(self):
+        """ % and _ in ?q= match themselves, not any character """
+        with self.client:
+            self.assertEqual(self.usernames('/users?q=b_s'), ['bob_smith'])
+            self.assertEqual(self.usernames('/users?q=%25'), [])
+
+    def test_filters(self):
+        with self.client:
+            self.assertEqual(self.usernames('/users?active=false'), ['carol'])
+            self.assertEqual(self.usernames('/users?admin=true'), ['root'])
+            self.assertEqual(self.usernames('/users?active=true&admin=false'), ['alice', 'bob_smith'])
+            self.assertEqual(self.usernames('/users?q=example&active=true'), ['bob_smith'])
+
+    def test_walk_pages(self):
+        with self.client:
+            ids, url = [], '/users?limit=1&q=o'
+            while url:
+                response, data = self.get(url)
+                ids += [user['id'] for user in data['data']['users']]
+                cursor = data['data']['next_cursor']
+                url = f'/users?limit=1&q=o&cursor={cursor}' if cursor else None
+            self.assertEqual(ids, [self.admin.id, self.alice.id, self.bob.id, self.carol.id])
+
+    def test_count(self):
+        with self.client:
+            response, data = self.get('/users?q=example&count=true')
+            self.assertEqual(data['data']['num_users'], 2)
+            response, data = self.get('/users')
+            self.assertNotIn('num_users', data['data'])
+
+    def test_invalid_parameters(self):
+        with self.client:
+            for url in ('/users?active=maybe', '/users?limit=0', '/users?cursor=garbage'):
+                response, data = self.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(data['message'], 'Invalid query parameters')
+
+
+class TestUserMutations(BaseTestCase):
+    """ PUT/PATCH/DELETE /users/<id> only touch whitelisted columns """
+    def setUp(self):
+        super().setUp()
+        self.user = add_user('testuser', 'test@testing.io', 'testpass')
+        add_user('other', 'other@testing.io', 'testpass')
+        self.token = self.user.encode_jwt(self.user.id).decode()
+
+    def send(self, method, url, payload=None):
+        response = getattr(self.client, method)(
+            url,
+            data=json.dumps(payload),
+            content_type='application/json',
+            headers={'Authorization': f'Bearer {self.token}'}
+        )
+        return response, json.loads(response.data.decode()) if response.data else None
+
+    def test_patch_returns_updated_user(self):
+        with self.client:
+            response, data = self.send('patch', f'/users/{self.user.id}', {'email': 'new@testing.io'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['data'], {
+                'id': self.user.id, 'username': 'testuser', 'email': 'new@testing.io', 'active': True, 'admin': False
+            })
+
+    def test_rejects_other_columns(self):
+        with self.client:
+            for payload in ({'password': 'plaintext'}, {'id': 99}, {}):
+                response, data = self.send('patch', f'/users/{self.user.id}', payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(data['message'], 'Invalid payload')
 
+    def test_only_admins_grant_admin(self):
+        with self.client:
+            response, data = self.send('put', f'/users/{self.user.id}', {'admin': True})
+            self.assertEqual(response.status_code, 403)
+        self.assertFalse(User.query.get(self.user.id).admin)
+
+    def test_duplicate_email(self):
+        with self.client:
+            response, data = self.send('patch', f'/users/{self.user.id}', {'email': 'other@testing.io'})
+            self.assertEqual(response.status_code, 400)
+
+    def test_missing_user(self):
+        self.user.admin = True
+        db.session.commit()
+        with self.client:
+            response, data = self.send('patch', '/users/999', {'username': 'ghost'})
+            self.assertEqual(response.status_code, 404)
+            response, data = self.send('delete', '/users/999')
+            self.assertEqual(response.status_code, 404)
+
+    def test_delete_user_with_questions(self):
+        add_question(self.user.id)
+        with self.client:
+            response, data = self.send('delete', f'/users/{self.user.id}')
+            self.assertEqual(response.status_code, 409)
+        self.assertIsNotNone(User.query.get(self.user.id))
 
 
 if __name__ == '__main__':
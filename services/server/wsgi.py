@@ -0,0 +1,6 @@
+# services/server/wsgi.py
+# Production entry point for gunicorn. Kept separate from manage.py so workers
+# never import coverage, the flask cli or the debug toolbar.
+from project import create_app
+
+app = create_app()